@@ -0,0 +1,139 @@
+"""
+Micro-benchmark for classify_tx() over a synthetic corpus of receipt logs.
+
+    python benchmarks/bench_classification.py [--logs 100000] [--baseline REF]
+
+Most logs are token transfers of unrelated contracts, a small share hits the
+known claim/reward contracts, like in a typical account history. With
+--baseline, the classification module of the given git ref is timed on the
+same corpus for comparison.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import types
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, NamedTuple
+
+from buchfink import classification
+from buchfink.db import BuchfinkDB
+from buchfink.models import Account
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+SCENARIO_DIR = REPO_DIR / 'tests' / 'scenarios' / 'ethereum_gas'
+ACCOUNT_ADDRESS = '0xD57479B8287666B44978255F1677E412d454d4f0'
+LOGS_PER_RECEIPT = 5
+MATCHING_SHARE = 0.01
+
+
+@dataclass
+class FakeLog:
+    address: str
+    topics: List[bytes]
+    data: bytes
+
+
+@dataclass
+class FakeReceipt:
+    logs: List[FakeLog] = field(default_factory=list)
+
+
+class FakeTransaction(NamedTuple):
+    tx_hash: bytes
+    from_address: str
+    timestamp: int
+
+
+def _word(value: int) -> bytes:
+    return value.to_bytes(32, 'big')
+
+
+def _address_word(address: str) -> bytes:
+    return _word(int(address, 16))
+
+
+def make_corpus(num_logs: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    known = sorted(classification.default_rules())
+    account_word = _address_word(ACCOUNT_ADDRESS)
+    corpus = []
+
+    for i in range(0, num_logs, LOGS_PER_RECEIPT):
+        receipt = FakeReceipt()
+        for _ in range(LOGS_PER_RECEIPT):
+            if rng.random() < MATCHING_SHARE:
+                topic, address = rng.choice(known)
+            else:
+                topic = classification.TRANSFER
+                address = '0x' + rng.getrandbits(160).to_bytes(20, 'big').hex()
+            receipt.logs.append(
+                FakeLog(
+                    address=address,
+                    topics=[bytes.fromhex(topic[2:]), account_word, account_word],
+                    data=b''.join(_word(rng.getrandbits(64)) for _ in range(4)),
+                )
+            )
+        txn = FakeTransaction(
+            tx_hash=i.to_bytes(32, 'big'),
+            from_address=ACCOUNT_ADDRESS,
+            timestamp=1600000000 + i,
+        )
+        corpus.append((txn, receipt))
+
+    return corpus
+
+
+def load_baseline(ref: str) -> types.ModuleType:
+    source = subprocess.check_output(
+        ['git', 'show', f'{ref}:buchfink/classification.py'], cwd=REPO_DIR
+    )
+    module = types.ModuleType('buchfink._baseline_classification')
+    module.__package__ = 'buchfink'
+    exec(compile(source, f'{ref}:buchfink/classification.py', 'exec'), module.__dict__)  # noqa: S102 pylint: disable=exec-used
+    return module
+
+
+def bench(module, account: Account, corpus: list, num_logs: int) -> float:
+    start = time.perf_counter()
+    for txn, receipt in corpus:
+        module.classify_tx(account, txn, receipt)
+    elapsed = time.perf_counter() - start
+    print(
+        '{0:>10}: {1:.3f}s ({2:,.0f} logs/s)'.format(
+            module.__name__.split('.')[-1], elapsed, num_logs / elapsed
+        )
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--logs', type=int, default=100_000)
+    parser.add_argument('--baseline', help='git ref to compare against, e.g. HEAD~1')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The rules resolve assets, so we need an initialized global DB
+        shutil.copytree(SCENARIO_DIR, os.path.join(tmp, 'buchfink'))
+        buchfink_db = BuchfinkDB(os.path.join(tmp, 'buchfink', 'buchfink.yaml'))
+        account = buchfink_db.get_all_accounts()[0]
+        assert account.address == ACCOUNT_ADDRESS
+
+        corpus = make_corpus(args.logs)
+        elapsed = bench(classification, account, corpus, args.logs)
+
+        if args.baseline:
+            baseline_elapsed = bench(load_baseline(args.baseline), account, corpus, args.logs)
+            print('   speedup: {0:.1f}x'.format(baseline_elapsed / elapsed))
+
+        buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
+
+
+if __name__ == '__main__':
+    main()
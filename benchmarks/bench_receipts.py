@@ -0,0 +1,133 @@
+"""
+Compares fetching transaction receipts one by one with the batched path of
+BuchfinkDB.iter_transaction_receipts().
+
+    python benchmarks/bench_receipts.py [--latency 0.01] [--sizes 1000 10000]
+
+Both paths run the real code against the user DB of a scratch copy of the
+ethereum_gas scenario: the cache lookup, rotki's get_or_query_transaction_receipt()
+and the receipt writes. Only the node is faked, every receipt query waits for
+--latency seconds before answering, so the numbers show how well the round
+trips overlap, not real node performance.
+"""
+
+from gevent import monkey  # isort:skip
+
+monkey.patch_all()  # isort:skip
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import shutil  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+from itertools import count  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+from rotkehlchen.chain.evm.types import string_to_evm_address  # noqa: E402
+from rotkehlchen.db.evmtx import DBEvmTx  # noqa: E402
+from rotkehlchen.types import (  # noqa: E402
+    ChainID,
+    EvmTransaction,
+    Timestamp,
+    deserialize_evm_tx_hash,
+)
+from tabulate import tabulate  # noqa: E402
+
+from buchfink.db import BuchfinkDB  # noqa: E402
+
+SCENARIO_DIR = Path(__file__).resolve().parent.parent / 'tests' / 'scenarios' / 'ethereum_gas'
+ADDRESS = string_to_evm_address('0xD57479B8287666B44978255F1677E412d454d4f0')
+
+_tx_counter = count(1)
+
+
+def make_transactions(buchfink_db: BuchfinkDB, size: int):
+    "Stores `size` new transactions without receipts in the user DB"
+    txs = [
+        EvmTransaction(
+            tx_hash=deserialize_evm_tx_hash(next(_tx_counter).to_bytes(32, 'big')),
+            chain_id=ChainID.ETHEREUM,
+            timestamp=Timestamp(1600000000 + i),
+            block_number=10000000 + i,
+            from_address=ADDRESS,
+            to_address=ADDRESS,
+            value=0,
+            gas=21000,
+            gas_price=1,
+            gas_used=21000,
+            input_data=b'',
+            nonce=i,
+        )
+        for i in range(size)
+    ]
+    with buchfink_db.user_write() as write_cursor:
+        DBEvmTx(buchfink_db).add_evm_transactions(
+            write_cursor, evm_transactions=txs, relevant_address=ADDRESS
+        )
+    return txs
+
+
+def fake_node(latency: float):
+    "Stands in for the node's eth_getTransactionReceipt, answering after a delay"
+
+    def get_transaction_receipt(tx_hash, **kwargs):
+        time.sleep(latency)
+        return {
+            'transactionHash': '0x' + bytes(tx_hash).hex(),
+            'contractAddress': None,
+            'status': 1,
+            'type': 2,
+            'logs': [],
+        }
+
+    return get_transaction_receipt
+
+
+def sequential(buchfink_db: BuchfinkDB, txs):
+    return [
+        (txn, buchfink_db.eth_transactions.get_or_query_transaction_receipt(txn.tx_hash))
+        for txn in txs
+    ]
+
+
+def batched(buchfink_db: BuchfinkDB, txs):
+    return list(buchfink_db.iter_transaction_receipts(txs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(SCENARIO_DIR, os.path.join(tmp, 'buchfink'))
+        buchfink_db = BuchfinkDB(os.path.join(tmp, 'buchfink', 'buchfink.yaml'))
+        buchfink_db.ethereum_inquirer.get_transaction_receipt = fake_node(args.latency)
+
+        table = []
+        for size in args.sizes:
+            row = [size]
+            for func in (sequential, batched):
+                # Fresh transactions, so that every receipt goes to the fake node
+                txs = make_transactions(buchfink_db, size)
+                start = time.perf_counter()
+                result = func(buchfink_db, txs)
+                elapsed = time.perf_counter() - start
+                assert [txn for txn, _ in result] == txs
+                assert all(receipt is not None for _, receipt in result)
+                row.extend(['{:.2f}'.format(elapsed), '{:.0f}'.format(size / elapsed)])
+            table.append(row)
+
+        buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
+
+    print(
+        tabulate(
+            table,
+            headers=('Transactions', 'Sequential (s)', 'tx/s', 'Batched (s)', 'tx/s'),
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Measures wall-clock time and peak memory of short-lived buchfink CLI invocations.
+
+    python benchmarks/startup.py [--runs 5] [--baseline REF]
+
+Every subcommand is run in a fresh interpreter against a copy of the
+``ethereum_gas`` test scenario. With ``--baseline`` the same commands are also
+run against a git worktree of REF, so the numbers can be compared side by side.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tabulate import tabulate
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+SCENARIO_DIR = REPO_DIR / 'tests' / 'scenarios' / 'ethereum_gas'
+
+COMMANDS = [
+    ['list'],
+    ['format'],
+    ['events'],
+    ['asset', 'ETH'],
+]
+
+
+def run_once(source_dir: Path, workdir: Path, args: list) -> tuple:
+    env = dict(os.environ, PYTHONPATH=str(source_dir))
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'buchfink.cli', *args],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError('buchfink {} failed'.format(' '.join(args)))
+    # ru_maxrss is in kilobytes on Linux
+    return elapsed, rusage.ru_maxrss / 1024
+
+
+def bench(source_dir: Path, runs: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp) / 'buchfink'
+        shutil.copytree(SCENARIO_DIR, workdir)
+        # Warm up the .buchfink cache so that we do not measure the first download
+        run_once(source_dir, workdir, ['list'])
+        for args in COMMANDS:
+            samples = [run_once(source_dir, workdir, args) for _ in range(runs)]
+            results[' '.join(args)] = (
+                statistics.median(s[0] for s in samples),
+                max(s[1] for s in samples),
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', help='git ref to compare against, e.g. HEAD~1')
+    args = parser.parse_args()
+
+    current = bench(REPO_DIR, args.runs)
+
+    if not args.baseline:
+        print(
+            tabulate(
+                [(cmd, '{:.2f}'.format(t), '{:.0f}'.format(m)) for cmd, (t, m) in current.items()],
+                headers=('Command', 'Wall (s)', 'Peak RSS (MiB)'),
+            )
+        )
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = Path(tmp) / 'baseline'
+        subprocess.run(
+            ['git', 'worktree', 'add', '--detach', str(worktree), args.baseline],
+            cwd=REPO_DIR,
+            check=True,
+            capture_output=True,
+        )
+        try:
+            baseline = bench(worktree, args.runs)
+        finally:
+            subprocess.run(
+                ['git', 'worktree', 'remove', '--force', str(worktree)],
+                cwd=REPO_DIR,
+                check=True,
+            )
+
+    table = []
+    for cmd, (t, m) in current.items():
+        t0, m0 = baseline[cmd]
+        table.append(
+            (
+                cmd,
+                '{:.2f}'.format(t0),
+                '{:.2f}'.format(t),
+                '{:+.0%}'.format(t / t0 - 1),
+                '{:.0f}'.format(m0),
+                '{:.0f}'.format(m),
+                '{:+.0%}'.format(m / m0 - 1),
+            )
+        )
+    print(
+        tabulate(
+            table,
+            headers=(
+                'Command',
+                'Wall before',
+                'Wall after',
+                'Δ',
+                'RSS before',
+                'RSS after',
+                'Δ',
+            ),
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+"""
+Entry point of the `buchfink` command.
+
+Like rotki's own entry point, this patches the standard library for gevent
+before anything else is imported. rotki's database connection and clients are
+built for greenlets, and the patched sockets let greenlets (e.g. of
+`fetch --jobs`) wait for the network concurrently.
+"""
+
+from gevent import monkey  # isort:skip
+
+monkey.patch_all()  # isort:skip
+
+from buchfink.cli import buchfink  # noqa: E402
+
+
+def main():
+    buchfink(obj={})  # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,15 @@
+import hashlib
+import json
 import logging
-from copy import deepcopy
-from typing import List
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, cast
 
 from rotkehlchen.assets.utils import symbol_to_asset_or_token
 from rotkehlchen.types import ChainID
-from rotkehlchen.utils.misc import (
-    bytes_to_address,
-    hexstr_to_int,
-    ts_sec_to_ms,
-)
+from rotkehlchen.utils.misc import hexstr_to_int, ts_sec_to_ms
 
 from .datatypes import (
     Balance,
@@ -19,20 +20,13 @@ from .datatypes import (
     HistoryEventSubType,
     HistoryEventType,
 )
-from .models import Account
-from .serialization import serialize_timestamp
+from .models import Account, ClassificationRule
+from .serialization import deserialize_event, serialize_event, serialize_timestamp
+from .storage import load_yaml
 
 logger = logging.getLogger(__name__)
 
 
-def same_addr(addr1, addr2):
-    return str(addr1).lower() == str(addr2).lower()
-
-
-def addr_in(addr, addrs):
-    return addr.lower() in [addr.lower() for addr in addrs]
-
-
 CLAIMED = '0x4ec90e965519d92681267467f775ada5bd214aa92c0dc93d90a5e880ce9ed026'
 CLAIMED_2 = '0xd8138f8a3f377c5259ca548e70e4c2de94f129f5a11036a15b69513cba2b426a'
 CLAIMED_3 = '0x6f9c9826be5976f3f82a3490c52a83328ce2ec7be9e62dcb39c26da5148d7c76'
@@ -58,64 +52,16 @@ WITHDRAWN = '0x6b4651e8f4162f82274a25e57a29f7ed9156d17078e76dd4d05f04ba08831aa4'
 MINT = '0xce84afc26010d49051ae429b96ad50c0ef3a958a5c5bdc44c80e090dee642dbe'
 HARVEST = '0x71bab65ced2e5750775a0613be067df48ef06cf92a496ebf7663ae0660924954'
 
-ADDR_UNISWAP_AIRDROP = '0x090D4613473dEE047c3f2706764f49E0821D256e'
-ADDR_MIRROR_AIRDROP = '0x2A398bBa1236890fb6e9698A698A393Bb8ee8674'
-ADDR_PIEDAO_DOUGH = '0xad32A8e6220741182940c5aBF610bDE99E737b2D'
-ADDR_PIEDAO_INCENTIVES = (
-    '0x8314337d2b13e1A61EadF0FD1686b2134D43762F',
-    '0xb9a4bca06f14a982fcd14907d31dfacadc8ff88e',
-    '0xb8e59ce1359d80e4834228edd6a3f560e7534438',
-    '0x3bFdA5285416eB06Ebc8bc0aBf7d105813af06d0',
-)
-ADDR_INDEX_REWARDS = (
-    '0x8f06FBA4684B5E0988F215a47775Bb611Af0F986',
-    '0xB93b505Ed567982E2b6756177ddD23ab5745f309',
-)
-ADDR_YFI_GOVERNANCE = '0xba37b002abafdd8e89a1995da52740bbc013d992'
-ADDR_CREAM_REWARDS = (
-    '0x224061756c150e5048a1e4a3e6e066db35037462',
-    '0x3ba3c0e8a9e5f4a01ce8e086b3d8e8a603a2129e',
-    '0x24e45B60E13b6F96e983BB01Ea1326fa5169CCD5',
-)
-ADDR_BALANCER_REWARDS = '0x6d19b2bF3A36A61530909Ae65445a906D98A2Fa8'
-ADDR_POOL_AIRDROP = '0xBE1a33519F586A4c8AA37525163Df8d67997016f'
-ADDR_BADGER_TREE = '0x660802Fc641b154aBA66a62137e71f331B6d787A'
-ADDR_MIR_REWARDS = '0x5d447Fc0F8965cED158BAB42414Af10139Edf0AF'
-ADDR_XTOKEN_AIRDROP = '0x11f10378fc56277eEdBc0c3309c457b0fd5c6dfd'
-ADDR_SWERVE_MINTER = '0x2c988c3974ad7e604e276ae0294a7228def67974'
 ADDR_FEI_GENESIS_GROUP = '0xBFfB152b9392e38CdDc275D818a3Db7FE364596b'
-ADDR_DODO_REWARDS = '0x0e504d3e053885a82bd1cb5c29cbaae5b3673be4'
-ADDR_IMX_AIRDROP = '0x2011b5d4d5287cc9d3462b4e8af0e4daf29e3c1d'
-ADDR_ROOK_REWARDS = '0x2777b798fdfb906d42b89cf8f9de541db05dd6a1'
-ADDR_SUSHI_REWARDS = '0xc2edad668740f1aa35e4d8f227fb8e17dca888cd'
-ADDR_SUSHI_VESTING = '0xcBE6B83e77cdc011Cc18F6f0Df8444E5783ed982'
-ADDR_GITCOIN_AIRDROP = '0xde3e5a990bce7fc60a6f017e7c4a95fc4939299e'
-ADDR_BLACKPOOL_AIRDROP = '0x6b63564a8b3f145b3ef085bcc197c0ff64e9a140'
-ADDR_TORN_VTORN = '0x3eFA30704D2b8BBAc821307230376556cF8CC39e'
-ADDR_XTK_VESTING = '0x2ac34f8327aceD80CFC04085972Ee06Be72A45bb'
-ADDR_FOX_AIRDROP = '0xd1Fa5AA6AD65eD6FEA863c2e7fB91e731DcD559F'
-ADDR_FOX_AIRDROP_2 = '0x91B9A78658273913bf3F5444Cb5F2592d1123eA7'
-ADDR_FOX_AIRDROP_3 = '0xf4BBE639CCEd35210dA2018b0A31f4E1449B2a8a'
-ADDR_FOX_AIRDROP_4 = '0x7BC08798465B8475Db9BCA781C2Fd6063A09320D'
-ADDR_UMA_TVL_OPT = '0x0Ee5Bb3dEAe8a44FbDeB269941f735793F8312Ef'
-ADDR_DYDX_REWARDS = '0x01d3348601968aB85b4bb028979006eac235a588'
-ADDR_THALES_AIRDROP = '0x0f33af99f3C124189B8dA7C7BE6Dc08C77a9ddc7'
-ADDR_DAPPRADAR_AIRDROP = '0x2E424a4953940aE99f153a50d0139E7CD108c071'
-ADDR_BEVERAGE_BAR = '0xDc5BBb7f25a05259b2bD559936771f8Fc0E2c4cb'
-
-ADDR_PLSD = '0x34F0915a5f15a66Eba86F6a58bE1A471FB7836A7'
-ADDR_DODO = '0x43Dfc4159D86F3A37A5A4B3D4580b888ad7d4DDd'
-ADDR_SUSHI = '0x6b3595068778dd592e39a122f4f5a5cf09c90fe2'
-ADDR_TORN = '0x77777feddddffc19ff86db637967013e6c6a116c'
 ADDR_HEX = '0x2b591e99afE9f32eAA6214f7B7629768c40Eeb39'
-ADDR_COMPOUND_DAI = '0x5d3a536E4D6DbD6114cc1Ead35777bAB948E3643'
-ADDR_DAI = '0x6B175474E89094C44Da98b954EedeAC495271d0F'
-ADDR_BADGER = '0x3472A5A71965499acd81997a54BBA8D852C6E53d'
-ADDR_UMA = '0x04Fa0d235C4abf4BcF4787aF4CF447DE572eF828'
-ADDR_ENS = '0xC18360217D8F7Ab5e7c516566761Ea12Ce7F9D72'
-ADDR_XDAI_EASYSTAKING = '0xecbCd6D7264e3c9eAc24C7130Ed3cd2B38F5A7AD'
 ADDR_HEDRON = '0x3819f64f282bf135d62168C1e513280dAF905e06'
 
+BUNDLED_RULES_PATH = Path(__file__).parent / 'data' / 'classification_rules.yaml'
+
+# Bump this whenever the rules implemented in code change, so that cached
+# classification results are recomputed
+CODE_RULES_VERSION = 1
+
 
 def hex_or_bytes_to_str(value: bytes | str) -> str:
     if isinstance(value, bytes):
@@ -123,842 +69,318 @@ def hex_or_bytes_to_str(value: bytes | str) -> str:
     return value.removeprefix('0x')
 
 
-def classify_tx(account: Account, txn: EvmTransaction, receipt: EvmTxReceipt) -> List[HistoryEvent]:
-    actions = []  # type: List[HistoryEvent]
+class LogView(NamedTuple):
+    "Read-only view of a receipt log with hex strings in a normalized form"
+
+    address: str  # lowercased
+    topics: Tuple[str, ...]  # '0x'-prefixed hex
+    data: str  # '0x'-prefixed hex
+
+
+def normalize_logs(receipt: EvmTxReceipt) -> Tuple[LogView, ...]:
+    return tuple(
+        LogView(
+            address=str(log.address).lower(),
+            topics=tuple('0x' + hex_or_bytes_to_str(topic) for topic in log.topics),
+            data='0x' + hex_or_bytes_to_str(log.data),
+        )
+        for log in receipt.logs
+    )
+
+
+# A rule handler gets the account, the transaction, the log that matched and
+# all logs of the receipt and returns the events it derived from the log.
+RuleHandler = Callable[[Account, EvmTransaction, LogView, Tuple[LogView, ...]], List[HistoryEvent]]
+
+# Rules are indexed by (topic0, lowercased contract address) so that every log
+# resolves to its handler with a single lookup. This registry only holds the
+# rules that need code, the declarative ones are compiled by compile_rules().
+RULES: Dict[Tuple[str, str], RuleHandler] = {}
+
+# Logs with these topics are expected to be handled by a rule. If none matches
+# the contract, we warn about it so that a new rule can be added.
+UNKNOWN_EVENT_WARNINGS = {
+    CLAIMED: 'Claimed',
+    CLAIMED_2: 'Claimed',
+    CLAIMED_3: 'Claimed',
+    CLAIMED_4: 'Claimed',
+    CLAIMED_5: 'Claimed',
+    CLAIMED_6: 'Claimed',
+    CLAIM: 'Claim',
+    CLAIM_2: 'Claim',
+    REWARD_PAID: 'RewardPaid',
+    MINTED: 'Minted',
+    PURCHASE: 'Purchase',
+    REDEEM: 'Redeem',
+}
+
+
+def rule(topic: str, *addresses: str):
+    "Registers the decorated function as handler for `topic` on all `addresses`"
+
+    def decorator(func: RuleHandler) -> RuleHandler:
+        for address in addresses:
+            key = (topic, address.lower())
+            if key in RULES:
+                raise ValueError(f'Duplicate classification rule for {key}')
+            RULES[key] = func
+        return func
+
+    return decorator
+
+
+def make_event(
+    txn: EvmTransaction,
+    amount: int,
+    asset,
+    notes: str,
+    event_subtype: HistoryEventSubType,
+    event_type: HistoryEventType = HistoryEventType.RECEIVE,
+    decimals: int = 18,
+) -> HistoryEvent:
+    return HistoryEvent(
+        identifier=None,
+        sequence_index=0,
+        location='',
+        event_type=event_type,
+        event_subtype=event_subtype,
+        balance=Balance(FVal(amount) / FVal(10**decimals), 0),
+        timestamp=ts_sec_to_ms(txn.timestamp),
+        asset=asset,
+        notes=notes,
+        event_identifier=txn.tx_hash.hex(),
+    )
+
+
+def is_account(value: str, account: Account) -> bool:
+    return hexstr_to_int(value) == hexstr_to_int(account.address)
+
+
+AIRDROP = HistoryEventSubType.AIRDROP
+
+
+@rule(REDEEM, ADDR_FEI_GENESIS_GROUP)
+def fei_genesis_redeem(account, txn, event, logs):
+    if not is_account(event.topics[1], account):
+        return []
+    return [
+        make_event(
+            txn,
+            hexstr_to_int(event.data[2:][64:128]),
+            symbol_to_asset_or_token('eip155:1/erc20:0x956F47F50A910163D8BF957Cf5846D573E7f87CA'),
+            'FEI in Tribe Genesis Redeem',
+            AIRDROP,
+        ),
+        make_event(
+            txn,
+            hexstr_to_int(event.data[2:][128:]),
+            symbol_to_asset_or_token('eip155:1/erc20:0xc7283b66Eb1EB5FB86327f08e1B5816b0720212B'),
+            'TRIBE in Tribe Genesis Redeem',
+            AIRDROP,
+        ),
+    ]
+
+
+ADDR_HEDRON_LOWER = ADDR_HEDRON.lower()
+ADDR_HEX_LOWER = ADDR_HEX.lower()
+
+
+@rule(MINT, ADDR_HEDRON)
+def hedron_mint(account, txn, event, logs):
+    # Find the corresponding TRANSFER
+    return [
+        make_event(
+            txn,
+            hexstr_to_int(ev2.data[2:]),
+            symbol_to_asset_or_token('eip155:1/erc20:' + ADDR_HEDRON),
+            'HEDRON airdrop mint',
+            AIRDROP,
+            decimals=8,
+        )
+        for ev2 in logs
+        if ev2.topics[0] == TRANSFER
+        and ev2.address == ADDR_HEDRON_LOWER
+        and is_account(ev2.topics[2], account)
+    ]
+
+
+@rule(XFLOBBYEXIT, ADDR_HEX)
+def hex_xflobbyexit(account, txn, event, logs):
+    # Find the corresponding TRANSFER. We will classify those as GIFT instead
+    # of purchase because we already paid earlier
+    return [
+        make_event(
+            txn,
+            hexstr_to_int(ev2.data[2:]),
+            symbol_to_asset_or_token('eip155:1/erc20:' + ADDR_HEX),
+            'XFLOBBYEXIT HEX mint',
+            HistoryEventSubType.NONE,
+            decimals=8,
+        )
+        for ev2 in logs
+        if ev2.topics[0] == TRANSFER
+        and ev2.address == ADDR_HEX_LOWER
+        and hexstr_to_int(ev2.topics[1]) == 0
+        and is_account(ev2.topics[2], account)
+    ]
+
+
+def load_rules(path: Path) -> List[ClassificationRule]:
+    "Reads declarative classification rules from a YAML file"
+    contents = load_yaml(path)
+    return [ClassificationRule(**spec) for spec in (contents or {}).get('rules', [])]
+
+
+def compile_rule(spec: ClassificationRule) -> RuleHandler:
+    "Builds the handler for a declarative rule"
+
+    # Offsets and lengths are in bytes, the log data is '0x'-prefixed hex
+    amount = slice(
+        2 + 2 * spec.data_offset,
+        2 + 2 * (spec.data_offset + spec.data_length) if spec.data_length is not None else None,
+    )
+    account_word = (
+        slice(2 + 64 * spec.account_word, 2 + 64 * (spec.account_word + 1))
+        if spec.account_word is not None
+        else None
+    )
+    topic_equals = {
+        index: frozenset(hexstr_to_int(v) for v in ([value] if isinstance(value, str) else value))
+        for index, value in spec.topic_equals.items()
+    }
+    chain_id = ChainID(spec.chain_id) if spec.chain_id is not None else None
+    event_type = HistoryEventType.deserialize(spec.event_type)
+    event_subtype = HistoryEventSubType.deserialize(spec.event_subtype)
+
+    def handler(account, txn, event, logs):
+        if spec.account_topic is not None and not is_account(
+            event.topics[spec.account_topic], account
+        ):
+            return []
+        if account_word is not None and not is_account(event.data[account_word], account):
+            return []
+        for index, values in topic_equals.items():
+            if hexstr_to_int(event.topics[index]) not in values:
+                return []
+        return [
+            make_event(
+                txn,
+                hexstr_to_int(event.data[amount]),
+                symbol_to_asset_or_token(spec.asset, chain_id=chain_id),
+                spec.notes,
+                event_subtype,
+                event_type=event_type,
+                decimals=spec.decimals,
+            )
+        ]
+
+    return handler
+
+
+def compile_rules(specs: Iterable[ClassificationRule]) -> Dict[Tuple[str, str], RuleHandler]:
+    """
+    Indexes the code rules together with the given declarative rules.
+    Later rules take precedence, so user rules can override bundled ones.
+    """
+    rules = dict(RULES)
+    for spec in specs:
+        handler = compile_rule(spec)
+        for contract in spec.contracts:
+            rules[(spec.topic.lower(), contract.lower())] = handler
+    return rules
+
+
+def ruleset_hash(specs: Iterable[ClassificationRule]) -> str:
+    "Fingerprint of a ruleset, changes whenever any of its rules does"
+    ruleset = {'code': CODE_RULES_VERSION, 'rules': [spec.dict() for spec in specs]}
+    return hashlib.sha256(json.dumps(ruleset, sort_keys=True).encode()).hexdigest()
+
+
+class ClassificationCache:
+    """
+    Stores the events classify_tx() derived from a transaction for an account,
+    together with the hash of the ruleset that produced them.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS classified_transactions ('
+            'tx_hash TEXT NOT NULL, address TEXT NOT NULL, ruleset TEXT NOT NULL, '
+            'events TEXT NOT NULL, PRIMARY KEY (tx_hash, address))'
+        )
+
+    def get(self, tx_hash: bytes, address: str, ruleset: str) -> Optional[List[HistoryEvent]]:
+        "Returns the cached events or None if the tx was not classified with this ruleset"
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT events FROM classified_transactions '
+                'WHERE tx_hash = ? AND address = ? AND ruleset = ?',
+                (tx_hash.hex(), address.lower(), ruleset),
+            ).fetchone()
+        if row is None:
+            return None
+        return [cast(HistoryEvent, deserialize_event(event)) for event in json.loads(row[0])]
+
+    def put(self, tx_hash: bytes, address: str, ruleset: str, events: List[HistoryEvent]) -> None:
+        "Stores the events, they are written to disk with the next commit()"
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO classified_transactions VALUES (?, ?, ?, ?)',
+                (
+                    tx_hash.hex(),
+                    address.lower(),
+                    ruleset,
+                    json.dumps([serialize_event(event) for event in events]),
+                ),
+            )
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+
+@lru_cache(maxsize=None)
+def default_rules() -> Dict[Tuple[str, str], RuleHandler]:
+    "The code rules and the rules bundled with Buchfink"
+    return compile_rules(load_rules(BUNDLED_RULES_PATH))
 
-    tx_time = serialize_timestamp(txn.timestamp)
+
+def classify_tx(
+    account: Account,
+    txn: EvmTransaction,
+    receipt: EvmTxReceipt,
+    rules: Optional[Dict[Tuple[str, str], RuleHandler]] = None,
+) -> List[HistoryEvent]:
+    actions = []  # type: List[HistoryEvent]
 
     if txn.from_address != account.address:
         return actions
 
-    # Copy receipt because we will modify it in place. This is ugly and has to
-    # be removed in the future.
-    receipt = deepcopy(receipt)
-
-    for event in receipt.logs:
-        # Quick hack to make the classication work. Will refactor later.
-        event.data = '0x' + hex_or_bytes_to_str(event.data)  # type: ignore
-        event.address = str(event.address).lower()  # type: ignore
-        for i, topic in enumerate(event.topics):
-            event.topics[i] = '0x' + hex_or_bytes_to_str(topic)  # type: ignore
-
-        if event.topics[0] == CLAIMED and same_addr(event.address, ADDR_UNISWAP_AIRDROP):
-            amount = hexstr_to_int(event.data[130:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x1f9840a85d5af5bf1d1762f925bdaddc4201f984'
-                    ),
-                    notes='',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED and same_addr(event.address, ADDR_MIRROR_AIRDROP):
-            amount = hexstr_to_int(event.data[130:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x09a3ecafa817268f77be1283176b946c4ff2e608'
-                    ),
-                    notes='',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED and same_addr(event.address, ADDR_POOL_AIRDROP):
-            amount = hexstr_to_int(event.data[130:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x0cec1a9154ff802e7934fc916ed7ca50bde6844e'
-                    ),
-                    notes='PoolTogether airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED and same_addr(event.address, ADDR_IMX_AIRDROP):
-            amount = hexstr_to_int(event.data[130:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x7b35ce522cb72e4077baeb96cb923a5529764a00'
-                    ),
-                    notes='IMX airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED:
-            logger.warning('Unknown Claimed event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == CLAIMED_3 and same_addr(event.address, ADDR_BADGER_TREE):
-            if hexstr_to_int(event.topics[2]) == hexstr_to_int(ADDR_BADGER):
-                amount = hexstr_to_int(event.data[2:66])
-                token = symbol_to_asset_or_token(
-                    'eip155:1/erc20:0x3472a5a71965499acd81997a54bba8d852c6e53d'
-                )
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=token,
-                        notes='Badger rewards for staking',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == CLAIMED_3:
-            logger.warning('Unknown Claimed event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == CLAIMED_2 and same_addr(event.address, ADDR_XTOKEN_AIRDROP):
-            amount = hexstr_to_int(event.data)
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x7f3edcdd180dbe4819bd98fee8929b5cedb3adeb'
-                    ),
-                    notes='xToken airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED_2 and same_addr(event.address, ADDR_BALANCER_REWARDS):
-            amount = hexstr_to_int(event.data[66:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token('BAL', chain_id=ChainID.ETHEREUM),
-                    notes='Balancer rewards for providing liquidity',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED_2 and same_addr(event.address, ADDR_ROOK_REWARDS):
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token('ROOK', chain_id=ChainID.ETHEREUM),
-                    notes='Rook rewards for providing liquidity',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED_2:
-            logger.warning('Unknown Claimed event for tx: %s', txn.tx_hash.hex())
-
-        if event.topics[0] == CLAIMED_4 and same_addr(event.address, ADDR_GITCOIN_AIRDROP):
-            amount = hexstr_to_int(event.data[2:][128:192])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0xDe30da39c46104798bB5aA3fe8B9e0e1F348163F'
-                    ),
-                    notes='Gitcoin retroactive airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED_4:
-            logger.warning('Unknown Claimed event for tx: %s', txn.tx_hash.hex())
-
-        if event.topics[0] == CLAIMED_5 and event.address in (
-            ADDR_FOX_AIRDROP.lower(),
-            ADDR_FOX_AIRDROP_2.lower(),
-            ADDR_FOX_AIRDROP_3.lower(),
-            ADDR_FOX_AIRDROP_4.lower(),
-        ):
-            amount = hexstr_to_int(event.data[2:][64:128])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0xc770EEfAd204B5180dF6a14Ee197D99d808ee52d'
-                    ),
-                    notes='FOX token airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED_5:
-            logger.warning('Unknown Claimed event for tx: %s', txn.tx_hash.hex())
-
-        if event.topics[0] == CLAIMED_6 and same_addr(event.address, ADDR_SUSHI_VESTING):
-            amount = hexstr_to_int(event.data[2:][64:128])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token('SUSHI', chain_id=ChainID.ETHEREUM),
-                    notes='SUSHI rewards vesting',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIMED_6:
-            logger.warning('Unknown Claimed event for tx: %s', txn.tx_hash.hex())
-
-        if event.topics[0] == REWARD_PAID and addr_in(event.address, ADDR_INDEX_REWARDS):
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token('INDEX', chain_id=ChainID.ETHEREUM),
-                    notes='rewards for providing liquidity',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == REWARD_PAID and same_addr(event.address, ADDR_YFI_GOVERNANCE):
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token('yDAI+yUSDC+yUSDT+yTUSD'),
-                    notes='rewards from yearn governance',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == REWARD_PAID and event.address in ADDR_CREAM_REWARDS:
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token('CREAM', chain_id=ChainID.ETHEREUM),
-                    notes='rewards from CREAM incentives',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == REWARD_PAID and same_addr(event.address, ADDR_MIR_REWARDS):
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x09a3ecafa817268f77be1283176b946c4ff2e608'
-                    ),
-                    notes='rewards for staking MIR LP',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == REWARD_PAID:
-            logger.warning('Unknown RewardPaid event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == MINTED and same_addr(event.address, ADDR_SWERVE_MINTER):
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data[66:])
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token('SWRV', chain_id=ChainID.ETHEREUM),
-                        notes='Swerve rewards for pooling liquidity',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == MINTED:
-            logger.warning('Unknown Minted event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == PURCHASE and same_addr(event.address, ADDR_FEI_GENESIS_GROUP):
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.SPEND,
-                        event_subtype=HistoryEventSubType.NONE,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token('ETH'),
-                        notes='Fei Genesis Commit',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == PURCHASE:
-            logger.warning('Unknown Purchase event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == REDEEM and same_addr(event.address, ADDR_FEI_GENESIS_GROUP):
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(account.address):
-                amount_fei = hexstr_to_int(event.data[2:][64:128])
-                amount_tribe = hexstr_to_int(event.data[2:][128:])
-                print(amount_fei, amount_tribe)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.AIRDROP,
-                        balance=Balance(FVal(amount_fei) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token(
-                            'eip155:1/erc20:0x956F47F50A910163D8BF957Cf5846D573E7f87CA'
-                        ),
-                        notes='FEI in Tribe Genesis Redeem',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.AIRDROP,
-                        balance=Balance(FVal(amount_tribe) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token(
-                            'eip155:1/erc20:0xc7283b66Eb1EB5FB86327f08e1B5816b0720212B'
-                        ),
-                        notes='TRIBE in Tribe Genesis Redeem',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == REDEEM:
-            logger.warning('Unknown redeem event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == TRANSFER and same_addr(event.address, ADDR_DODO):
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(ADDR_DODO_REWARDS) and hexstr_to_int(
-                event.topics[2]
-            ) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token('DODO', chain_id=ChainID.ETHEREUM),
-                        notes='Claim DODO rewards',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == TRANSFER and same_addr(event.address, ADDR_SUSHI):
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(
-                ADDR_SUSHI_REWARDS
-            ) and hexstr_to_int(event.topics[2]) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token('SUSHI', chain_id=ChainID.ETHEREUM),
-                        notes='Claim SUSHI rewards for staking LP',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == TRANSFER and same_addr(event.address, ADDR_TORN):
-            asset = symbol_to_asset_or_token(
-                'eip155:1/erc20:0x77777FeDdddFfC19Ff86DB637967013e6C6A116C'
+    if rules is None:
+        rules = default_rules()
+
+    logs = None  # type: Optional[Tuple[LogView, ...]]
+
+    for index, log in enumerate(receipt.logs):
+        if not log.topics:
+            continue
+
+        topic0 = '0x' + hex_or_bytes_to_str(log.topics[0])
+        handler = rules.get((topic0, str(log.address).lower()))
+        if handler is not None:
+            # Only receipts with a matching log get normalized, once
+            if logs is None:
+                logs = normalize_logs(receipt)
+            actions += handler(account, txn, logs[index], logs)
+        elif topic0 in UNKNOWN_EVENT_WARNINGS:
+            logger.warning(
+                'Unknown %s event for tx %s at %s',
+                UNKNOWN_EVENT_WARNINGS[topic0],
+                txn.tx_hash.hex(),
+                serialize_timestamp(txn.timestamp),
             )
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(ADDR_TORN_VTORN) and hexstr_to_int(
-                event.topics[2]
-            ) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.AIRDROP,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='TORN airdrop',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == TRANSFER and same_addr(event.address, ADDR_DAI):
-            # MakerDAO Mint
-            # Until we clarify generalized lending support in Buchfink,
-            # treat borrowed DAI as a gift you have to pay back
-            asset = symbol_to_asset_or_token('DAI', chain_id=ChainID.ETHEREUM)
-            if hexstr_to_int(event.topics[1]) == 0 and hexstr_to_int(
-                event.topics[2]
-            ) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.NONE,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='DAI mint',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == TRANSFER and same_addr(event.address, ADDR_UMA):
-            # UMA TVL Option Settlement
-            asset = symbol_to_asset_or_token('eip155:1/erc20:' + ADDR_UMA)
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(ADDR_UMA_TVL_OPT) and hexstr_to_int(
-                event.topics[2]
-            ) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='UMA TVL option settlement',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        elif event.topics[0] == TRANSFER and same_addr(event.address, ADDR_PIEDAO_DOUGH):
-            if addr_in(
-                bytes_to_address(event.topics[1]), ADDR_PIEDAO_INCENTIVES
-            ) and hexstr_to_int(event.topics[2]) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data)
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token('DOUGH'),
-                        notes='rewards for providing liquidity',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        if event.topics[0] == STAKEEND and same_addr(event.address, ADDR_HEX):
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(account.address):
-                payout = hexstr_to_int(event.data[2:][:18])
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(payout) / FVal(1e8), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=symbol_to_asset_or_token('eip155:1/erc20:' + ADDR_HEX),
-                        notes='HEX Payout for staking',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        if event.topics[0] == REWARDS_CLAIMED and same_addr(event.address, ADDR_DYDX_REWARDS):
-            asset = symbol_to_asset_or_token(
-                'eip155:1/erc20:0x92D6C1e31e14520e676a687F0a93788B716BEff5'
-            )
-            if hexstr_to_int(event.data[2:][:64]) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data[2:][64:128])
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.AIRDROP,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='dYdX retroactive airdrop',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        if event.topics[0] == MINT and same_addr(event.address, ADDR_HEDRON):
-            asset = symbol_to_asset_or_token('eip155:1/erc20:' + ADDR_HEDRON)
-
-            # Find another TRANSFER
-            for ev2 in receipt.logs:
-                # Quick hack to make the classication work. Will refactor later.
-                ev2.data = '0x' + hex_or_bytes_to_str(ev2.data)  # type: ignore
-                ev2.address = str(ev2.address).lower()  # type: ignore
-                for i, topic in enumerate(ev2.topics):
-                    ev2.topics[i] = '0x' + hex_or_bytes_to_str(topic)  # type: ignore
-                if (
-                    ev2.topics[0] == TRANSFER
-                    and same_addr(ev2.address, ADDR_HEDRON)
-                    and hexstr_to_int(ev2.topics[2]) == hexstr_to_int(account.address)
-                ):
-                    amount = hexstr_to_int(ev2.data[2:])
-                    actions += [
-                        HistoryEvent(
-                            identifier=None,
-                            sequence_index=0,
-                            location='',
-                            event_type=HistoryEventType.RECEIVE,
-                            event_subtype=HistoryEventSubType.AIRDROP,
-                            balance=Balance(FVal(amount) / FVal(1e8), 0),
-                            timestamp=ts_sec_to_ms(txn.timestamp),
-                            asset=asset,
-                            notes='HEDRON airdrop mint',
-                            event_identifier=txn.tx_hash.hex(),
-                        )
-                    ]
-
-        if event.topics[0] == HUNT and same_addr(event.address, ADDR_BLACKPOOL_AIRDROP):
-            asset = symbol_to_asset_or_token(
-                'eip155:1/erc20:0x0eC9F76202a7061eB9b3a7D6B59D36215A7e37da'
-            )
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data[2:][64:128])
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.AIRDROP,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='Blackpool airdrop',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        if event.topics[0] == VESTED and same_addr(event.address, ADDR_XTK_VESTING):
-            asset = symbol_to_asset_or_token(
-                'eip155:1/erc20:0x7F3EDcdD180Dbe4819Bd98FeE8929b5cEdB3AdEB'
-            )
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(account.address):
-                amount = hexstr_to_int(event.data[2:][64:128])
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='XTK Rewards for LP staking',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        if event.topics[0] == WITHDRAWN and same_addr(event.address, ADDR_XDAI_EASYSTAKING):
-            asset = symbol_to_asset_or_token(
-                'eip155:1/erc20:0x0Ae055097C6d159879521C384F1D2123D1f195e6'
-            )
-            if hexstr_to_int(event.topics[1]) == hexstr_to_int(account.address):
-                # accruedEmission
-                amount = hexstr_to_int(event.data[2:][64 * 3 : 64 * 4])
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.REWARD,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='STAKE rewards for easystaking',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        # Until we clarify generalized lending support in Buchfink,
-        # treat borrowed DAI as a gift you have to pay back
-        if event.topics[0] == BORROW and same_addr(event.address, ADDR_COMPOUND_DAI):
-            asset = symbol_to_asset_or_token('DAI', chain_id=ChainID.ETHEREUM)
-            borrower = hexstr_to_int(event.data[2:][:64])
-            amount = hexstr_to_int(event.data[2:][64:128])
-            if borrower == hexstr_to_int(account.address):
-                actions += [
-                    HistoryEvent(
-                        identifier=None,
-                        sequence_index=0,
-                        location='',
-                        event_type=HistoryEventType.RECEIVE,
-                        event_subtype=HistoryEventSubType.NONE,
-                        balance=Balance(FVal(amount) / FVal(1e18), 0),
-                        timestamp=ts_sec_to_ms(txn.timestamp),
-                        asset=asset,
-                        notes='Compound DAI mint',
-                        event_identifier=txn.tx_hash.hex(),
-                    )
-                ]
-
-        if event.topics[0] == XFLOBBYEXIT and same_addr(event.address, ADDR_HEX):
-            asset = symbol_to_asset_or_token('eip155:1/erc20:' + ADDR_HEX)
-
-            # Find another TRANSFER
-            for ev2 in receipt.logs:
-                # Quick hack to make the classication work. Will refactor later.
-                ev2.data = '0x' + hex_or_bytes_to_str(ev2.data)  # type: ignore
-                ev2.address = str(ev2.address).lower()  # type: ignore
-                for i, topic in enumerate(ev2.topics):
-                    ev2.topics[i] = '0x' + hex_or_bytes_to_str(topic)  # type: ignore
-                if (
-                    ev2.topics[0] == TRANSFER
-                    and same_addr(ev2.address, ADDR_HEX)
-                    and hexstr_to_int(ev2.topics[1]) == 0
-                    and hexstr_to_int(ev2.topics[2]) == hexstr_to_int(account.address)
-                ):
-                    amount = hexstr_to_int(ev2.data[2:])
-                    # We will classify those as GIFT instead of purchase because
-                    # we already paid earlier
-                    actions += [
-                        HistoryEvent(
-                            identifier=None,
-                            sequence_index=0,
-                            location='',
-                            event_type=HistoryEventType.RECEIVE,
-                            event_subtype=HistoryEventSubType.NONE,
-                            balance=Balance(FVal(amount) / FVal(1e8), 0),
-                            timestamp=ts_sec_to_ms(txn.timestamp),
-                            asset=asset,
-                            notes='XFLOBBYEXIT HEX mint',
-                            event_identifier=txn.tx_hash.hex(),
-                        )
-                    ]
-
-        if event.topics[0] == TOKEN_CLAIMED and same_addr(event.address, ADDR_DAPPRADAR_AIRDROP):
-            amount = hexstr_to_int(event.data[2:][128:192])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x44709a920fCcF795fbC57BAA433cc3dd53C44DbE'
-                    ),
-                    notes='DappRadar airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        if event.topics[0] == CLAIM and same_addr(event.address, ADDR_THALES_AIRDROP):
-            amount = hexstr_to_int(event.data[2:][64:128])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x03E173Ad8d1581A4802d3B532AcE27a62c5B81dc'
-                    ),
-                    notes='Thales retroactive airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIM:
-            logger.warning('Unknown Claim event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == CLAIM_2 and same_addr(event.address, ADDR_ENS):
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(f'eip155:1/erc20:{ADDR_ENS}'),
-                    notes='ENS retroactive airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIM_2 and same_addr(event.address, ADDR_PLSD):
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.AIRDROP,
-                    balance=Balance(FVal(amount) / FVal(1e12), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(f'eip155:1/erc20:{ADDR_PLSD}'),
-                    notes='PLSD airdrop',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        elif event.topics[0] == CLAIM_2:
-            logger.warning('Unknown Claim event for tx %s at %s', txn.tx_hash.hex(), tx_time)
-
-        if event.topics[0] == CLAIM_3 and any(
-            same_addr(event.address, addr) for addr in ADDR_CREAM_REWARDS
-        ):
-            amount = hexstr_to_int(event.data[(2 + 192) :])
-            asset = symbol_to_asset_or_token('CREAM', chain_id=ChainID.ETHEREUM)
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=asset,
-                    notes='rewards from CREAM incentives',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
-
-        if event.topics[0] == HARVEST and same_addr(event.address, ADDR_BEVERAGE_BAR):
-            amount = hexstr_to_int(event.data[2:])
-            actions += [
-                HistoryEvent(
-                    identifier=None,
-                    sequence_index=0,
-                    location='',
-                    event_type=HistoryEventType.RECEIVE,
-                    event_subtype=HistoryEventSubType.REWARD,
-                    balance=Balance(FVal(amount) / FVal(1e18), 0),
-                    timestamp=ts_sec_to_ms(txn.timestamp),
-                    asset=symbol_to_asset_or_token(
-                        'eip155:1/erc20:0x9257fb8fab616867cEe67C3289547403617B1938'
-                    ),
-                    notes='DRINK rewards for LP',
-                    event_identifier=txn.tx_hash.hex(),
-                )
-            ]
+
     return actions
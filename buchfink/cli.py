@@ -1,7 +1,6 @@
 import logging
 import os
 import os.path
-import re
 import shutil
 import subprocess
 import sys
@@ -15,12 +14,11 @@ from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 import click
 import coloredlogs
 import pyqrcode
-import yaml
+from gevent.pool import Pool
 from rich.progress import track
 from rotkehlchen.constants import ZERO
 from rotkehlchen.errors.asset import WrongAssetType
 from rotkehlchen.errors.misc import RemoteError
-from rotkehlchen.history.price import PriceHistorian
 from rotkehlchen.utils.misc import ts_ms_to_sec, ts_now
 from tabulate import tabulate
 from web3.exceptions import CannotHandleRequest
@@ -35,9 +33,12 @@ from buchfink.serialization import (
     serialize_timestamp,
 )
 
+from .daemon import forward_to_daemon
+from .daemon import serve as serve_daemon
 from .models import Account, FetchConfig, ReportConfig
-from .models.account import account_from_string
-from .report import render_report, run_report
+from .models.account import account_from_string, filter_accounts
+from .report import AccountEvents, render_report, run_report
+from .storage import dump_yaml, load_yaml
 from .tasks import fetch_actions, fetch_trades, write_actions, write_trades
 
 if TYPE_CHECKING:
@@ -49,31 +50,25 @@ logger = logging.getLogger(__name__)
 
 
 def _get_accounts(
-    buchfink_db: BuchfinkDB, external=None, exclude=None, keyword=None, account_type=None
+    buchfink_db: BuchfinkDB,
+    external=None,
+    exclude=None,
+    keyword=None,
+    account_type=None,
+    tag=None,
 ) -> List[Account]:
     if external:
-        accounts = [account_from_string(ext, buchfink_db) for ext in external]
+        accounts = filter_accounts(
+            [account_from_string(ext, buchfink_db) for ext in external],
+            keyword=keyword,
+            exclude=exclude,
+            account_type=account_type,
+            tag=tag,
+        )
     else:
-        accounts = buchfink_db.get_all_accounts()
-
-    # TODO: This should move to BuchfinkDB.get_accounts()
-    if keyword is not None:
-        if keyword.startswith('/') and keyword.endswith('/'):
-            keyword_re = re.compile(keyword[1:-1])
-            accounts = [acc for acc in accounts if keyword_re.search(acc.name)]
-        else:
-            accounts = [acc for acc in accounts if keyword in acc.name]
-
-    if exclude is not None:
-        if exclude.startswith('/') and exclude.endswith('/'):
-            exclude_re = re.compile(exclude[1:-1])
-            accounts = [acc for acc in accounts if not exclude_re.search(acc.name)]
-        else:
-            accounts = [acc for acc in accounts if exclude not in acc.name]
-
-    # TODO: This should move to BuchfinkDB.get_accounts()
-    if account_type is not None:
-        accounts = [acc for acc in accounts if account_type in acc.account_type]
+        accounts = buchfink_db.get_accounts(
+            keyword=keyword, exclude=exclude, account_type=account_type, tag=tag
+        )
 
     logger.info(
         'Collected %d account(s): %s', len(accounts), ', '.join([acc.name for acc in accounts])
@@ -85,6 +80,20 @@ def _get_accounts(
 def with_buchfink_db(func):
     @click.pass_context
     def new_func(ctx, *args, **kwargs):
+        if ctx.obj.get('BUCHFINK_DB') is not None:
+            # We are running inside `buchfink serve`, reuse the warm database
+            ctx.invoke(func, ctx.obj['BUCHFINK_DB'], *args, **kwargs)
+            return
+
+        if not ctx.obj['NO_DAEMON']:
+            response = forward_to_daemon(
+                ctx.obj['BUCHFINK_CONFIG'], ctx.meta['buchfink.argv'], color=sys.stdout.isatty()
+            )
+            if response is not None:
+                sys.stdout.write(response['stdout'])
+                sys.stderr.write(response['stderr'])
+                ctx.exit(response['exit_code'])
+
         buchfink_db = BuchfinkDB(ctx.obj['BUCHFINK_CONFIG'])
         try:
             ctx.invoke(func, buchfink_db, *args, **kwargs)
@@ -95,13 +104,28 @@ def with_buchfink_db(func):
     return update_wrapper(new_func, func)
 
 
-@click.group()
+class BuchfinkGroup(click.Group):
+    def parse_args(self, ctx, args):
+        # Keep the original arguments around so that they can be forwarded to
+        # a running `buchfink serve` daemon
+        ctx.meta['buchfink.argv'] = list(args)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=BuchfinkGroup)
 @click.option('--log-level', '-l', type=str, default='INFO')
 @click.option('--config', help='Buchfink config file', envvar='BUCHFINK_CONFIG')
+@click.option(
+    '--no-daemon',
+    is_flag=True,
+    envvar='BUCHFINK_NO_DAEMON',
+    help='Do not forward the command to a running buchfink serve',
+)
 @click.pass_context
-def buchfink(ctx, log_level, config):
+def buchfink(ctx, log_level, config, no_daemon):
     ctx.ensure_object(dict)
     ctx.obj['BUCHFINK_CONFIG'] = config or './buchfink.yaml'
+    ctx.obj['NO_DAEMON'] = no_daemon
     coloredlogs.install(level=log_level, fmt='%(asctime)s %(levelname)s %(message)s')
 
 
@@ -140,20 +164,22 @@ def init(directory):
     buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
 
 
+@buchfink.command()
+@click.pass_context
+def serve(ctx):
+    "Keep a warm Buchfink database around and run forwarded commands on it"
+    serve_daemon(ctx.obj['BUCHFINK_CONFIG'], buchfink)
+
+
 @buchfink.command('list')
 @click.option('--keyword', '-k', type=str, default=None, help='Filter by keyword in account name')
 @click.option('--type', '-t', 'account_type', type=str, default=None, help='Filter by account type')
+@click.option('--tag', type=str, default=None, help='Filter by account tag')
 @click.option('--output', '-o', type=str, default=None, help='Output field')
 @with_buchfink_db
-def list_(buchfink_db: BuchfinkDB, keyword, account_type, output):
+def list_(buchfink_db: BuchfinkDB, keyword, account_type, tag, output):
     "List accounts"
-    for account in buchfink_db.get_all_accounts():
-        if keyword is not None and keyword not in account.name:
-            continue
-
-        if account_type is not None and account_type not in account.account_type:
-            continue
-
+    for account in buchfink_db.get_accounts(keyword=keyword, account_type=account_type, tag=tag):
         if output is None:
             type_and_name = '{0}: {1}'.format(
                 account.account_type, click.style(account.name, fg='green')
@@ -177,10 +203,16 @@ def list_(buchfink_db: BuchfinkDB, keyword, account_type, output):
 @click.option('--keyword', '-k', type=str, default=None, help='Filter by keyword in account name')
 @click.option('--exclude', '-x', type=str, default=None, help='Exclude by keyword in account name')
 @click.option('--type', '-t', 'account_type', type=str, default=None, help='Filter by account type')
+@click.option('--tag', type=str, default=None, help='Filter by account tag')
 @click.option('--external', '-e', type=str, multiple=True, help='Use adhoc / external account')
 @click.option('--total', is_flag=True, help='Only show totals')
 @click.option('--denominate-asset', '-d', type=str, help='Denominate in this asset')
 @click.option('--fetch', '-f', is_flag=True, help='Fetch balances from sources')
+@click.option(
+    '--reuse-prices',
+    is_flag=True,
+    help='Value balances with the prices of the previous run instead of querying them',
+)
 @click.option(
     '--minimum-balance',
     '-m',
@@ -194,8 +226,10 @@ def balances(
     keyword,
     minimum_balance,
     fetch,
+    reuse_prices,
     total,
     account_type,
+    tag,
     exclude,
     external,
     denominate_asset,
@@ -210,13 +244,31 @@ def balances(
     buchfink_db.perform_assets_updates()
 
     accounts = _get_accounts(
-        buchfink_db, external=external, keyword=keyword, exclude=exclude, account_type=account_type
+        buchfink_db,
+        external=external,
+        keyword=keyword,
+        exclude=exclude,
+        account_type=account_type,
+        tag=tag,
     )
 
-    for account in track(accounts, 'Fetching balances'):
-        if fetch:
+    if fetch:
+        for account in track(accounts, 'Fetching balances'):
             buchfink_db.fetch_balances(account)
 
+    if denominate_asset is not None:
+        currency = buchfink_db.get_asset_by_symbol(denominate_asset)
+    else:
+        currency = buchfink_db.get_main_currency()
+
+    # Query every price once up front, so that all balances are valued from the same snapshot
+    if not (reuse_prices and buchfink_db.load_price_snapshot()):
+        balance_assets = {currency}
+        for account in accounts:
+            balance_assets |= buchfink_db.get_balance_assets(account)
+        buchfink_db.prefetch_usd_prices(balance_assets)
+
+    for account in accounts:
         sheet = buchfink_db.get_balances(account)
         print(f'Balances for {account.name}:', sheet)
 
@@ -232,12 +284,9 @@ def balances(
                 liabilities_usd_sum.get(liability, FVal(0)) + balance.usd_value
             )
 
-    if denominate_asset is not None:
-        currency = buchfink_db.get_asset_by_symbol(denominate_asset)
-    else:
-        currency = buchfink_db.get_main_currency()
+    buchfink_db.write_price_snapshot()
 
-    currency_in_usd = FVal(buchfink_db.inquirer.find_usd_price(currency))
+    currency_in_usd = buchfink_db.get_usd_price(currency)
     logger.debug('Denominating in %s (= %s USD)', currency, currency_in_usd)
     table = []
     assets = [obj[0] for obj in sorted(assets_usd_sum.items(), key=itemgetter(1), reverse=True)]
@@ -305,22 +354,101 @@ def balances(
             )
 
 
+def _fetch_account(
+    buchfink_db: BuchfinkDB,
+    account: Account,
+    fetch_actions_: bool,
+    fetch_balances: bool,
+    fetch_trades_: bool,
+    fetch_nfts: bool,
+    full: bool,
+) -> List[Tuple[str, str]]:
+    "Fetches data for a single account and returns a list of (step, error) tuples"
+
+    name = account.name
+    fetch_config = account.config.fetch or FetchConfig()
+    fetch_limited = fetch_actions_ or fetch_balances or fetch_trades_ or fetch_nfts
+    errors = []  # type: List[Tuple[str, str]]
+
+    fetch_actions_for_this_account = (not fetch_limited or fetch_actions_) and fetch_config.actions
+
+    fetch_balances_for_this_account = (
+        not fetch_limited or fetch_balances
+    ) and fetch_config.balances
+
+    fetch_trades_for_this_account = (not fetch_limited or fetch_trades_) and fetch_config.trades
+
+    fetch_nfts_for_this_account = (not fetch_limited or fetch_nfts) and fetch_config.trades
+
+    if fetch_actions_for_this_account:
+        try:
+            fetch_actions(buchfink_db, account, ignore_fetch_timestamp=full)
+        except (IOError, CannotHandleRequest, WrongAssetType) as e:
+            logger.exception('Exception during fetch_actions for %s', name)
+            errors.append(('actions', str(e)))
+
+    if fetch_trades_for_this_account:
+        try:
+            fetch_trades(buchfink_db, account, ignore_fetch_timestamp=full)
+        except (IOError, CannotHandleRequest, WrongAssetType) as e:
+            logger.exception('Exception during fetch_trades for %s', name)
+            errors.append(('trades', str(e)))
+
+    if fetch_balances_for_this_account:
+        try:
+            buchfink_db.fetch_balances(account)
+        except (IOError, CannotHandleRequest, WrongAssetType) as e:
+            logger.exception('Exception during fetch_balances for %s', name)
+            errors.append(('balances', str(e)))
+        logger.info('Fetched balances from %s', name)
+
+    if fetch_nfts_for_this_account:
+        try:
+            nfts = buchfink_db.query_nfts(account)
+            if nfts:
+                try:
+                    contents = dict(
+                        load_yaml(buchfink_db.balances_directory / (name + '.yaml')) or {}
+                    )
+                except FileNotFoundError:
+                    contents = {}
+
+                with open(buchfink_db.balances_directory / (name + '.yaml'), 'w') as yaml_file:
+                    contents['nfts'] = serialize_nfts(nfts)
+                    dump_yaml(contents, stream=yaml_file)
+
+        except (IOError, CannotHandleRequest, RemoteError) as e:
+            logger.exception('Exception during query_nfts')
+            errors.append(('nfts', str(e)))
+
+    return errors
+
+
 @buchfink.command('fetch')
 @click.option('--external', '-e', type=str, multiple=True, help='Use adhoc / external account')
 @click.option('--keyword', '-k', type=str, default=None, help='Filter by keyword in account name')
 @click.option('--exclude', '-x', type=str, default=None, help='Exclude by keyword in account name')
 @click.option('--type', '-t', 'account_type', type=str, default=None, help='Filter by account type')
+@click.option('--tag', type=str, default=None, help='Filter by account tag')
 @click.option('--actions', 'fetch_actions_', is_flag=True, help='Fetch actions only')
 @click.option('--balances', 'fetch_balances', is_flag=True, help='Fetch balances only')
 @click.option('--nfts', 'fetch_nfts', is_flag=True, help='Fetch NFT balances only')
 @click.option('--trades', 'fetch_trades_', is_flag=True, help='Fetch trades only')
 @click.option('--progress/--no-progress', default=True, help='Show progress bar')
 @click.option('--full', is_flag=True, help='Fetch everything regardless of last fetch time')
+@click.option(
+    '--jobs',
+    '-j',
+    type=click.IntRange(min=1),
+    default=1,
+    help='Number of accounts to fetch concurrently',
+)
 @with_buchfink_db
 def fetch_(
     buchfink_db: BuchfinkDB,
     keyword,
     account_type,
+    tag,
     fetch_actions_,
     exclude,
     fetch_balances,
@@ -329,79 +457,66 @@ def fetch_(
     external,
     progress,
     full,
+    jobs,
 ):
     "Fetch events and balances"
 
     buchfink_db.perform_assets_updates()
-    fetch_limited = fetch_actions_ or fetch_balances or fetch_trades_ or fetch_nfts
-    error_occured = False
 
     accounts = _get_accounts(
-        buchfink_db, external=external, keyword=keyword, exclude=exclude, account_type=account_type
+        buchfink_db,
+        external=external,
+        keyword=keyword,
+        exclude=exclude,
+        account_type=account_type,
+        tag=tag,
     )
+    errors = {}  # type: Dict[str, List[Tuple[str, str]]]
 
-    for account in track(accounts, description='Fetching data', disable=not progress):
-        name = account.name
-        fetch_config = account.config.fetch or FetchConfig()
-
-        fetch_actions_for_this_account = (
-            not fetch_limited or fetch_actions_
-        ) and fetch_config.actions
-
-        fetch_balances_for_this_account = (
-            not fetch_limited or fetch_balances
-        ) and fetch_config.balances
-
-        fetch_trades_for_this_account = (not fetch_limited or fetch_trades_) and fetch_config.trades
-
-        fetch_nfts_for_this_account = (not fetch_limited or fetch_nfts) and fetch_config.trades
-
-        if fetch_actions_for_this_account:
-            try:
-                fetch_actions(buchfink_db, account, ignore_fetch_timestamp=full)
-            except (IOError, CannotHandleRequest, WrongAssetType):
-                logger.exception('Exception during fetch_actions for %s', name)
-                error_occured = True
-
-        if fetch_trades_for_this_account:
-            try:
-                fetch_trades(buchfink_db, account, ignore_fetch_timestamp=full)
-            except (IOError, CannotHandleRequest, WrongAssetType):
-                logger.exception('Exception during fetch_trades for %s', name)
-                error_occured = True
+    def fetch_account(account: Account) -> List[Tuple[str, str]]:
+        return _fetch_account(
+            buchfink_db, account, fetch_actions_, fetch_balances, fetch_trades_, fetch_nfts, full
+        )
 
-        if fetch_balances_for_this_account:
+    if jobs == 1:
+        for account in track(accounts, description='Fetching data', disable=not progress):
+            errors[account.name] = fetch_account(account)
+    else:
+        # Accounts are fetched on greenlets, like rotki does it, so that they
+        # share rotki's SQLite connection safely. Every account is fetched on
+        # its own greenlet, including blockchain accounts: the state that
+        # rotki's chain manager and decoder share between them is guarded by
+        # BuchfinkDB.chain_state_lock.
+        def fetch_account_safely(account: Account) -> Tuple[Account, List[Tuple[str, str]]]:
+            # Unexpected errors must not end the fetch while other accounts are
+            # still being fetched
             try:
-                buchfink_db.fetch_balances(account)
-            except (IOError, CannotHandleRequest, WrongAssetType):
-                logger.exception('Exception during fetch_balances for %s', name)
-                error_occured = True
-            logger.info('Fetched balances from %s', name)
+                return account, fetch_account(account)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception('Exception during fetch for %s', account.name)
+                return account, [('fetch', str(e))]
 
-        if fetch_nfts_for_this_account:
-            try:
-                nfts = buchfink_db.query_nfts(account)
-                if nfts:
-                    try:
-                        with open(
-                            buchfink_db.balances_directory / (name + '.yaml'), 'r'
-                        ) as yaml_file:
-                            contents = yaml.load(yaml_file, Loader=yaml.SafeLoader)
-                            if contents is None:
-                                contents = {}
-                    except FileNotFoundError:
-                        contents = {}
-
-                    with open(buchfink_db.balances_directory / (name + '.yaml'), 'w') as yaml_file:
-                        contents['nfts'] = serialize_nfts(nfts)
-                        yaml.dump(contents, stream=yaml_file, sort_keys=False, width=-1)
-
-            except (IOError, CannotHandleRequest, RemoteError):
-                logger.exception('Exception during query_nfts')
-                error_occured = True
-
-    if error_occured:
+        pool = Pool(jobs)
+        try:
+            for account, account_errors in track(
+                pool.imap_unordered(fetch_account_safely, accounts),
+                total=len(accounts),
+                description='Fetching data',
+                disable=not progress,
+            ):
+                errors[account.name] = account_errors
+        finally:
+            pool.join()
+
+    failed = [
+        (account.name, step, error)
+        for account in accounts
+        for step, error in errors.get(account.name, [])
+    ]
+    if failed:
         print('One or more errors occured')
+        print()
+        print(tabulate(failed, headers=['Account', 'Step', 'Error']))
         # TODO: RETURN exit code 1 on error
 
 
@@ -472,56 +587,71 @@ def asset_(buchfink_db: BuchfinkDB, identifier: str):
 @buchfink.command('format')
 @click.option('--keyword', '-k', type=str, default=None, help='Filter by keyword in account name')
 @click.option('--type', '-t', 'account_type', type=str, default=None, help='Filter by account type')
+@click.option('--tag', type=str, default=None, help='Filter by account tag')
 @with_buchfink_db
-def format_(buchfink_db: BuchfinkDB, keyword: Optional[str], account_type: Optional[str]):
+def format_(
+    buchfink_db: BuchfinkDB,
+    keyword: Optional[str],
+    account_type: Optional[str],
+    tag: Optional[str],
+):
     "Reads and formats all balances, trades and actions"
     # TODO: nfts are currently not reformatted
 
-    accounts = _get_accounts(buchfink_db, keyword=keyword, account_type=account_type)
+    accounts = _get_accounts(buchfink_db, keyword=keyword, account_type=account_type, tag=tag)
 
     for account in accounts:
         name = account.name
         logger.info('Formatting %s', name)
 
-        actions_path = buchfink_db.actions_directory / (name + '.yaml')
-        if os.path.exists(actions_path):
-            actions = buchfink_db.get_actions_from_file(actions_path)
+        # Written in the layout of the `ledger_partitions` setting
+        if buchfink_db.get_ledger_files('actions', account):
+            actions = buchfink_db.get_local_ledger_actions_for_account(account)
             write_actions(buchfink_db, account, actions)
 
-        trades_path = buchfink_db.trades_directory / (name + '.yaml')
-        if os.path.exists(trades_path):
-            trades = buchfink_db.get_trades_from_file(trades_path)
+        if buchfink_db.get_ledger_files('trades', account):
+            trades = buchfink_db.get_local_trades_for_account(account)
             write_trades(buchfink_db, account, trades)
 
         balances_path = buchfink_db.balances_directory / (name + '.yaml')
         if os.path.exists(balances_path):
-            balances_ = buchfink_db.get_balances_from_file(balances_path)
+            balances_ = buchfink_db.get_balances_from_file(balances_path, with_usd_value=False)
             buchfink_db.write_balances(account, balances_)
 
 
 @buchfink.command('events')
 @click.option('--keyword', '-k', type=str, default=None, help='Filter by keyword in account name')
 @click.option('--asset', '-a', type=str, default=None, help='Filter by asset')
+@click.option(
+    '--from', '-f', 'from_date', type=str, default=None, help='Show events from this date'
+)
+@click.option('--to', '-t', 'to_date', type=str, default=None, help='Show events before this date')
 @with_buchfink_db
-def events_(buchfink_db: BuchfinkDB, keyword, asset):
+def events_(buchfink_db: BuchfinkDB, keyword, asset, from_date, to_date):
     "List events"
 
     events: List[Tuple[Union[HistoryBaseEntry, Trade], Account]] = []
 
     filter_asset = buchfink_db.get_asset_by_symbol(asset) if asset is not None else None
     accounts = _get_accounts(buchfink_db, keyword=keyword)
+    from_ts = datetime.fromisoformat(from_date).timestamp() if from_date else None
+    to_ts = datetime.fromisoformat(to_date).timestamp() if to_date else None
+
+    filter_assets = [filter_asset] if filter_asset is not None else None
 
     for account in accounts:
         events.extend(
             (trade, account)
-            for trade in buchfink_db.get_local_trades_for_account(account.name)
-            if filter_asset is None or filter_asset in (trade.base_asset, trade.quote_asset)
+            for trade in buchfink_db.get_local_trades_for_account(
+                account.name, end_ts=to_ts, assets=filter_assets
+            )
         )
 
         events.extend(
             (event, account)
-            for event in buchfink_db.get_local_ledger_actions_for_account(account.name)
-            if filter_asset is None or filter_asset in (event.asset,)
+            for event in buchfink_db.get_local_ledger_actions_for_account(
+                account.name, end_ts=to_ts, assets=filter_assets
+            )
         )
 
     def get_timestamp(event) -> Timestamp:
@@ -529,7 +659,15 @@ def events_(buchfink_db: BuchfinkDB, keyword, asset):
             return ts_ms_to_sec(event.timestamp)
         return event.timestamp
 
-    events = sorted(events, key=lambda ev_acc: get_timestamp(ev_acc[0]))
+    events = sorted(
+        (
+            (event, account)
+            for event, account in events
+            if (from_ts is None or get_timestamp(event) >= from_ts)
+            and (to_ts is None or get_timestamp(event) < to_ts)
+        ),
+        key=lambda ev_acc: get_timestamp(ev_acc[0]),
+    )
 
     if events:
         table = []
@@ -619,6 +757,7 @@ def events_(buchfink_db: BuchfinkDB, keyword, asset):
     '--vcs-check/--no-vcs-check', default=True, help='Check if we are in a clean VCS state'
 )
 @click.option('--template', type=str, default=None, help='Render using this template')
+@click.option('--full', is_flag=True, help='Recompute reports even if their inputs did not change')
 @with_buchfink_db
 def report_(
     buchfink_db: BuchfinkDB,
@@ -631,6 +770,7 @@ def report_(
     render_only,
     progress: bool,
     vcs_check: bool,
+    full: bool,
 ):
     "Generate reports for all active report configs and output overview table"
 
@@ -689,10 +829,24 @@ def report_(
         ', '.join([report_.name for report_ in reports]),
     )
 
+    # All reports share the loaded trades and actions, up to the latest report end
+    account_events = AccountEvents(
+        buchfink_db,
+        end_ts=max((report_.to_dt.timestamp() for report_ in reports), default=None),
+        assets=limit_assets,
+    )
+
     for _report in track(reports, description='Generating reports', disable=not progress):
         name = str(_report.name)
         if not render_only:
-            results[name] = run_report(buchfink_db, accounts, _report, limit_assets=limit_assets)
+            results[name] = run_report(
+                buchfink_db,
+                accounts,
+                _report,
+                limit_assets=limit_assets,
+                full=full,
+                account_events=account_events,
+            )
         if _report.template:
             render_report(buchfink_db, _report)
 
@@ -794,7 +948,7 @@ def quote(
     a_usd = buchfink_db.get_asset_by_symbol('USD')
 
     ds_timestamp = deserialize_timestamp(timestamp) if timestamp else None
-    historian = PriceHistorian()
+    historian = buchfink_db.historian
 
     for symbol in asset:
         try:
@@ -850,22 +1004,7 @@ def cache(buchfink_db: BuchfinkDB, asset: Tuple[str], base_asset_: Optional[str]
 def explore(buchfink_db: BuchfinkDB, keyword, external):
     "Show block explorer for account"
 
-    if external:
-        accounts = [account_from_string(ext, buchfink_db) for ext in external]
-    else:
-        accounts = buchfink_db.get_all_accounts()
-
-    # TODO: This should move to BuchfinkDB.get_accounts()
-    if keyword is not None:
-        if keyword.startswith('/') and keyword.endswith('/'):
-            keyword_re = re.compile(keyword[1:-1])
-            accounts = [acc for acc in accounts if keyword_re.search(acc.name)]
-        else:
-            accounts = [acc for acc in accounts if keyword in acc.name]
-
-    logger.info(
-        'Collected %d account(s): %s', len(accounts), ', '.join([acc.name for acc in accounts])
-    )
+    accounts = _get_accounts(buchfink_db, external=external, keyword=keyword)
 
     if len(accounts) == 0:
         click.echo(click.style('No accounts selected', fg='red'))
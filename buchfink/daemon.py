@@ -0,0 +1,198 @@
+"""
+A small local daemon that keeps a warm BuchfinkDB around.
+
+Setting up BuchfinkDB (config parsing, GlobalDB, update checks, rpc node sync,
+...) takes seconds, which dominates short commands. `buchfink serve` keeps one
+instance open and listens on a Unix socket next to the rotki cache. CLI
+invocations for the same config forward their arguments to it and print the
+captured output, falling back to a cold start if no daemon is running.
+
+The protocol is one JSON request and one JSON response per connection.
+Forwarded commands run without input, anything that reads from stdin or
+prompts sees end of file.
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import traceback
+from pathlib import Path
+from typing import List, Optional
+
+import click
+
+from buchfink.db import BuchfinkDB
+
+logger = logging.getLogger(__name__)
+
+SOCKET_NAME = 'daemon.sock'
+
+
+def get_socket_path(config_file) -> Path:
+    return Path(config_file).absolute().parent / '.buchfink' / SOCKET_NAME
+
+
+def _recv_json(sock: socket.socket) -> dict:
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def forward_to_daemon(config_file, args: List[str], color: bool) -> Optional[dict]:
+    """
+    Runs a CLI invocation on the daemon for `config_file`, if one is running.
+
+    Returns the daemon response (stdout, stderr, exit_code) or None if the
+    command should be run locally instead.
+    """
+    socket_path = get_socket_path(config_file)
+    if not socket_path.exists():
+        return None
+
+    request = {
+        'config': str(Path(config_file).absolute()),
+        'cwd': os.getcwd(),
+        'args': args,
+        'color': color,
+    }
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps(request).encode('utf-8'))
+            sock.shutdown(socket.SHUT_WR)
+            response = _recv_json(sock)
+    except (ConnectionRefusedError, FileNotFoundError):
+        logger.debug('Stale daemon socket at %s, running locally', socket_path)
+        return None
+
+    if 'error' in response:
+        logger.debug('Daemon declined request: %s', response['error'])
+        return None
+
+    return response
+
+
+class BuchfinkDaemon(socketserver.UnixStreamServer):
+    """
+    Serves one request at a time, BuchfinkDB is not safe to share between threads.
+    """
+
+    def __init__(self, config_file, cli: click.Group):
+        self.config_file = Path(config_file).absolute()
+        self.cli = cli
+        self.buchfink_db = None  # type: Optional[BuchfinkDB]
+        self.config_mtime = None  # type: Optional[int]
+        self.socket_path = get_socket_path(self.config_file)
+        self.get_buchfink_db()
+
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+        # Create the socket accessible to the current user only, chmod() after
+        # bind() would leave a window in which others can connect
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(str(self.socket_path), DaemonRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def get_buchfink_db(self) -> BuchfinkDB:
+        mtime = self.config_file.stat().st_mtime_ns
+        if self.buchfink_db is None or mtime != self.config_mtime:
+            if self.buchfink_db is not None:
+                logger.info('Config changed, reloading %s', self.config_file)
+                self.buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
+            self.buchfink_db = BuchfinkDB(str(self.config_file))
+            self.config_mtime = mtime
+        return self.buchfink_db
+
+    def run_command(self, args: List[str], cwd: str, color: bool) -> dict:
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exit_code = 0
+        old_cwd = os.getcwd()
+        old_stdin = sys.stdin
+
+        # The command installs logging for its --log-level, which must not
+        # stick to the daemon
+        root_logger = logging.getLogger('')
+        old_log_level = root_logger.level
+        old_log_handlers = list(root_logger.handlers)
+
+        buchfink_db = self.get_buchfink_db()
+        # Current prices are only valid for a single command
+        buchfink_db.clear_usd_prices()
+
+        try:
+            os.chdir(cwd)
+            sys.stdin = io.StringIO()
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    self.cli.main(
+                        args,
+                        prog_name='buchfink',
+                        standalone_mode=False,
+                        obj={'BUCHFINK_DB': buchfink_db},
+                        color=color,
+                    )
+                except click.ClickException as exc:
+                    exc.show()
+                    exit_code = exc.exit_code
+                except click.Abort:
+                    click.echo('Aborted!', err=True)
+                    exit_code = 1
+                except SystemExit as exc:
+                    exit_code = exc.code if isinstance(exc.code, int) else 1
+                except Exception:  # pylint: disable=broad-except
+                    traceback.print_exc()
+                    exit_code = 1
+        finally:
+            os.chdir(old_cwd)
+            sys.stdin = old_stdin
+            root_logger.setLevel(old_log_level)
+            root_logger.handlers[:] = old_log_handlers
+
+        return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'exit_code': exit_code}
+
+    def server_close(self):
+        super().server_close()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        if self.buchfink_db is not None:
+            self.buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
+            self.buchfink_db = None
+
+
+class DaemonRequestHandler(socketserver.BaseRequestHandler):
+    server: BuchfinkDaemon
+
+    def handle(self):
+        request = _recv_json(self.request)
+
+        if Path(request['config']) != self.server.config_file:
+            response = {'error': 'daemon serves {0}'.format(self.server.config_file)}
+        else:
+            logger.info('Running: buchfink %s', ' '.join(request['args']))
+            response = self.server.run_command(
+                request['args'], request['cwd'], request.get('color', False)
+            )
+
+        self.request.sendall(json.dumps(response).encode('utf-8'))
+
+
+def serve(config_file, cli: click.Group):
+    with BuchfinkDaemon(config_file, cli) as daemon:
+        logger.info('Listening on %s', daemon.socket_path)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -1,13 +1,28 @@
+import hashlib
+import importlib.metadata
+import json
 import logging
 import operator
-import os
-import os.path
 import sys
-from functools import reduce
+from datetime import datetime, timezone
+from functools import cached_property, reduce
 from pathlib import Path
-from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
-import yaml
+import gevent
+from gevent.lock import BoundedSemaphore, RLock
+from gevent.pool import Pool
 from rotkehlchen.accounting.accountant import Accountant
 from rotkehlchen.accounting.structures.types import ActionType
 from rotkehlchen.assets.resolver import AssetResolver
@@ -60,7 +75,7 @@ from rotkehlchen.externalapis.cryptocompare import Cryptocompare
 from rotkehlchen.externalapis.defillama import Defillama
 from rotkehlchen.globaldb.handler import GlobalDBHandler
 from rotkehlchen.globaldb.manual_price_oracles import ManualCurrentOracle
-from rotkehlchen.globaldb.updates import AssetsUpdater
+from rotkehlchen.globaldb.updates import ASSETS_VERSION_KEY, AssetsUpdater
 from rotkehlchen.greenlets.manager import GreenletManager
 from rotkehlchen.history.price import PriceHistorian
 from rotkehlchen.history.types import HistoricalPrice, HistoricalPriceOracle
@@ -82,6 +97,14 @@ from rotkehlchen.types import (
 from rotkehlchen.user_messages import MessagesAggregator
 from rotkehlchen.utils.misc import ts_now
 
+from buchfink.classification import (
+    BUNDLED_RULES_PATH,
+    ClassificationCache,
+    RuleHandler,
+    compile_rules,
+    load_rules,
+    ruleset_hash,
+)
 from buchfink.datatypes import (
     Asset,
     BalanceSheet,
@@ -94,24 +117,30 @@ from buchfink.datatypes import (
     Nfts,
     Trade,
 )
+from buchfink.event_store import EventStore
 from buchfink.exceptions import InputError, UnknownAsset
 from buchfink.models import (
     Account,
+    ClassificationRule,
     Config,
     ExchangeAccountConfig,
     HistoricalPriceConfig,
     ReportConfig,
 )
-from buchfink.models.account import accounts_from_config
+from buchfink.models.account import accounts_from_config, filter_accounts
 from buchfink.serialization import (
+    clear_asset_cache,
     deserialize_asset,
     deserialize_balance,
     deserialize_event,
     deserialize_evm_token,
     deserialize_identifier,
     deserialize_trade,
+    raw_item_has_asset,
+    raw_item_is_after,
     serialize_balances,
 )
+from buchfink.storage import dump_yaml, load_yaml
 
 if TYPE_CHECKING:
     from .datatypes import Balance  # noqa: F401
@@ -120,6 +149,41 @@ logger = logging.getLogger(__name__)
 
 PREMIUM_ONLY_ETH_MODULES = ['adex']
 ENABLE_DATA_MIGRATION = False
+RECEIPT_BATCH_SIZE = 100
+RECEIPT_QUERY_CONCURRENCY = 8
+PRICE_QUERY_CONCURRENCY = 8
+
+# Names of the files that trades and actions are split into, see `ledger_partitions`
+LEDGER_PARTITION_FORMATS = {'year': '%Y', 'month': '%Y-%m'}
+
+
+def _partition_start(name: str) -> Optional[float]:
+    "Returns the start of the period that a partition file is named after"
+    for partition_format in LEDGER_PARTITION_FORMATS.values():
+        try:
+            start = datetime.strptime(name, partition_format)
+        except ValueError:
+            continue
+        return start.replace(tzinfo=timezone.utc).timestamp()
+    return None
+
+
+def _package_version(name: str) -> str:
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def _has_asset(entry: Union[Trade, HistoryBaseEntry], identifiers: Set[str]) -> bool:
+    "Whether a trade buys or sells, or an action has, one of the assets with `identifiers`"
+    if isinstance(entry, Trade):
+        return (
+            entry.base_asset.identifier in identifiers
+            or entry.quote_asset.identifier in identifiers
+        )
+    return entry.asset.identifier in identifiers
+
 
 if __debug__:
     add_logging_level('TRACE', TRACE)
@@ -137,13 +201,25 @@ class BuchfinkDB(DBHandler):
     def __init__(self, config_file: str = './buchfink.yaml'):
         self.config_file = Path(config_file)
 
-        with open(self.config_file, 'r') as cfg:
-            yaml_config = yaml.load(cfg, Loader=yaml.SafeLoader)
+        yaml_config = load_yaml(self.config_file)
 
         self.data_directory = self.config_file.parent
         self.config = Config(**yaml_config)
         self.accounts = accounts_from_config(self.config)  # type: List[Account]
+
+        # Account indexes, the type and tag indexes hold positions in self.accounts
+        self._accounts_by_name = {}  # type: Dict[str, Account]
+        self._account_positions_by_type = {}  # type: Dict[str, List[int]]
+        self._account_positions_by_tag = {}  # type: Dict[str, List[int]]
+        for position, account in enumerate(self.accounts):
+            self._accounts_by_name.setdefault(account.name, account)
+            self._account_positions_by_type.setdefault(account.account_type, []).append(position)
+            for tag in account.tags:
+                self._account_positions_by_tag.setdefault(tag, []).append(position)
         self._active_eth_address = None  # type: Optional[ChecksumEvmAddress]
+        # Held while rotki works with the chain accounts of a single account,
+        # see get_blockchain_accounts(). Other greenlets must not switch them.
+        self.chain_state_lock = RLock()
 
         # Buchfink directories, these include the YAML storage and the reports
         # etc. Basically these are the ones you want version-controlled.
@@ -188,6 +264,8 @@ class BuchfinkDB(DBHandler):
             globaldb=self.globaldb,
             constant_assets=set(),
         )
+        # Resolved assets of a previously opened global DB are not valid anymore
+        clear_asset_cache()
         self.assets_updater = AssetsUpdater(self.msg_aggregator)
 
         self.data_updater = RotkiDataUpdater(msg_aggregator=self.msg_aggregator, user_db=self)
@@ -199,17 +277,11 @@ class BuchfinkDB(DBHandler):
         self.defillama = Defillama(
             database=self,
         )
+        self._common_abis_initialized = False
 
-        self.inquirer = Inquirer(
-            data_dir=self.cache_directory / 'inquirer',
-            cryptocompare=self.cryptocompare,
-            coingecko=self.coingecko,
-            manualcurrent=ManualCurrentOracle(),
-            msg_aggregator=self.msg_aggregator,
-            defillama=self.defillama,
-        )
-        # Initialize EVM Contracts common abis
-        EvmContracts.initialize_common_abis()
+        # Current USD prices are queried once per asset and command, see get_usd_price()
+        self._usd_prices = {}  # type: Dict[Asset, FVal]
+        self.price_snapshot_file = self.cache_directory / 'price_snapshot.json'
 
         # After calling the parent constructor, we will have a db connection.
         super().__init__(
@@ -234,51 +306,136 @@ class BuchfinkDB(DBHandler):
             self.migration_manager = DataMigrationManager(FakeRotki())  # type: ignore
             self.migration_manager.maybe_migrate_data()
 
-        self.data_updater.check_for_updates()
+        # Checking for rotki data updates and rebuilding the rpc node table
+        # requires network access and write transactions. Only do that if the
+        # config changed or the update check is due.
+        self.startup_state_file = self.cache_directory / 'startup_state.json'
+        startup_state = self.get_startup_state()
+        now = ts_now()
+        checked_for_updates = False
 
-        self.sync_rpc_nodes()
+        if now - startup_state.get('last_update_check', 0) >= (
+            self.config.settings.update_check_interval
+        ):
+            self.data_updater.check_for_updates()
+            startup_state['last_update_check'] = now
+            checked_for_updates = True
+
+        # Updates may have changed the default rpc nodes in the global DB
+        rpc_nodes_fingerprint = self.get_rpc_nodes_fingerprint()
+        if (
+            checked_for_updates
+            or startup_state.get('rpc_nodes_fingerprint') != rpc_nodes_fingerprint
+            or not self.has_rpc_nodes()
+        ):
+            self.sync_rpc_nodes()
+            startup_state['rpc_nodes_fingerprint'] = rpc_nodes_fingerprint
+
+        self.write_startup_state(startup_state)
         # ethereum_nodes = self.get_rpc_nodes(SupportedBlockchain.ETHEREUM, only_active=True)
 
-        # Initialize blockchain querying modules
-        self.ethereum_inquirer = EthereumInquirer(
-            greenlet_manager=self.greenlet_manager, database=self
-        )
-        self.ethereum_manager = EthereumManager(self.ethereum_inquirer)
-        self.optimism_inquirer = OptimismInquirer(
-            greenlet_manager=self.greenlet_manager,
-            database=self,
-        )
-        self.optimism_manager = OptimismManager(self.optimism_inquirer)
-        self.polygon_pos_inquirer = PolygonPOSInquirer(
-            greenlet_manager=self.greenlet_manager,
-            database=self,
-        )
-        self.polygon_pos_manager = PolygonPOSManager(self.polygon_pos_inquirer)
-        self.scroll_inquirer = ScrollInquirer(
-            greenlet_manager=self.greenlet_manager,
-            database=self,
-        )
-        self.zksync_lite_manager = ZksyncLiteManager(
-            ethereum_inquirer=self.ethereum_inquirer,
-            database=self,
-        )
-        self.scroll_manager = ScrollManager(self.scroll_inquirer)
-        self.arbitrum_one_inquirer = ArbitrumOneInquirer(
-            greenlet_manager=self.greenlet_manager,
-            database=self,
-        )
-        self.arbitrum_one_manager = ArbitrumOneManager(self.arbitrum_one_inquirer)
-        self.base_inquirer = BaseInquirer(
-            greenlet_manager=self.greenlet_manager,
-            database=self,
-        )
-        self.base_manager = BaseManager(self.base_inquirer)
-        self.gnosis_inquirer = GnosisInquirer(
-            greenlet_manager=self.greenlet_manager,
-            database=self,
-        )
-        self.gnosis_manager = GnosisManager(self.gnosis_inquirer)
-        self.kusama_manager = SubstrateManager(
+    def __del__(self) -> None:
+        try:
+            super().__del__()
+        except NameError:
+            # This weird construction is present because rotki used "open" in
+            # the __del__ method, while Python is shutting down and "open" is
+            # no longer available. So, ignore any NameError IF Python is shutting
+            # down (sys.meta_path is None)
+            if sys.meta_path is not None:
+                raise
+        except AttributeError:
+            # We swallow AttributeError here, because it occurs when self doesn't
+            # have a `conn` attribute, i.e. we did not properly initialize. We want
+            # to see the original error, and not the AttributeError in this case.
+            pass
+
+    # Blockchain querying modules, the tx decoder and the price oracles are
+    # expensive to set up and most commands (list, format, events, ...) never
+    # touch them. They are built on first access instead of in __init__.
+
+    def _init_common_abis(self) -> None:
+        if not self._common_abis_initialized:
+            # The EVM inquirers expect the Inquirer singleton to be around
+            _ = self._price_inquirer
+            EvmContracts.initialize_common_abis()
+            self._common_abis_initialized = True
+
+    def _init_price_oracles(self) -> None:
+        # Rotki reaches for the Inquirer and PriceHistorian singletons directly,
+        # so they have to be set up before we hand out any rotki objects.
+        _ = (self.inquirer, self.historian)
+
+    @cached_property
+    def ethereum_inquirer(self) -> EthereumInquirer:
+        self._init_common_abis()
+        return EthereumInquirer(greenlet_manager=self.greenlet_manager, database=self)
+
+    @cached_property
+    def ethereum_manager(self) -> EthereumManager:
+        return EthereumManager(self.ethereum_inquirer)
+
+    @cached_property
+    def optimism_inquirer(self) -> OptimismInquirer:
+        self._init_common_abis()
+        return OptimismInquirer(greenlet_manager=self.greenlet_manager, database=self)
+
+    @cached_property
+    def optimism_manager(self) -> OptimismManager:
+        return OptimismManager(self.optimism_inquirer)
+
+    @cached_property
+    def polygon_pos_inquirer(self) -> PolygonPOSInquirer:
+        self._init_common_abis()
+        return PolygonPOSInquirer(greenlet_manager=self.greenlet_manager, database=self)
+
+    @cached_property
+    def polygon_pos_manager(self) -> PolygonPOSManager:
+        return PolygonPOSManager(self.polygon_pos_inquirer)
+
+    @cached_property
+    def scroll_inquirer(self) -> ScrollInquirer:
+        self._init_common_abis()
+        return ScrollInquirer(greenlet_manager=self.greenlet_manager, database=self)
+
+    @cached_property
+    def scroll_manager(self) -> ScrollManager:
+        return ScrollManager(self.scroll_inquirer)
+
+    @cached_property
+    def zksync_lite_manager(self) -> ZksyncLiteManager:
+        return ZksyncLiteManager(ethereum_inquirer=self.ethereum_inquirer, database=self)
+
+    @cached_property
+    def arbitrum_one_inquirer(self) -> ArbitrumOneInquirer:
+        self._init_common_abis()
+        return ArbitrumOneInquirer(greenlet_manager=self.greenlet_manager, database=self)
+
+    @cached_property
+    def arbitrum_one_manager(self) -> ArbitrumOneManager:
+        return ArbitrumOneManager(self.arbitrum_one_inquirer)
+
+    @cached_property
+    def base_inquirer(self) -> BaseInquirer:
+        self._init_common_abis()
+        return BaseInquirer(greenlet_manager=self.greenlet_manager, database=self)
+
+    @cached_property
+    def base_manager(self) -> BaseManager:
+        return BaseManager(self.base_inquirer)
+
+    @cached_property
+    def gnosis_inquirer(self) -> GnosisInquirer:
+        self._init_common_abis()
+        return GnosisInquirer(greenlet_manager=self.greenlet_manager, database=self)
+
+    @cached_property
+    def gnosis_manager(self) -> GnosisManager:
+        return GnosisManager(self.gnosis_inquirer)
+
+    @cached_property
+    def kusama_manager(self) -> SubstrateManager:
+        return SubstrateManager(
             chain=SupportedBlockchain.KUSAMA,
             msg_aggregator=self.msg_aggregator,
             greenlet_manager=self.greenlet_manager,
@@ -286,7 +443,10 @@ class BuchfinkDB(DBHandler):
             connect_on_startup=False,
             own_rpc_endpoint=self.get_settings().ksm_rpc_endpoint,
         )
-        self.polkadot_manager = SubstrateManager(
+
+    @cached_property
+    def polkadot_manager(self) -> SubstrateManager:
+        return SubstrateManager(
             chain=SupportedBlockchain.POLKADOT,
             msg_aggregator=self.msg_aggregator,
             greenlet_manager=self.greenlet_manager,
@@ -294,23 +454,60 @@ class BuchfinkDB(DBHandler):
             connect_on_startup=False,
             own_rpc_endpoint=self.get_settings().dot_rpc_endpoint,
         )
-        self.avalanche_manager = AvalancheManager(
+
+    @cached_property
+    def avalanche_manager(self) -> AvalancheManager:
+        return AvalancheManager(
             avaxrpc_endpoint='https://api.avax.network/ext/bc/C/rpc',
             msg_aggregator=self.msg_aggregator,
         )
-        self.eth_transactions = EthereumTransactions(
-            ethereum_inquirer=self.ethereum_inquirer, database=self
-        )
-        self.evm_tx_decoder = EthereumTransactionDecoder(
+
+    @cached_property
+    def eth_transactions(self) -> EthereumTransactions:
+        return EthereumTransactions(ethereum_inquirer=self.ethereum_inquirer, database=self)
+
+    @cached_property
+    def evm_tx_decoder(self) -> EthereumTransactionDecoder:
+        self._init_price_oracles()
+        return EthereumTransactionDecoder(
             database=self,
             ethereum_inquirer=self.ethereum_inquirer,
             transactions=self.eth_transactions,
             # msg_aggregator=self.msg_aggregator,
         )
 
-        self.uniswap_v2_oracle = UniswapV2Oracle(self.ethereum_inquirer)
-        self.uniswap_v3_oracle = UniswapV3Oracle(self.ethereum_inquirer)
-        self.historian = PriceHistorian(
+    @cached_property
+    def uniswap_v2_oracle(self) -> UniswapV2Oracle:
+        return UniswapV2Oracle(self.ethereum_inquirer)
+
+    @cached_property
+    def uniswap_v3_oracle(self) -> UniswapV3Oracle:
+        return UniswapV3Oracle(self.ethereum_inquirer)
+
+    @cached_property
+    def _price_inquirer(self) -> Inquirer:
+        return Inquirer(
+            data_dir=self.cache_directory / 'inquirer',
+            cryptocompare=self.cryptocompare,
+            coingecko=self.coingecko,
+            manualcurrent=ManualCurrentOracle(),
+            msg_aggregator=self.msg_aggregator,
+            defillama=self.defillama,
+        )
+
+    @cached_property
+    def inquirer(self) -> Inquirer:
+        inquirer = self._price_inquirer
+        inquirer.inject_evm_managers([(ChainID.ETHEREUM, self.ethereum_manager)])
+        inquirer.add_defi_oracles(
+            uniswap_v2=self.uniswap_v2_oracle, uniswap_v3=self.uniswap_v3_oracle
+        )
+        inquirer.set_oracles_order(self.get_settings().current_price_oracles)
+        return inquirer
+
+    @cached_property
+    def historian(self) -> PriceHistorian:
+        historian = PriceHistorian(
             self.cache_directory / 'history',
             self.cryptocompare,
             self.coingecko,
@@ -318,33 +515,48 @@ class BuchfinkDB(DBHandler):
             self.uniswap_v2_oracle,
             self.uniswap_v3_oracle,
         )
+        historian.set_oracles_order(self.get_settings().historical_price_oracles)
+        return historian
 
-        # if rpc_nodes:
-        #     self.ethereum_manager.connect_to_multiple_nodes(rpc_nodes)
+    @cached_property
+    def beaconchain(self) -> BeaconChain:
+        return BeaconChain(database=self, msg_aggregator=self.msg_aggregator)
 
-        self.inquirer.inject_evm_managers([(ChainID.ETHEREUM, self.ethereum_manager)])
-        Inquirer().add_defi_oracles(
-            uniswap_v2=self.uniswap_v2_oracle, uniswap_v3=self.uniswap_v3_oracle
+    @cached_property
+    def event_store(self) -> Optional[EventStore]:
+        "Compiled store of the YAML trades and actions, if enabled in the settings"
+        if not self.config.settings.event_store:
+            return None
+        # Custom tokens, rotki asset updates and new versions change how
+        # assets in the YAML files are resolved
+        salt = json.dumps(
+            {
+                'tokens': [token.dict() for token in self.config.tokens],
+                'versions': self.get_versions(),
+            },
+            sort_keys=True,
+        )
+        return EventStore(
+            self.cache_directory / 'events.sqlite',
+            salt=hashlib.sha256(salt.encode()).hexdigest(),
         )
-        self.inquirer.set_oracles_order(self.get_settings().current_price_oracles)
-        self.historian.set_oracles_order(self.get_settings().historical_price_oracles)
-        self.beaconchain = BeaconChain(database=self, msg_aggregator=self.msg_aggregator)
 
-    def __del__(self) -> None:
-        try:
-            super().__del__()
-        except NameError:
-            # This weird construction is present because rotki used "open" in
-            # the __del__ method, while Python is shutting down and "open" is
-            # no longer available. So, ignore any NameError IF Python is shutting
-            # down (sys.meta_path is None)
-            if sys.meta_path is not None:
-                raise
-        except AttributeError:
-            # We swallow AttributeError here, because it occurs when self doesn't
-            # have a `conn` attribute, i.e. we did not properly initialize. We want
-            # to see the original error, and not the AttributeError in this case.
-            pass
+    @cached_property
+    def classification_rule_specs(self) -> List[ClassificationRule]:
+        "Bundled classification rules, extended by the ones in buchfink.yaml"
+        return load_rules(BUNDLED_RULES_PATH) + list(self.config.classification_rules)
+
+    @cached_property
+    def classification_rules(self) -> Dict[Tuple[str, str], RuleHandler]:
+        return compile_rules(self.classification_rule_specs)
+
+    @cached_property
+    def classification_ruleset_hash(self) -> str:
+        return ruleset_hash(self.classification_rule_specs)
+
+    @cached_property
+    def classification_cache(self) -> ClassificationCache:
+        return ClassificationCache(self.cache_directory / 'classification.sqlite')
 
     def get_asset_by_symbol(self, symbol: str) -> Asset:
         # TODO: this indirection function could incorporate a custom mapping from yaml config
@@ -356,6 +568,42 @@ class BuchfinkDB(DBHandler):
     def get_all_accounts(self) -> List[Account]:
         return self.accounts
 
+    def get_account(self, name: str) -> Account:
+        try:
+            return self._accounts_by_name[name]
+        except KeyError:
+            raise ValueError('Unknown account: ' + name) from None
+
+    def get_accounts(
+        self,
+        keyword: Optional[str] = None,
+        exclude: Optional[str] = None,
+        account_type: Optional[str] = None,
+        tag: Optional[str] = None,
+    ) -> List[Account]:
+        "Returns the accounts matching all given filters, in the order of the config"
+        positions = None  # type: Optional[Set[int]]
+
+        if account_type is not None:
+            # Types match as substring, e.g. 'bitcoin' also selects 'bitcoincash' accounts
+            positions = {
+                position
+                for type_, type_positions in self._account_positions_by_type.items()
+                if account_type in type_
+                for position in type_positions
+            }
+
+        if tag is not None:
+            tagged = set(self._account_positions_by_tag.get(tag, []))
+            positions = tagged if positions is None else positions & tagged
+
+        accounts = (
+            self.accounts
+            if positions is None
+            else [self.accounts[position] for position in sorted(positions)]
+        )
+        return filter_accounts(accounts, keyword=keyword, exclude=exclude)
+
     def get_all_reports(self) -> Iterable[ReportConfig]:
         for report in self.config.reports:
             yield ReportConfig.from_config(report)
@@ -366,6 +614,9 @@ class BuchfinkDB(DBHandler):
         clean_settings.pop('external_services', None)
         clean_settings.pop('rpc_nodes', None)
         clean_settings.pop('ignored_assets', None)
+        clean_settings.pop('update_check_interval', None)
+        clean_settings.pop('event_store', None)
+        clean_settings.pop('ledger_partitions', None)
 
         # Remove None values
         for k in list(clean_settings):
@@ -404,6 +655,20 @@ class BuchfinkDB(DBHandler):
         start_ts: Optional[Timestamp] = None,
         end_ts: Optional[Timestamp] = None,
     ) -> List[Tuple[EvmTransaction, Optional[EvmTxReceipt]]]:
+        return list(
+            self.iter_eth_transactions(
+                account, with_receipts=with_receipts, start_ts=start_ts, end_ts=end_ts
+            )
+        )
+
+    def iter_eth_transactions(
+        self,
+        account: Account,
+        with_receipts: bool = False,
+        start_ts: Optional[Timestamp] = None,
+        end_ts: Optional[Timestamp] = None,
+    ) -> Iterator[Tuple[EvmTransaction, Optional[EvmTxReceipt]]]:
+        "Yields (tx, receipt) pairs ordered by timestamp, receipts are fetched as we go"
         assert account.account_type == 'ethereum'
         address = cast(ChecksumEvmAddress, account.address)
 
@@ -430,6 +695,7 @@ class BuchfinkDB(DBHandler):
             txs, txs_total_count = dbevmtx.get_evm_transactions_and_limit_info(
                 cursor=cursor,
                 filter_=EvmTransactionsFilterQuery.make(
+                    order_by_rules=[('timestamp', True)],
                     accounts=[EvmAccount(address, ChainID.ETHEREUM)],
                     from_ts=start_ts,
                     to_ts=end_ts,
@@ -438,17 +704,83 @@ class BuchfinkDB(DBHandler):
             )
             assert len(txs) == txs_total_count
 
-        result = []
-        for txn in txs:
-            receipt = None
-            if with_receipts:
-                receipt = self.eth_transactions.get_or_query_transaction_receipt(
-                    txn.tx_hash,
-                )
+        if not with_receipts:
+            yield from ((txn, None) for txn in txs)
+        else:
+            yield from self.iter_transaction_receipts(txs)
+
+    def get_cached_receipt_hashes(
+        self, tx_hashes: List[bytes], chain_id: ChainID = ChainID.ETHEREUM
+    ) -> Set[bytes]:
+        "Returns those of `tx_hashes` whose receipt is stored in the user DB"
+        if not tx_hashes:
+            return set()
+        with self.conn.read_ctx() as cursor:
+            cursor.execute(
+                'SELECT A.tx_hash FROM evm_transactions AS A '
+                'INNER JOIN evmtx_receipts AS B ON A.identifier = B.tx_id '
+                'WHERE A.chain_id = ? AND A.tx_hash IN ({})'.format(
+                    ', '.join(['?'] * len(tx_hashes))
+                ),
+                (chain_id.serialize_for_db(), *(bytes(tx_hash) for tx_hash in tx_hashes)),
+            )
+            return {bytes(row[0]) for row in cursor}
+
+    def iter_transaction_receipts(
+        self, txs: List[EvmTransaction]
+    ) -> Iterator[Tuple[EvmTransaction, Optional[EvmTxReceipt]]]:
+        """
+        Yields (tx, receipt) pairs in the order of `txs`.
+
+        Receipts that are already cached in the user DB are read locally, the
+        missing ones are queried in batches on greenlets, at most
+        RECEIPT_QUERY_CONCURRENCY at a time. Like everything else in rotki,
+        they share the database connection from a single thread. The next
+        batch is queried while the caller is still busy with the current one.
+        """
+        dbevmtx = DBEvmTx(self)
+        batches = [
+            txs[offset : offset + RECEIPT_BATCH_SIZE]
+            for offset in range(0, len(txs), RECEIPT_BATCH_SIZE)
+        ]
+        slots = BoundedSemaphore(RECEIPT_QUERY_CONCURRENCY)
+
+        def query_receipt(tx_hash):
+            with slots:
+                return self.eth_transactions.get_or_query_transaction_receipt(tx_hash)
 
-            result.append((txn, receipt))
+        def query_missing(batch):
+            cached = self.get_cached_receipt_hashes([txn.tx_hash for txn in batch])
+            return {
+                txn.tx_hash: gevent.spawn(query_receipt, txn.tx_hash)
+                for txn in batch
+                if bytes(txn.tx_hash) not in cached
+            }
+
+        pending = query_missing(batches[0]) if batches else {}
+        try:
+            for index, batch in enumerate(batches):
+                queried = pending
+                if index + 1 < len(batches):
+                    pending = query_missing(batches[index + 1])
+
+                receipts = {tx_hash: greenlet.get() for tx_hash, greenlet in queried.items()}
+                with self.conn.read_ctx() as cursor:
+                    result = [
+                        (
+                            txn,
+                            receipts[txn.tx_hash]
+                            if txn.tx_hash in receipts
+                            else dbevmtx.get_receipt(cursor, txn.tx_hash, ChainID.ETHEREUM),
+                        )
+                        for txn in batch
+                    ]
 
-        return result
+                yield from result
+        finally:
+            # If the caller stopped early or a query failed, let the queries
+            # that are still running finish their writes
+            gevent.joinall(list(pending.values()))
 
     def get_external_service_credentials(
         self,
@@ -476,6 +808,7 @@ class BuchfinkDB(DBHandler):
         #     # TODO: add, optimism_accounting_aggregator],
         # )
 
+        self._init_price_oracles()
         chains_aggregator = self.get_chains_aggregator(self.accounts)
 
         return Accountant(
@@ -490,7 +823,18 @@ class BuchfinkDB(DBHandler):
             return BlockchainAccounts(eth=[self._active_eth_address])
         return BlockchainAccounts()
 
-    def get_trades_from_file(self, trades_file) -> List[Trade]:
+    def get_trades_from_file(
+        self,
+        trades_file,
+        end_ts: Optional[float] = None,
+        assets: Optional[Iterable[Asset]] = None,
+    ) -> List[Trade]:
+        """
+        Reads the trades of a file. Trades after `end_ts` and, if `assets` is
+        given, trades that neither buy nor sell one of `assets` are skipped
+        before deserializing them.
+        """
+
         def safe_deserialize_trade(trade):
             try:
                 return deserialize_trade(trade)
@@ -498,37 +842,121 @@ class BuchfinkDB(DBHandler):
                 logger.warning('Ignoring trade with unknown asset: %s', trade)
                 return None
 
-        with open(trades_file, 'r') as trades_f:
-            exchange = yaml.load(trades_f, Loader=yaml.SafeLoader)
+        identifiers = {asset.identifier for asset in assets} if assets is not None else None
+
+        def is_relevant(trade):
+            if end_ts is not None and raw_item_is_after(trade, end_ts):
+                return False
+            return identifiers is None or raw_item_has_asset(trade, identifiers)
+
+        exchange = load_yaml(trades_file)
 
         return [
             ser_trade
-            for ser_trade in [safe_deserialize_trade(trade) for trade in exchange.get('trades', [])]
-            if ser_trade is not None
+            for ser_trade in [
+                safe_deserialize_trade(trade)
+                for trade in exchange.get('trades', [])
+                if is_relevant(trade)
+            ]
+            if ser_trade is not None and (identifiers is None or _has_asset(ser_trade, identifiers))
         ] + [
             ser_trade
             for ser_trade in [
                 safe_deserialize_trade(trade)
                 for trade in exchange.get('actions', [])
-                if 'buy' in trade or 'sell' in trade
+                if ('buy' in trade or 'sell' in trade) and is_relevant(trade)
             ]
-            if ser_trade is not None
+            if ser_trade is not None and (identifiers is None or _has_asset(ser_trade, identifiers))
         ]
 
-    def get_local_trades_for_account(self, account_name: Union[str, Account]) -> List[Trade]:
+    def get_ledger_partition(self, timestamp: float) -> Optional[str]:
+        "Returns the partition an entry at `timestamp` is written to, None if not partitioned"
+        partitions = self.config.settings.ledger_partitions
+        if partitions is None:
+            return None
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime(
+            LEDGER_PARTITION_FORMATS[partitions]
+        )
+
+    def get_ledger_files(
+        self, kind: str, account: Account, end_ts: Optional[float] = None
+    ) -> List[Path]:
+        """
+        Returns the files with the `kind` ('trades' or 'actions') of `account`:
+        `<kind>/<name>.yaml` and/or the partitions in `<kind>/<name>/`, oldest
+        first. Partitions that start after `end_ts` are left out. Earlier ones
+        are always returned, even for a period that starts later, because the
+        cost basis depends on all events before it.
+        """
+        directory = self.data_directory / kind
+        paths = []
+
+        single_file = directory / (account.name + '.yaml')
+        if single_file.exists():
+            paths.append(single_file)
+
+        partitions_directory = directory / account.name
+        if partitions_directory.is_dir():
+            partitions = []  # type: List[Tuple[float, str, Path]]
+            for path in partitions_directory.glob('*.yaml'):
+                start = _partition_start(path.stem)
+                if start is None or (end_ts is not None and start > end_ts):
+                    continue
+                partitions.append((start, path.stem, path))
+            paths.extend(path for _, _, path in sorted(partitions))
+
+        return paths
+
+    def get_local_trades_for_account(
+        self,
+        account_name: Union[str, Account],
+        end_ts: Optional[float] = None,
+        assets: Optional[Iterable[Asset]] = None,
+    ) -> List[Trade]:
+        """
+        Returns the trades of an account, except for those after `end_ts` and,
+        if `assets` is given, those that do not involve one of `assets`
+        """
         if isinstance(account_name, str):
-            account = [a for a in self.accounts if a.name == account_name][0]  # type: Account
+            account = self.get_account(account_name)
         else:
             account = account_name
 
-        trades_file = os.path.join(self.data_directory, 'trades', account.name + '.yaml')
+        identifiers = {asset.identifier for asset in assets} if assets is not None else None
+        trades = []  # type: List[Trade]
+        for trades_file in self.get_ledger_files('trades', account, end_ts):
+            if self.event_store is not None:
+                # The store keeps complete files, so entries are filtered afterwards
+                trades.extend(
+                    trade
+                    for trade in cast(
+                        List[Trade],
+                        self.event_store.get_entries(
+                            trades_file,
+                            'trades',
+                            lambda path=trades_file: self.get_trades_from_file(path),
+                        ),
+                    )
+                    if (end_ts is None or trade.get_timestamp() <= end_ts)
+                    and (identifiers is None or _has_asset(trade, identifiers))
+                )
+            else:
+                trades.extend(self.get_trades_from_file(trades_file, end_ts=end_ts, assets=assets))
 
-        if os.path.exists(trades_file):
-            return self.get_trades_from_file(trades_file)
+        return trades
 
-        return []
+    def get_actions_from_file(
+        self,
+        actions_file,
+        include_trades=True,
+        end_ts: Optional[float] = None,
+        assets: Optional[Iterable[Asset]] = None,
+    ) -> List[HistoryBaseEntry]:
+        """
+        Reads the actions of a file. Actions after `end_ts` and, if `assets` is
+        given, actions with other assets are skipped before deserializing them.
+        """
 
-    def get_actions_from_file(self, actions_file, include_trades=True) -> List[HistoryBaseEntry]:
         def safe_deserialize_event(action):
             if 'buy' in action or 'sell' in action:
                 # it is a Trade
@@ -537,32 +965,64 @@ class BuchfinkDB(DBHandler):
                 return deserialize_trade(action)
             return deserialize_event(action)
 
-        with open(actions_file, 'r') as actions_f:
-            exchange = yaml.load(actions_f, Loader=yaml.SafeLoader)
+        identifiers = {asset.identifier for asset in assets} if assets is not None else None
+
+        exchange = load_yaml(actions_file)
 
         return [
             ser_action
             for ser_action in [
-                safe_deserialize_event(action) for action in exchange.get('actions', [])
+                safe_deserialize_event(action)
+                for action in exchange.get('actions', [])
+                if (end_ts is None or not raw_item_is_after(action, end_ts))
+                and (identifiers is None or raw_item_has_asset(action, identifiers))
             ]
             if ser_action is not None
+            and (identifiers is None or _has_asset(ser_action, identifiers))
         ]
 
     def get_local_ledger_actions_for_account(
-        self, account_name: Union[str, Account]
+        self,
+        account_name: Union[str, Account],
+        end_ts: Optional[float] = None,
+        assets: Optional[Iterable[Asset]] = None,
     ) -> List[HistoryBaseEntry]:
+        """
+        Returns the actions of an account, except for those after `end_ts` and,
+        if `assets` is given, those that do not involve one of `assets`
+        """
         if isinstance(account_name, str):
-            account = [a for a in self.accounts if a.name == account_name][0]  # type: Account
+            account = self.get_account(account_name)
         else:
             account = account_name
 
-        actions_file = self.data_directory / f'actions/{account.name}.yaml'
-        if actions_file.exists():
-            return self.get_actions_from_file(actions_file)
+        identifiers = {asset.identifier for asset in assets} if assets is not None else None
+        actions = []  # type: List[HistoryBaseEntry]
+        for actions_file in self.get_ledger_files('actions', account, end_ts):
+            if self.event_store is not None:
+                # The store keeps complete files, so entries are filtered afterwards
+                actions.extend(
+                    action
+                    for action in cast(
+                        List[HistoryBaseEntry],
+                        self.event_store.get_entries(
+                            actions_file,
+                            'actions',
+                            lambda path=actions_file: self.get_actions_from_file(path),
+                        ),
+                    )
+                    if (end_ts is None or action.get_timestamp() <= end_ts)
+                    and (identifiers is None or _has_asset(action, identifiers))
+                )
+            else:
+                actions.extend(
+                    self.get_actions_from_file(actions_file, end_ts=end_ts, assets=assets)
+                )
 
-        return []
+        return actions
 
     def get_chains_aggregator(self, accounts: List[Account]) -> ChainsAggregator:
+        self._init_price_oracles()
         accs = {}  # type: ignore
 
         for account in accounts:
@@ -619,12 +1079,14 @@ class BuchfinkDB(DBHandler):
         return chains_aggregator
 
     def get_exchange(self, account: str) -> ExchangeInterface:
-        account_ = [a for a in self.accounts if a.name == account][0]
+        account_ = self.get_account(account)
         account_config = account_.config
 
         if not isinstance(account_config, ExchangeAccountConfig):
             raise ValueError('Not an exchange account: ' + account)
 
+        self._init_price_oracles()
+
         exchange_opts = {
             'name': account_config.name,
             'api_key': str(account_config.api_key),
@@ -674,32 +1136,37 @@ class BuchfinkDB(DBHandler):
             raise RuntimeError(error)
 
         if account.account_type == 'ethereum':
-            manager = self.get_chains_aggregator([account])
+            with self.chain_state_lock:
+                manager = self.get_chains_aggregator([account])
 
-            ethereum_tokens = self.ethereum_manager.tokens
-            ethereum_tokens.detect_tokens(
-                only_cache=False,
-                addresses=[account.address],
-            )
+                ethereum_tokens = self.ethereum_manager.tokens
+                ethereum_tokens.detect_tokens(
+                    only_cache=False,
+                    addresses=[account.address],
+                )
 
-            # This is a little hack because query_balances sometimes hooks back
-            # into out get_blockchain_accounts() without providing context (for
-            # example from makerdao module).
-            self._active_eth_address = account.address
-            manager.query_balances(blockchain=SupportedBlockchain.ETHEREUM)
-            self._active_eth_address = None
+                # This is a little hack because query_balances sometimes hooks back
+                # into out get_blockchain_accounts() without providing context (for
+                # example from makerdao module).
+                self._active_eth_address = account.address
+                try:
+                    manager.query_balances(blockchain=SupportedBlockchain.ETHEREUM)
+                finally:
+                    self._active_eth_address = None
 
             return reduce(operator.add, manager.balances.eth.values())
 
         if account.account_type == 'bitcoin':
-            manager = self.get_chains_aggregator([account])
-            manager.query_balances(blockchain=SupportedBlockchain.BITCOIN)
+            with self.chain_state_lock:
+                manager = self.get_chains_aggregator([account])
+                manager.query_balances(blockchain=SupportedBlockchain.BITCOIN)
             btc = Asset('BTC')
             return BalanceSheet(assets={btc: reduce(operator.add, manager.balances.btc.values())})
 
         if account.account_type == 'bitcoincash':
-            manager = self.get_chains_aggregator([account])
-            manager.query_balances(blockchain=SupportedBlockchain.BITCOIN_CASH)
+            with self.chain_state_lock:
+                manager = self.get_chains_aggregator([account])
+                manager.query_balances(blockchain=SupportedBlockchain.BITCOIN_CASH)
             bch = Asset('BCH')
             return BalanceSheet(assets={bch: reduce(operator.add, manager.balances.bch.values())})
 
@@ -715,9 +1182,10 @@ class BuchfinkDB(DBHandler):
 
     def query_nfts(self, account: Account) -> List[Nfts]:
         if account.account_type == 'ethereum':
-            manager = self.get_chains_aggregator([account])
-            nfts = manager.get_module('nfts')
-            nft_result = nfts.get_all_info(addresses=[account.address], ignore_cache=True)
+            with self.chain_state_lock:
+                manager = self.get_chains_aggregator([account])
+                nfts = manager.get_module('nfts')
+                nft_result = nfts.get_all_info(addresses=[account.address], ignore_cache=True)
             if account.address in nft_result.addresses:
                 return nft_result.addresses[account.address]
         return []
@@ -727,7 +1195,7 @@ class BuchfinkDB(DBHandler):
         logger.debug('Balances for %s before annotations: %s', account.name, query_sheet)
         path = self.annotations_directory / (account.name + '.yaml')
         if path.exists():
-            query_sheet += self.get_balances_from_file(path)
+            query_sheet += self.get_balances_from_file(path, with_usd_value=False)
         self.write_balances(account, query_sheet)
 
     def get_balances(self, account: Account) -> BalanceSheet:
@@ -736,9 +1204,71 @@ class BuchfinkDB(DBHandler):
             return self.get_balances_from_file(path)
         return BalanceSheet(assets={}, liabilities={})
 
-    def get_balances_from_file(self, path) -> BalanceSheet:
-        with open(path, 'r') as account_f:
-            account = yaml.load(account_f, Loader=yaml.SafeLoader)
+    def get_balance_assets(self, account: Account) -> Set[Asset]:
+        "Returns the assets in the balances of an account, without valuing them"
+        path = self.balances_directory / (account.name + '.yaml')
+        if not path.exists():
+            return set()
+
+        contents = load_yaml(path) or {}
+        assets = set()
+        for balance in contents.get('assets', []) + contents.get('liabilities', []):
+            try:
+                assets.add(self.get_asset_by_symbol(balance['asset']))
+            except UnknownAsset:
+                continue
+        return assets
+
+    def get_usd_price(self, asset: Asset) -> FVal:
+        """
+        Returns the current USD price of `asset`, only the first call per
+        command queries it (see clear_usd_prices())
+        """
+        if asset in self._usd_prices:
+            return self._usd_prices[asset]
+
+        price = FVal(self.inquirer.find_usd_price(asset))
+        return self._usd_prices.setdefault(asset, price)
+
+    def prefetch_usd_prices(self, assets: Iterable[Asset]) -> None:
+        """
+        Queries the prices of all `assets` that are not known yet, concurrently
+        on greenlets, because the price oracles share rotki's DB connection
+        """
+        missing = [asset for asset in set(assets) if asset not in self._usd_prices]
+        if not missing:
+            return
+
+        self._init_price_oracles()
+        Pool(PRICE_QUERY_CONCURRENCY).map(self.get_usd_price, missing)
+
+    def clear_usd_prices(self) -> None:
+        "Forgets the prices of the current command, the next command queries them again"
+        self._usd_prices.clear()
+
+    def load_price_snapshot(self) -> bool:
+        "Uses the prices written by write_price_snapshot() instead of querying them"
+        try:
+            with open(self.price_snapshot_file, 'r') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        for identifier, price in snapshot['prices'].items():
+            self._usd_prices[Asset(identifier)] = FVal(price)
+        return True
+
+    def write_price_snapshot(self) -> None:
+        prices = {asset.identifier: str(price) for asset, price in self._usd_prices.items()}
+        with open(self.price_snapshot_file, 'w') as snapshot_file:
+            json.dump({'timestamp': ts_now(), 'prices': prices}, snapshot_file, indent=2)
+
+    def get_balances_from_file(self, path, with_usd_value: bool = True) -> BalanceSheet:
+        """
+        Reads a balance sheet. Pass `with_usd_value=False` if the balances are
+        not valued (e.g. they are only written back), this avoids any price query.
+        """
+        account = load_yaml(path)
 
         assets = {}  # type: Dict[Asset, Balance]
         liabilities = {}  # type: Dict[Asset, Balance]
@@ -746,7 +1276,7 @@ class BuchfinkDB(DBHandler):
         if 'assets' in account:
             for balance in account['assets']:
                 try:
-                    balance, asset = deserialize_balance(balance, self)
+                    balance, asset = deserialize_balance(balance, self, with_usd_value)
                 except UnknownAsset as e:
                     logger.warning(str(e))
                     continue
@@ -758,7 +1288,7 @@ class BuchfinkDB(DBHandler):
         if 'liabilities' in account:
             for balance in account['liabilities']:
                 try:
-                    balance, asset = deserialize_balance(balance, self)
+                    balance, asset = deserialize_balance(balance, self, with_usd_value)
                 except UnknownAsset as e:
                     logger.warning(str(e))
                     continue
@@ -773,10 +1303,8 @@ class BuchfinkDB(DBHandler):
         path = self.balances_directory / (account.name + '.yaml')
 
         try:
-            with path.open('r') as balances_file:
-                contents = yaml.load(balances_file, Loader=yaml.SafeLoader)
-                if contents is None:
-                    contents = {}
+            # Copy, the loaded document is shared via the storage cache
+            contents = dict(load_yaml(path) or {})
         except FileNotFoundError:
             contents = {}
 
@@ -789,7 +1317,7 @@ class BuchfinkDB(DBHandler):
             if not balances.assets and 'assets' in contents:
                 del contents['assets']
 
-            yaml.dump(contents, stream=balances_file, sort_keys=False, width=-1)
+            dump_yaml(contents, stream=balances_file)
 
     def update_used_query_range(
         self, write_cursor, name: str, start_ts: Timestamp, end_ts: Timestamp
@@ -819,6 +1347,7 @@ class BuchfinkDB(DBHandler):
 
     def perform_assets_updates(self):
         self.assets_updater.perform_update(None, None)
+        clear_asset_cache()
 
         try:
             update_spam_assets(db=self, assets_info=[])
@@ -827,6 +1356,33 @@ class BuchfinkDB(DBHandler):
 
         self.sync_config_assets()
 
+    def get_versions(self) -> Dict[str, str]:
+        "Versions of the code and asset data that entries and reports are derived with"
+        return {
+            'buchfink': _package_version('buchfink'),
+            'rotkehlchen': _package_version('rotkehlchen'),
+            'assets': str(self.globaldb.get_setting_value(ASSETS_VERSION_KEY, 0)),
+        }
+
+    def get_startup_state(self) -> dict:
+        try:
+            with open(self.startup_state_file, 'r') as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def write_startup_state(self, state: dict) -> None:
+        with open(self.startup_state_file, 'w') as state_file:
+            json.dump(state, state_file)
+
+    def get_rpc_nodes_fingerprint(self) -> str:
+        rpc_nodes = [node.dict() for node in self.config.settings.rpc_nodes or []]
+        return hashlib.sha256(json.dumps(rpc_nodes, sort_keys=True).encode()).hexdigest()
+
+    def has_rpc_nodes(self) -> bool:
+        with self.conn.read_ctx() as cursor:
+            return cursor.execute('SELECT COUNT(*) FROM rpc_nodes').fetchone()[0] > 0
+
     def sync_rpc_nodes(self):
         "Ensures that the database matches the config file"
 
@@ -899,12 +1455,14 @@ class BuchfinkDB(DBHandler):
 
             except UnknownAsset:
                 self.globaldb.add_asset(evm_token)
+                clear_asset_cache()
                 try:
                     self.get_asset_by_symbol(evm_token.identifier)
                 except UnknownAsset as exc:
                     raise ValueError('Unable to add asset: ' + str(evm_token)) from exc
 
             self.asset_resolver.clean_memory_cache()
+            clear_asset_cache()
 
         with self.conn.read_ctx() as cursor:
             ignored_assets = self.get_ignored_asset_ids(cursor)
@@ -0,0 +1,252 @@
+"""
+Compiled store of the trades and events read from the YAML files.
+
+The YAML files stay the source of truth. Their deserialized entries are kept
+as typed rows in a SQLite database, together with the hash of the file they
+were read from, so unchanged files do not need to be parsed again.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from rotkehlchen.types import Location, deserialize_evm_tx_hash
+
+from .datatypes import (
+    Asset,
+    Balance,
+    EvmEvent,
+    FVal,
+    HistoryBaseEntry,
+    HistoryEvent,
+    HistoryEventSubType,
+    HistoryEventType,
+    Trade,
+    TradeType,
+)
+
+# Bump this whenever the layout of the entries table or the way that entries
+# are restored changes
+STORE_VERSION = 1
+
+Entry = Union[Trade, HistoryBaseEntry]
+Row = Tuple
+
+ENTRY_COLUMNS = (
+    'kind',
+    'timestamp',
+    'location',
+    'link',
+    'sequence_index',
+    'type',
+    'subtype',
+    'asset',
+    'amount',
+    'quote_asset',
+    'rate',
+    'fee',
+    'fee_asset',
+    'notes',
+    'counterparty',
+    'product',
+    'address',
+)
+
+
+def _optional_str(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+def _serialize_optional(value):
+    return value.serialize() if hasattr(value, 'serialize') else value
+
+
+def entry_to_row(entry: Entry) -> Row:
+    if isinstance(entry, Trade):
+        return (
+            'trade',
+            entry.timestamp,
+            entry.location.serialize(),
+            entry.link,
+            None,
+            entry.trade_type.serialize(),
+            None,
+            entry.base_asset.identifier,
+            str(entry.amount),
+            entry.quote_asset.identifier,
+            str(entry.rate),
+            _optional_str(entry.fee),
+            entry.fee_currency.identifier if entry.fee_currency is not None else None,
+            None,
+            None,
+            None,
+            None,
+        )
+
+    return (
+        'evm' if isinstance(entry, EvmEvent) else 'history',
+        entry.timestamp,
+        entry.location.serialize(),
+        entry.tx_hash.hex() if isinstance(entry, EvmEvent) else entry.event_identifier,
+        entry.sequence_index,
+        entry.event_type.serialize(),
+        entry.event_subtype.serialize(),
+        entry.asset.identifier,
+        str(entry.balance.amount),
+        None,
+        None,
+        None,
+        None,
+        entry.notes,
+        _serialize_optional(getattr(entry, 'counterparty', None)),
+        _serialize_optional(getattr(entry, 'product', None)),
+        _optional_str(getattr(entry, 'address', None)),
+    )
+
+
+def row_to_entry(row: Row) -> Entry:
+    (
+        kind,
+        timestamp,
+        location,
+        link,
+        sequence_index,
+        type_,
+        subtype,
+        asset,
+        amount,
+        quote_asset,
+        rate,
+        fee,
+        fee_asset,
+        notes,
+        counterparty,
+        product,
+        address,
+    ) = row
+
+    if kind == 'trade':
+        return Trade(
+            timestamp,
+            Location.deserialize(location),
+            Asset(asset),
+            Asset(quote_asset),
+            TradeType.deserialize(type_),
+            FVal(amount),
+            FVal(rate),
+            FVal(fee) if fee is not None else None,
+            Asset(fee_asset) if fee_asset is not None else None,
+            link,
+        )
+
+    if kind == 'evm':
+        return EvmEvent(
+            tx_hash=deserialize_evm_tx_hash(link),
+            sequence_index=sequence_index,
+            timestamp=timestamp,
+            location=Location.deserialize(location),
+            event_type=HistoryEventType.deserialize(type_),
+            event_subtype=HistoryEventSubType.deserialize(subtype),
+            asset=Asset(asset),
+            balance=Balance(FVal(amount), 0),
+            location_label=None,
+            notes=notes,
+            counterparty=counterparty,
+            product=product,
+            address=address,
+            identifier=None,
+            extra_data=None,
+        )
+
+    return HistoryEvent(
+        location=Location.deserialize(location),
+        event_identifier=link,
+        sequence_index=sequence_index,
+        timestamp=timestamp,
+        event_type=HistoryEventType.deserialize(type_),
+        event_subtype=HistoryEventSubType.deserialize(subtype),
+        asset=Asset(asset),
+        balance=Balance(FVal(amount), 0),
+        notes=notes,
+    )
+
+
+class EventStore:
+    """
+    Keeps the entries read from each YAML file, keyed by the file path and the
+    reader that produced them. `salt` is mixed into the file hashes, so that
+    anything else that influences the deserialization (e.g. custom tokens)
+    invalidates the stored entries as well.
+    """
+
+    def __init__(self, path: Path, salt: str = ''):
+        self.salt = '{0}:{1}'.format(STORE_VERSION, salt)
+        # Greenlets and threads share the connection (check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT NOT NULL, reader TEXT NOT NULL, digest TEXT NOT NULL, '
+            'PRIMARY KEY (path, reader))'
+        )
+        # timestamp has no declared type, so float timestamps of trades and int
+        # timestamps of events are returned as they were stored
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'path TEXT NOT NULL, reader TEXT NOT NULL, position INTEGER NOT NULL, '
+            'kind TEXT NOT NULL, timestamp NOT NULL, location TEXT NOT NULL, '
+            'link TEXT, sequence_index INTEGER, type TEXT, subtype TEXT, asset TEXT, '
+            'amount TEXT, quote_asset TEXT, rate TEXT, fee TEXT, fee_asset TEXT, '
+            'notes TEXT, counterparty TEXT, product TEXT, address TEXT, '
+            'PRIMARY KEY (path, reader, position))'
+        )
+        self._conn.commit()
+
+    def file_digest(self, path: Path) -> str:
+        digest = hashlib.sha256(self.salt.encode())
+        with open(path, 'rb') as yaml_file:
+            for chunk in iter(lambda: yaml_file.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_entries(
+        self, path: Path, reader: str, read_file: Callable[[], Sequence[Entry]]
+    ) -> List[Entry]:
+        """
+        Returns the entries of `path`. If the file changed since it was stored,
+        they are read with `read_file` and stored again.
+        """
+        key = str(Path(path).resolve())
+        digest = self.file_digest(path)
+
+        with self._lock:
+            stored = self._conn.execute(
+                'SELECT digest FROM files WHERE path = ? AND reader = ?', (key, reader)
+            ).fetchone()
+            if stored is not None and stored[0] == digest:
+                rows = self._conn.execute(
+                    'SELECT {0} FROM entries WHERE path = ? AND reader = ? '
+                    'ORDER BY position'.format(', '.join(ENTRY_COLUMNS)),
+                    (key, reader),
+                ).fetchall()
+                return [row_to_entry(row) for row in rows]
+
+        entries = list(read_file())
+
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM entries WHERE path = ? AND reader = ?', (key, reader))
+            self._conn.executemany(
+                'INSERT INTO entries VALUES ({0})'.format(', '.join(['?'] * 20)),
+                [
+                    (key, reader, position) + entry_to_row(entry)
+                    for position, entry in enumerate(entries)
+                ],
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (key, reader, digest)
+            )
+
+        return entries
@@ -1,6 +1,7 @@
 from .account import Account  # noqa: F401
 from .config import (
     AccountConfig,  # noqa: F401
+    ClassificationRule,  # noqa: F401
     Config,  # noqa: F401
     ExchangeAccountConfig,  # noqa: F401
     FetchConfig,  # noqa: F401
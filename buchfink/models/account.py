@@ -1,4 +1,5 @@
-from typing import List, Optional, Union, cast
+import re
+from typing import Iterable, List, Optional, Union, cast
 
 from pydantic import BaseModel
 from rotkehlchen.types import ChecksumEvmAddress
@@ -62,6 +63,30 @@ def accounts_from_config(config: Config) -> List[Account]:
     return [account_from_config(acc) for acc in config.accounts]
 
 
+def account_name_matches(name: str, pattern: str) -> bool:
+    "Matches `pattern` as a substring of `name`, or as a regex if it is enclosed in slashes"
+    if pattern.startswith('/') and pattern.endswith('/'):
+        return re.search(pattern[1:-1], name) is not None
+    return pattern in name
+
+
+def filter_accounts(
+    accounts: Iterable[Account],
+    keyword: Optional[str] = None,
+    exclude: Optional[str] = None,
+    account_type: Optional[str] = None,
+    tag: Optional[str] = None,
+) -> List[Account]:
+    return [
+        acc
+        for acc in accounts
+        if (keyword is None or account_name_matches(acc.name, keyword))
+        and (exclude is None or not account_name_matches(acc.name, exclude))
+        and (account_type is None or account_type in acc.account_type)
+        and (tag is None or tag in acc.tags)
+    ]
+
+
 def account_from_string(acc_def: str, buchfink_db=None) -> Account:
     if acc_def.lower().endswith('.eth'):
         if buchfink_db is None:
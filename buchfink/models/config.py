@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 from pydantic import BaseModel, Field
+from typing_extensions import Literal
 
 
 class FetchConfig(BaseModel):
@@ -93,6 +94,9 @@ class Settings(BaseModel):
     ignored_assets: List[str] = []
     ksm_rpc_endpoint: str = ''
     dot_rpc_endpoint: str = ''
+    update_check_interval: int = 86400
+    event_store: bool = False
+    ledger_partitions: Optional[Literal['year', 'month']] = None
 
 
 class AssetConfig(BaseModel):
@@ -113,11 +117,33 @@ class HistoricalPriceConfig(BaseModel):
     price: Optional[float]
 
 
+class ClassificationRule(BaseModel):
+    "Turns a matching receipt log into a single history event"
+
+    topic: str
+    contracts: List[str]
+    asset: str
+    chain_id: Optional[int] = None
+    event_type: str = 'receive'
+    event_subtype: str
+    notes: str = ''
+    # The amount is read from the log data, offset and length are in bytes
+    data_offset: int = 0
+    data_length: Optional[int] = None
+    decimals: int = 18
+    # Optional conditions: topic / 32 byte data word that has to be the account
+    account_topic: Optional[int] = None
+    account_word: Optional[int] = None
+    # Optional conditions: topic that has to hold (one of) the given values
+    topic_equals: Dict[int, Union[str, List[str]]] = {}
+
+
 class Config(BaseModel):
     accounts: List[AccountConfig] = []
     tokens: List[AssetConfig] = []
     reports: List[ReportConfigFromConfigFile] = []
     prices: List[HistoricalPriceConfig] = []
+    classification_rules: List[ClassificationRule] = []
     settings: Settings
 
 
@@ -1,10 +1,13 @@
 import datetime
+import hashlib
+import heapq
+import json
 import logging
 import os.path
 import re
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Literal, Optional, Union
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple, Union
 
 import yaml
 from jinja2 import Environment, FileSystemLoader
@@ -23,32 +26,223 @@ from buchfink.datatypes import (
     Trade,
 )
 from buchfink.db import BuchfinkDB
-from buchfink.serialization import deserialize_fval, deserialize_missing_price, serialize_fval
+from buchfink.serialization import (
+    deserialize_fval,
+    deserialize_missing_price,
+    serialize_fval,
+    serialize_trade,
+)
+from buchfink.storage import dump_yaml, load_yaml
 
 from .models import Account, ReportConfig
 
 logger = logging.getLogger(__name__)
 
+# Bump this whenever a change in Buchfink changes report results for the same
+# inputs, so that existing reports are not reused
+REPORT_INPUTS_VERSION = 1
+
+
+def report_inputs_hash(
+    buchfink_db: BuchfinkDB,
+    accounts: List[Account],
+    report_config: ReportConfig,
+    limit_assets: Optional[List[Asset]] = None,
+) -> str:
+    """
+    Returns a hash of everything a report is computed from: the report config,
+    buchfink.yaml (settings, tokens and manual prices), the versions of
+    Buchfink, rotki and its asset data and the files with the trades and
+    actions of `accounts` that the report reads. The files are hashed as they
+    are, without parsing them.
+    """
+    end_ts = report_config.to_dt.timestamp()
+    digest = hashlib.sha256()
+    header = {
+        'version': REPORT_INPUTS_VERSION,
+        'versions': buchfink_db.get_versions(),
+        'report': report_config.dict(),
+        'limit_assets': [asset.identifier for asset in limit_assets or []],
+    }
+    digest.update(json.dumps(header, sort_keys=True, default=str).encode())
+    digest.update(buchfink_db.config_file.read_bytes())
+
+    for account in accounts:
+        for key in ('trades', 'actions'):
+            for path in buchfink_db.get_ledger_files(key, account, end_ts):
+                digest.update(b'\0' + str(path).encode() + b'\0')
+                with open(path, 'rb') as ledger_file:
+                    for chunk in iter(lambda: ledger_file.read(1 << 20), b''):
+                        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _timestamp(act):
+    return act.get_timestamp()
+
+
+def _link_key(link: str) -> str:
+    "Normalizes a link or transaction hash, so that e.g. '0xAB' and 'ab' are the same key"
+    link = link.lower()
+    return link[2:] if link.startswith('0x') else link
+
+
+def find_duplicate_links(
+    events: Iterable[Union[Trade, HistoryBaseEntry]],
+) -> List[Dict[str, Any]]:
+    """
+    Finds trades that share their link with the transaction of an EVM event
+    (other than a gas fee). These might be unidentified duplicates, e.g. a swap
+    that was fetched as events and imported as a trade as well.
+
+    `events` is only iterated once. Apart from the found trades, only the
+    normalized transaction hashes are kept in memory.
+    """
+    event_counts = {}  # type: Dict[str, int]
+    linked_trades = {}  # type: Dict[str, List[Trade]]
+
+    for event in events:
+        if isinstance(event, EvmEvent):
+            if event.event_subtype == HistoryEventSubType.FEE and event.counterparty == 'gas':
+                continue
+            key = _link_key(event.tx_hash.hex())
+            event_counts[key] = event_counts.get(key, 0) + 1
+        elif isinstance(event, Trade) and event.link:
+            linked_trades.setdefault(_link_key(event.link), []).append(event)
+
+    return [
+        {
+            'link': trades[0].link,
+            'events': event_counts[key],
+            'trades': [serialize_trade(trade) for trade in trades],
+        }
+        for key, trades in linked_trades.items()
+        if key in event_counts
+    ]
+
+
+class AccountEvents:
+    """
+    Trades and actions of accounts, each sorted by time. The files of every
+    account are only loaded once, so several reports over the same accounts
+    share the work. Events after `end_ts` are not loaded at all, so it should
+    be the latest end of the reports that use this. Likewise, if `assets` is
+    given, only events that involve one of them are loaded.
+    """
+
+    def __init__(
+        self,
+        buchfink_db: BuchfinkDB,
+        end_ts: Optional[float] = None,
+        assets: Optional[List[Asset]] = None,
+    ):
+        self.buchfink_db = buchfink_db
+        self.end_ts = end_ts
+        self.assets = assets
+        self._events: Dict[str, Tuple[List[Trade], List[HistoryBaseEntry]]] = {}
+
+    def get(
+        self, accounts: List[Account], end_ts: Optional[float] = None
+    ) -> List[Tuple[List[Trade], List[HistoryBaseEntry]]]:
+        """
+        Returns the trades and actions of each account, except for those after
+        `end_ts`. These are not needed by a report that ends at `end_ts`.
+        """
+        buchfink_db = self.buchfink_db
+
+        if self.end_ts is not None and (end_ts is None or end_ts > self.end_ts):
+            raise ValueError('Events after {0} were not loaded'.format(self.end_ts))
+
+        for account in accounts:
+            if account.name in self._events:
+                continue
+
+            # With partitioned ledgers, partitions after `self.end_ts` are skipped
+            trades = buchfink_db.get_local_trades_for_account(
+                account, end_ts=self.end_ts, assets=self.assets
+            )
+            actions = buchfink_db.get_local_ledger_actions_for_account(
+                account, end_ts=self.end_ts, assets=self.assets
+            )
+
+            # Files are usually in order already, which makes this sort cheap
+            self._events[account.name] = (
+                sorted(trades, key=_timestamp),
+                sorted(actions, key=_timestamp),
+            )
+
+        events = [self._events[account.name] for account in accounts]
+        if end_ts is None or end_ts == self.end_ts:
+            return events
+
+        return [
+            (
+                [trade for trade in trades if _timestamp(trade) <= end_ts],
+                [action for action in actions if _timestamp(action) <= end_ts],
+            )
+            for trades, actions in events
+        ]
+
 
 def run_report(
     buchfink_db: BuchfinkDB,
     accounts: List[Account],
     report_config: ReportConfig,
     limit_assets: Optional[List[Asset]] = None,
+    full: bool = False,
+    account_events: Optional[AccountEvents] = None,
 ):
+    """
+    Runs the report for `accounts`. Pass the same `account_events` to several
+    reports to only load each account once.
+
+    If the inputs did not change since the report was last computed, the
+    existing report.yaml is returned instead, unless `full` is set.
+    """
     name = report_config.name
     start_ts = Timestamp(int(report_config.from_dt.timestamp()))
     end_ts = Timestamp(int(report_config.to_dt.timestamp()))
     num_matched_accounts = 0
     all_trades: List[Trade] = []
     all_actions: List[HistoryBaseEntry] = []
+    trade_streams: List[List[Trade]] = []
+    action_streams: List[List[HistoryBaseEntry]] = []
 
     root_logger = logging.getLogger('')
     formatter = logging.Formatter('%(levelname)s: %(message)s')
 
+    report_accounts = []  # type: List[Account]
+    for account in accounts:
+        num_matched_accounts += 1
+
+        if report_config.limit_accounts and account.name not in report_config.limit_accounts:
+            continue
+
+        if report_config.exclude_accounts and account.name in report_config.exclude_accounts:
+            continue
+
+        report_accounts.append(account)
+
     folder = buchfink_db.reports_directory / Path(name)
     folder.mkdir(exist_ok=True)
 
+    inputs_hash = report_inputs_hash(buchfink_db, report_accounts, report_config, limit_assets)
+    inputs_file = folder / 'inputs.sha256'
+    report_file_path = folder / 'report.yaml'
+    if (
+        not full
+        and report_file_path.exists()
+        and inputs_file.exists()
+        and inputs_file.read_text().strip() == inputs_hash
+    ):
+        logger.info('Inputs of report "%s" did not change, reusing %s', name, report_file_path)
+        return load_yaml(report_file_path)
+
+    # Only valid again once the report has been written completely
+    if inputs_file.exists():
+        inputs_file.unlink()
+
     logfile = folder / 'report.log'
     if logfile.exists():
         logfile.unlink()
@@ -67,24 +261,23 @@ def run_report(
 
     logger.info('Generating report "%s"...', name)
 
-    for account in accounts:
-        num_matched_accounts += 1
-
-        if report_config.limit_accounts and account.name not in report_config.limit_accounts:
-            continue
+    if limit_assets:
+        logger.info('Limiting report to assets: %s', limit_assets)
 
-        if report_config.exclude_accounts and account.name in report_config.exclude_accounts:
-            continue
+    if account_events is None:
+        account_events = AccountEvents(buchfink_db, end_ts=end_ts, assets=limit_assets)
 
-        all_trades.extend(buchfink_db.get_local_trades_for_account(account))
-        all_actions.extend(buchfink_db.get_local_ledger_actions_for_account(account))
+    for trades, actions in account_events.get(report_accounts, end_ts=end_ts):
+        if limit_assets:
+            trades = [
+                t for t in trades if t.base_asset in limit_assets or t.quote_asset in limit_assets
+            ]
+            actions = [a for a in actions if a.asset in limit_assets]
 
-    if limit_assets:
-        logger.info('Limiting report to assets: %s', limit_assets)
-        all_trades = [
-            t for t in all_trades if t.base_asset in limit_assets or t.quote_asset in limit_assets
-        ]
-        all_actions = [a for a in all_actions if a.asset in limit_assets]
+        trade_streams.append(trades)
+        action_streams.append(actions)
+        all_trades.extend(trades)
+        all_actions.extend(actions)
 
     logger.info(
         'Collected %d trades / %d actions from %d account(s)',
@@ -93,46 +286,27 @@ def run_report(
         num_matched_accounts,
     )
 
-    # Check if we have any trades or actions that share an event identifier
-    # with another trade or action. If so then we it might an unidentified
-    # duplicate and we should warn the user
-    action_ids = set()
-    for action in all_actions:
-        if isinstance(action, EvmEvent):
-            if action.event_subtype == HistoryEventSubType.FEE and action.counterparty == 'gas':
-                continue
-            action_ids.add(action.tx_hash.hex())
-
-    for action in all_actions:
-        if not isinstance(action, HistoryBaseEntry):
-            # Must be LedgerAction then
-            if not action.link:
-                continue
-            if action.link in action_ids:
-                raise ValueError(
-                    (
-                        'Action with identifier "{}" is also present as an event '
-                        'This might be an unidentified duplicate. Please check your '
-                        'events and trades for duplicates.'
-                    ).format(action.link)
-                )
-
-    for trade in all_trades:
-        if trade.link in action_ids:
-            if not trade.link:
-                continue
-            raise ValueError(
-                (
-                    'Trade with identifier "{}" is also present as an event '
-                    'This might be an unidentified duplicate. Please check your '
-                    'events and trades for duplicates.'
-                ).format(trade.link)
-            )
-
-    def timestamp(act):
-        return act.get_timestamp()
+    # Merging the sorted streams keeps the order of a stable sort of all trades
+    # followed by all actions
+    all_events = list(heapq.merge(*trade_streams, *action_streams, key=_timestamp))
+
+    # Trades that share their link with an event might be unidentified
+    # duplicates, so the user has to check them before the report is run
+    duplicates = find_duplicate_links(all_events)
+    duplicates_file = folder / 'duplicates.yaml'
+    if duplicates:
+        with open(duplicates_file, 'w') as yaml_file:
+            dump_yaml({'duplicates': duplicates}, stream=yaml_file)
+        raise ValueError(
+            (
+                '{} trade link(s) are also present as events, e.g. "{}". '
+                'These might be unidentified duplicates. Please check your '
+                'events and trades for duplicates, all of them are listed in {}.'
+            ).format(len(duplicates), duplicates[0]['link'], duplicates_file)
+        )
+    if duplicates_file.exists():
+        duplicates_file.unlink()
 
-    all_events = sorted(all_trades + all_actions, key=timestamp)
     msg_aggregator = MessagesAggregator()
     accountant = buchfink_db.get_accountant(msg_aggregator=msg_aggregator)
     report_id = accountant.process_history(start_ts, end_ts, all_events)
@@ -178,9 +352,11 @@ def run_report(
 
     report_data['pnl_totals'] = get_total_pnl_from_overview(report_data['overview'])
 
-    with (folder / 'report.yaml').open('w') as report_file:
+    with report_file_path.open('w') as report_file:
         yaml.dump(report_data, stream=report_file)
 
+    inputs_file.write_text(inputs_hash + '\n')
+
     logger.info(
         'Report information has been written to: %s', buchfink_db.reports_directory / Path(name)
     )
@@ -198,9 +374,8 @@ def render_report(buchfink_db: BuchfinkDB, report_config: ReportConfig):
 
     # This is a little hacky and breaks our philosophy as we explicitely deal
     # with DB identifier here
-    with (folder / 'report.yaml').open('r') as report_file:
-        overview_data = yaml.load(report_file, Loader=yaml.SafeLoader)
-        report_id = overview_data['identifier']
+    overview_data = load_yaml(folder / 'report.yaml')
+    report_id = overview_data['identifier']
 
     @lru_cache
     def asset_symbol(asset: Union[Asset, None]) -> str:
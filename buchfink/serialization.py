@@ -1,8 +1,9 @@
 import re
 from datetime import datetime, timezone
 from decimal import Decimal, InvalidOperation
+from functools import lru_cache
 from operator import itemgetter
-from typing import Any, Dict, List, Tuple
+from typing import Any, Collection, Dict, List, Tuple, Type, Union
 
 import dateutil.parser
 from rotkehlchen.accounting.types import MissingPrice
@@ -52,6 +53,69 @@ def deserialize_timestamp(timestamp: str) -> Timestamp:
         return int(timestamp)
 
 
+def deserialize_raw_timestamp(timestamp: Any) -> Timestamp:
+    "Like deserialize_timestamp(), but also accepts values that the YAML parser converted already"
+    if isinstance(timestamp, datetime):
+        return Timestamp(int(timestamp.timestamp()))
+    if isinstance(timestamp, int):
+        return Timestamp(timestamp)
+    if isinstance(timestamp, str):
+        return deserialize_timestamp(timestamp)
+    raise ValueError(f'Invalid timestamp: {timestamp!r}')
+
+
+def raw_item_is_after(item: Dict[str, Any], end_ts: float) -> bool:
+    """
+    Whether a trade or action as read from YAML is after `end_ts`, without
+    deserializing it. The timestamp is read like deserialize_trade() or
+    deserialize_event() would read it.
+    """
+    try:
+        if 'buy' in item or 'sell' in item or 'pair' in item:
+            return _trade_timestamp(item) > end_ts
+        return deserialize_raw_timestamp(item['timestamp']) > end_ts
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+# Keys of trades and actions whose amount determines the asset(s) of the entry
+RAW_AMOUNT_KEYS = (
+    'buy',
+    'sell',
+    'for',
+    'income',
+    'airdrop',
+    'loss',
+    'gift',
+    'spend',
+    'spend_fee',
+    'trade_spend',
+    'trade_receive',
+)
+
+
+def raw_item_has_asset(item: Dict[str, Any], identifiers: Collection[str]) -> bool:
+    """
+    Whether a trade or action as read from YAML involves one of the assets
+    with `identifiers`, without deserializing it. Fees are not considered.
+    Items whose assets can not be read are kept, so that deserializing them
+    reports the problem as before.
+    """
+    amounts = [item[key] for key in RAW_AMOUNT_KEYS if key in item]
+    if not amounts:
+        return True
+
+    for amount in amounts:
+        elems = amount.split(' ') if isinstance(amount, str) else []
+        if len(elems) < 2:
+            return True
+        asset = _resolve_asset(elems[1])
+        if isinstance(asset, tuple) or asset.identifier in identifiers:
+            return True
+
+    return False
+
+
 def deserialize_timestamp_ms(timestamp: str) -> Timestamp:
     return deserialize_timestamp(timestamp) * 1000
 
@@ -59,14 +123,15 @@ def deserialize_timestamp_ms(timestamp: str) -> Timestamp:
 def deserialize_ledger_action(action_dict) -> HistoryEvent:
     # TODO: incorporate "link" into HistoryEvent
 
-    if 'link' in action_dict and action_dict['link'] in ('', None, 'None', 'null'):
-        del action_dict['link']
+    link = action_dict.get('link', '')
+    if link in (None, 'None', 'null'):
+        link = ''
 
     if 'income' in action_dict:
         amount, asset = deserialize_amount(action_dict['income'])
         return HistoryEvent(
             location=Location.EXTERNAL,
-            event_identifier=str(action_dict.get('link', '')),
+            event_identifier=str(link),
             sequence_index=0,
             timestamp=deserialize_timestamp_ms(action_dict['timestamp']),
             event_type=HistoryEventType.RECEIVE,
@@ -80,7 +145,7 @@ def deserialize_ledger_action(action_dict) -> HistoryEvent:
         amount, asset = deserialize_amount(action_dict['airdrop'])
         return HistoryEvent(
             location=Location.EXTERNAL,
-            event_identifier=str(action_dict.get('link', '')),
+            event_identifier=str(link),
             sequence_index=0,
             timestamp=deserialize_timestamp_ms(action_dict['timestamp']),
             event_type=HistoryEventType.RECEIVE,
@@ -94,7 +159,7 @@ def deserialize_ledger_action(action_dict) -> HistoryEvent:
         amount, asset = deserialize_amount(action_dict['loss'])
         return HistoryEvent(
             location=Location.EXTERNAL,
-            event_identifier=str(action_dict.get('link', '')),
+            event_identifier=str(link),
             sequence_index=0,
             timestamp=deserialize_timestamp_ms(action_dict['timestamp']),
             event_type=HistoryEventType.SPEND,
@@ -108,7 +173,7 @@ def deserialize_ledger_action(action_dict) -> HistoryEvent:
         amount, asset = deserialize_amount(action_dict['gift'])
         return HistoryEvent(
             location=Location.EXTERNAL,
-            event_identifier=str(action_dict.get('link', '')),
+            event_identifier=str(link),
             sequence_index=0,
             timestamp=deserialize_timestamp_ms(action_dict['timestamp']),
             event_type=HistoryEventType.RECEIVE,
@@ -122,7 +187,7 @@ def deserialize_ledger_action(action_dict) -> HistoryEvent:
         amount, asset = deserialize_amount(action_dict['spend'])
         return HistoryEvent(
             location=Location.EXTERNAL,
-            event_identifier=str(action_dict.get('link', '')),
+            event_identifier=str(link),
             sequence_index=0,
             timestamp=deserialize_timestamp_ms(action_dict['timestamp']),
             event_type=HistoryEventType.SPEND,
@@ -135,10 +200,17 @@ def deserialize_ledger_action(action_dict) -> HistoryEvent:
     raise ValueError(f'Unable to parse ledger action: {action_dict}')
 
 
+def _trade_timestamp(trade_dict) -> float:
+    # Unlike actions, a trailing Z or an offset is taken into account
+    if 'pair' in trade_dict:
+        return trade_dict['timestamp']
+    return dateutil.parser.isoparse(trade_dict['timestamp']).timestamp()
+
+
 def deserialize_trade(trade_dict) -> Trade:
     if 'pair' in trade_dict:
         return Trade(
-            trade_dict['timestamp'],
+            _trade_timestamp(trade_dict),
             Location.deserialize(trade_dict.get('location') or 'external'),
             trade_dict['pair'],
             deserialize_tradetype(trade_dict['trade_type']),
@@ -177,7 +249,7 @@ def deserialize_trade(trade_dict) -> Trade:
         raise ValueError('Invalid trade: ' + str(trade_dict)) from exc
 
     return Trade(
-        dateutil.parser.isoparse(trade_dict['timestamp']).timestamp(),
+        _trade_timestamp(trade_dict),
         Location.deserialize(trade_dict.get('location') or 'external'),
         base_asset,
         quote_asset,
@@ -276,10 +348,15 @@ def serialize_balances(balances: BalanceSheet, skip_nfts=True) -> dict:
     return ser_balances
 
 
-def deserialize_balance(balance: Dict[str, Any], buchfink_db) -> Tuple[Balance, Asset]:
+def deserialize_balance(
+    balance: Dict[str, Any], buchfink_db, with_usd_value: bool = True
+) -> Tuple[Balance, Asset]:
+    "Reads a balance, `usd_value` is only queried (and otherwise zero) if `with_usd_value` is set"
     amount = FVal(balance['amount'])
     asset = buchfink_db.get_asset_by_symbol(balance['asset'])
-    usd_value = amount * FVal(buchfink_db.inquirer.find_usd_price(asset))
+    if not with_usd_value:
+        return Balance(amount), asset
+    usd_value = amount * buchfink_db.get_usd_price(asset)
     return Balance(amount, usd_value), asset
 
 
@@ -652,6 +729,13 @@ def serialize_fval(val: FVal) -> str:
 
 ASSET_RE = re.compile(r'^([^\[]*)(\[(.*)\])?')
 
+# Number of distinct asset strings whose resolution is kept in memory
+ASSET_CACHE_SIZE = 4096
+
+# A failed asset resolution: the exception class and its argument. Exception
+# instances are not cached, raising the same one again extends its traceback.
+AssetError = Tuple[Type[Exception], str]
+
 
 def deserialize_identifier(val: str) -> str:
     match = ASSET_RE.match(val)
@@ -664,15 +748,20 @@ def deserialize_identifier(val: str) -> str:
     return symbol
 
 
-def deserialize_asset(val: str) -> Asset:
+@lru_cache(maxsize=ASSET_CACHE_SIZE)
+def _resolve_asset(val: str) -> Union[Asset, AssetError]:
+    "Resolves an asset string, failures are returned (and thereby cached) as AssetError"
     asset = None
     match = ASSET_RE.match(val)
     if match is None:
-        raise ValueError(f'Could not parse asset: {val}')
+        return (ValueError, f'Could not parse asset: {val}')
 
     symbol, _identifier_outer, identifier = match.groups()
     if identifier:
-        asset = symbol_to_asset_or_token(identifier)
+        try:
+            asset = symbol_to_asset_or_token(identifier)
+        except UnknownAsset:
+            return (UnknownAsset, identifier)
     elif symbol:
         try:
             asset = symbol_to_asset_or_token(symbol)
@@ -683,11 +772,24 @@ def deserialize_asset(val: str) -> Asset:
                 asset = None
 
     if asset is None:
-        raise ValueError(f'Symbol not found or ambigous: {val}')
+        return (ValueError, f'Symbol not found or ambigous: {val}')
 
     return asset
 
 
+def deserialize_asset(val: str) -> Asset:
+    result = _resolve_asset(val)
+    if isinstance(result, tuple):
+        exc_class, arg = result
+        raise exc_class(arg)
+    return result
+
+
+def clear_asset_cache() -> None:
+    "Needs to be called whenever assets in the global DB are added or edited"
+    _resolve_asset.cache_clear()
+
+
 def deserialize_evm_token(token_data: AssetConfig) -> EvmToken:
     token = EvmToken.initialize(
         address=deserialize_evm_address(token_data.address),
@@ -0,0 +1,171 @@
+"""
+Reading and writing of the YAML files that make up Buchfink's storage
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML was built without LibYAML
+    from yaml import SafeDumper, SafeLoader  # type: ignore
+
+# Number of parsed documents that are kept around
+CACHE_SIZE = 64
+
+# Total size of the files whose parsed documents are kept around. Parsed
+# documents take several times the memory of their file, larger files are not
+# cached at all.
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Bytes at the end of a file that are searched for a trailing top-level key
+TAIL_SIZE = 4096
+
+CacheKey = Tuple[str, int, int, int]
+
+_cache: 'OrderedDict[CacheKey, Any]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(path) -> CacheKey:
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _parse_yaml_file(path) -> Tuple[CacheKey, Any]:
+    key = _cache_key(path)
+    with open(path, 'r') as yaml_file:
+        return key, yaml.load(yaml_file, Loader=SafeLoader)
+
+
+def _store(key: CacheKey, contents: Any) -> None:
+    if key[3] > CACHE_MAX_BYTES:
+        return
+
+    with _cache_lock:
+        _cache[key] = contents
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE or sum(cached[3] for cached in _cache) > CACHE_MAX_BYTES:
+            _cache.popitem(last=False)
+
+
+def load_yaml(path) -> Any:
+    """
+    Parses a YAML file. Documents are cached by path, inode, mtime and size, so
+    reading an unchanged file again is free. The cache is bounded by the number
+    of documents and the total size of their files. The returned document is
+    shared between callers and must not be modified.
+    """
+    key = _cache_key(path)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    key, contents = _parse_yaml_file(path)
+    _store(key, contents)
+
+    return contents
+
+
+def load_yaml_trailing_key(path, key: str) -> Any:
+    """
+    Returns the value of the top-level `key` of a YAML file, or None.
+
+    Buchfink writes the metadata block last, so it is usually found by only
+    parsing the end of the file. Otherwise the whole file is parsed.
+    """
+    with open(path, 'rb') as yaml_file:
+        size = yaml_file.seek(0, os.SEEK_END)
+        yaml_file.seek(max(0, size - TAIL_SIZE))
+        tail = yaml_file.read()
+
+    # Top-level keys start at the beginning of a line
+    position = (b'\n' + tail if size <= TAIL_SIZE else tail).rfind(f'\n{key}:'.encode())
+    if position != -1:
+        try:
+            contents = yaml.load(tail[position:], Loader=SafeLoader)
+        except yaml.YAMLError:
+            contents = None
+        if isinstance(contents, dict) and key in contents:
+            return contents[key]
+
+    contents = load_yaml(path)
+    return contents.get(key) if isinstance(contents, dict) else None
+
+
+def find_last_item(path, key: str) -> Optional[Tuple[int, Any]]:
+    """
+    For a file that consists of a top-level list followed by the top-level
+    `key` (as written by Buchfink), returns the byte offset at which `key`
+    starts and the last item of the list.
+
+    Returns None if that layout is not found at the end of the file, e.g. if
+    the list is empty or its last item is longer than TAIL_SIZE.
+    """
+    with open(path, 'rb') as yaml_file:
+        size = yaml_file.seek(0, os.SEEK_END)
+        tail_start = max(0, size - TAIL_SIZE)
+        yaml_file.seek(tail_start)
+        tail = yaml_file.read()
+
+    # Top-level keys and list items start at the beginning of a line
+    if tail_start == 0:
+        tail = b'\n' + tail
+        tail_start = -1
+
+    key_position = tail.rfind(f'\n{key}:'.encode())
+    if key_position == -1:
+        return None
+
+    # Items of the top-level list are the only lines starting with "- "
+    item_position = tail.rfind(b'\n- ', 0, key_position)
+    if item_position == -1:
+        return None
+
+    try:
+        items = yaml.load(tail[item_position:key_position], Loader=SafeLoader)
+    except yaml.YAMLError:
+        return None
+    if not isinstance(items, list) or len(items) != 1:
+        return None
+
+    return tail_start + key_position + 1, items[0]
+
+
+def replace_from(path, offset: int, text: str) -> None:
+    """
+    Replaces everything from byte `offset` to the end of the file with `text`.
+    Unlike a rewrite, this does not touch the part of the file before `offset`.
+    """
+    with open(path, 'r+b') as yaml_file:
+        yaml_file.seek(offset)
+        yaml_file.truncate()
+        yaml_file.write(text.encode())
+
+    # The file keeps its inode and might keep its size, so make sure that no
+    # parsed version of it is used anymore
+    abspath = os.path.abspath(path)
+    with _cache_lock:
+        for key in [key for key in _cache if key[0] == abspath]:
+            del _cache[key]
+
+
+def dump_yaml(data: Any, stream=None):
+    """
+    Serializes `data` like all of Buchfink's YAML files: key order kept, long
+    strings wrapped at 80 columns. The width is explicit, as LibYAML and the
+    Python emitter read other values (e.g. -1) differently.
+    """
+    return yaml.dump(data, stream=stream, Dumper=SafeDumper, sort_keys=False, width=80)
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
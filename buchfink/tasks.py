@@ -1,13 +1,20 @@
+import heapq
+import itertools
 import logging
+import os
 import os.path
-from typing import List, Optional, Tuple
+import shutil
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import pydantic
-import yaml
 from rotkehlchen.utils.misc import ts_now
 from web3.exceptions import CannotHandleRequest
 
-from buchfink.serialization import deserialize_timestamp, serialize_timestamp
+from buchfink.serialization import (
+    deserialize_raw_timestamp,
+    deserialize_timestamp,
+    serialize_timestamp,
+)
 
 from .classification import classify_tx
 from .datatypes import (
@@ -18,9 +25,10 @@ from .datatypes import (
     Timestamp,
     Trade,
 )
-from .db import BuchfinkDB
+from .db import BuchfinkDB, _partition_start
 from .models import Account
-from .serialization import serialize_events, serialize_trades
+from .serialization import serialize_event, serialize_trades
+from .storage import dump_yaml, find_last_item, load_yaml, load_yaml_trailing_key, replace_from
 
 
 class ActionsMetadata(pydantic.BaseModel):
@@ -34,15 +42,208 @@ class TradesMetadata(pydantic.BaseModel):
 logger = logging.getLogger(__name__)
 
 
+def _write_yaml_document(
+    path, key: str, items: Iterable[dict], metadata: Optional[dict] = None
+) -> int:
+    """
+    Writes `{key: items, 'metadata': metadata}` to `path` one item at a time.
+
+    The output is the same as dumping the whole document with yaml.dump(), but
+    items can be consumed lazily. The file is replaced atomically once complete.
+    Returns the number of items written.
+    """
+    count = 0
+    tmp_path = str(path) + '.tmp'
+    try:
+        with open(tmp_path, 'w') as yaml_file:
+            for item in items:
+                if count == 0:
+                    yaml_file.write(key + ':\n')
+                dump_yaml([item], stream=yaml_file)
+                count += 1
+            if count == 0:
+                dump_yaml({key: []}, stream=yaml_file)
+            if metadata:
+                dump_yaml({'metadata': metadata}, stream=yaml_file)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return count
+
+
+def _append_to_yaml_document(path, items: List[dict], metadata: dict, strict: bool) -> bool:
+    """
+    Appends already sorted `items` to a file written by _write_yaml_document()
+    and replaces its metadata, without reading or rewriting the existing items.
+
+    This is only possible if all items go after the existing ones (with
+    `strict`, their timestamps must be later). Otherwise nothing is written and
+    False is returned, the caller has to rewrite the whole file then.
+    """
+    if not os.path.exists(path):
+        return False
+
+    layout = find_last_item(path, 'metadata')
+    if layout is None:
+        return False
+    offset, last_item = layout
+
+    if items:
+        try:
+            last_ts = deserialize_raw_timestamp(last_item.get('timestamp'))
+            first_ts = deserialize_raw_timestamp(items[0]['timestamp'])
+        except (AttributeError, ValueError):
+            return False
+        if first_ts < last_ts or (strict and first_ts == last_ts):
+            return False
+
+    replace_from(
+        path,
+        offset,
+        ''.join(dump_yaml([item]) for item in items) + dump_yaml({'metadata': metadata}),
+    )
+    return True
+
+
+def _item_partition(buchfink_db: BuchfinkDB, item: dict) -> Optional[str]:
+    return buchfink_db.get_ledger_partition(deserialize_raw_timestamp(item['timestamp']))
+
+
+def _write_ledger(
+    buchfink_db: BuchfinkDB,
+    account: Account,
+    key: str,
+    items: Iterable[dict],
+    metadata: Optional[dict] = None,
+) -> int:
+    """
+    Writes the sorted, serialized trades or actions (`key`) of an account to
+    `<key>/<name>.yaml`, or with the `ledger_partitions` setting to one file
+    per period in `<key>/<name>/` plus `metadata.yaml`. Files of the other
+    layout are removed. Returns the number of items written.
+    """
+    single_file = buchfink_db.data_directory / key / (account.name + '.yaml')
+    partitions_directory = buchfink_db.data_directory / key / account.name
+
+    if buchfink_db.config.settings.ledger_partitions is None:
+        count = _write_yaml_document(single_file, key, items, metadata)
+        if partitions_directory.exists():
+            shutil.rmtree(partitions_directory)
+        return count
+
+    partitions_directory.mkdir(exist_ok=True)
+    written = set()
+    count = 0
+    for partition, partition_items in itertools.groupby(
+        items, key=lambda item: _item_partition(buchfink_db, item)
+    ):
+        path = partitions_directory / f'{partition}.yaml'
+        count += _write_yaml_document(path, key, partition_items)
+        written.add(path)
+
+    for path in partitions_directory.glob('*.yaml'):
+        if path not in written:
+            path.unlink()
+    if metadata:
+        with open(partitions_directory / 'metadata.yaml', 'w') as metadata_file:
+            dump_yaml({'metadata': metadata}, stream=metadata_file)
+    if single_file.exists():
+        single_file.unlink()
+
+    return count
+
+
+def _remove_ledger(buchfink_db: BuchfinkDB, account: Account, key: str) -> None:
+    single_file = buchfink_db.data_directory / key / (account.name + '.yaml')
+    if single_file.exists():
+        single_file.unlink()
+    partitions_directory = buchfink_db.data_directory / key / account.name
+    if partitions_directory.exists():
+        shutil.rmtree(partitions_directory)
+
+
+def _append_to_partitions(
+    buchfink_db: BuchfinkDB, account: Account, key: str, items: List[dict], metadata: dict
+) -> None:
+    """
+    Merges sorted, serialized `items` into a partitioned ledger. Only the
+    partitions from the one of the first item on are read and rewritten.
+    Trades that are already present in these partitions are skipped.
+    """
+    if items:
+        first_start = _partition_start(str(_item_partition(buchfink_db, items[0])))
+        paths = [
+            path
+            for path in buchfink_db.get_ledger_files(key, account)
+            if _partition_start(path.stem) >= first_start
+        ]
+        existing = [item for path in paths for item in (load_yaml(path) or {}).get(key, [])]
+
+        if key == 'trades':
+            links = {(item.get('location'), item.get('link')) for item in existing}
+            items = [
+                item for item in items if (item.get('location'), item.get('link')) not in links
+            ]
+
+        def timestamp(item):
+            return deserialize_raw_timestamp(item['timestamp'])
+
+        for partition, partition_items in itertools.groupby(
+            heapq.merge(existing, items, key=timestamp),
+            key=lambda item: _item_partition(buchfink_db, item),
+        ):
+            path = buchfink_db.data_directory / key / account.name / f'{partition}.yaml'
+            _write_yaml_document(path, key, partition_items)
+
+    with open(buchfink_db.data_directory / key / account.name / 'metadata.yaml', 'w') as meta:
+        dump_yaml({'metadata': metadata}, stream=meta)
+
+
+def _append_to_ledger(
+    buchfink_db: BuchfinkDB, account: Account, key: str, items: List[dict], metadata: dict
+) -> bool:
+    """
+    Adds sorted, serialized `items` to the existing trades or actions (`key`)
+    of an account without rewriting all of them. Returns False if that is not
+    possible, the caller has to rewrite the whole ledger with _write_ledger().
+    """
+    single_file = buchfink_db.data_directory / key / (account.name + '.yaml')
+
+    if buchfink_db.config.settings.ledger_partitions is None:
+        # Duplicates share the timestamp, so trades that are strictly newer
+        # than the existing ones cannot be duplicates of them
+        return _append_to_yaml_document(single_file, items, metadata, strict=key == 'trades')
+
+    if single_file.exists() or not (buchfink_db.data_directory / key / account.name).is_dir():
+        # Not partitioned yet, a rewrite splits the file up
+        return False
+
+    if any(
+        buchfink_db.get_ledger_partition(_partition_start(path.stem)) != path.stem
+        for path in buchfink_db.get_ledger_files(key, account)
+    ):
+        # Partitioned by another period, a rewrite converts the files
+        return False
+
+    _append_to_partitions(buchfink_db, account, key, items, metadata)
+    return True
+
+
+def _read_ledger_metadata(buchfink_db: BuchfinkDB, account: Account, key: str):
+    for path in (
+        buchfink_db.data_directory / key / (account.name + '.yaml'),
+        buchfink_db.data_directory / key / account.name / 'metadata.yaml',
+    ):
+        if os.path.exists(path):
+            return load_yaml_trailing_key(path, 'metadata')
+    return None
+
+
 def _get_trades_metadata(buchfink_db: BuchfinkDB, account: Account) -> Optional[TradesMetadata]:
-    trades_path = buchfink_db.trades_directory / (account.name + '.yaml')
-    if os.path.exists(trades_path):
-        with open(trades_path, 'r') as yaml_file:
-            contents = yaml.safe_load(yaml_file)
-            if 'metadata' in contents and 'fetch_timestamp' in contents['metadata']:
-                return TradesMetadata(
-                    fetch_timestamp=deserialize_timestamp(contents['metadata']['fetch_timestamp'])
-                )
+    metadata = _read_ledger_metadata(buchfink_db, account, 'trades')
+    if metadata and 'fetch_timestamp' in metadata:
+        return TradesMetadata(fetch_timestamp=deserialize_timestamp(metadata['fetch_timestamp']))
     return None
 
 
@@ -52,34 +253,22 @@ def write_trades(
     trades: List[Trade],
     metadata: Optional[TradesMetadata] = None,
 ):
-    trades_path = buchfink_db.trades_directory / (account.name + '.yaml')
     if not trades and not metadata:
-        if os.path.exists(trades_path):
-            os.unlink(trades_path)
+        _remove_ledger(buchfink_db, account, 'trades')
         return
-    with open(trades_path, 'w') as yaml_file:
-        contents: dict = {'trades': serialize_trades(trades)}
-        if metadata:
-            contents['metadata'] = {
-                'fetch_timestamp': serialize_timestamp(metadata.fetch_timestamp)
-            }
-        yaml.dump(
-            contents,
-            stream=yaml_file,
-            sort_keys=False,
-            width=-1,
-        )
+    _write_ledger(
+        buchfink_db,
+        account,
+        'trades',
+        serialize_trades(trades),
+        {'fetch_timestamp': serialize_timestamp(metadata.fetch_timestamp)} if metadata else None,
+    )
 
 
 def _get_actions_metadata(buchfink_db: BuchfinkDB, account: Account) -> Optional[ActionsMetadata]:
-    actions_path = buchfink_db.actions_directory / (account.name + '.yaml')
-    if os.path.exists(actions_path):
-        with open(actions_path, 'r') as yaml_file:
-            contents = yaml.safe_load(yaml_file)
-            if 'metadata' in contents and 'fetch_timestamp' in contents['metadata']:
-                return ActionsMetadata(
-                    fetch_timestamp=deserialize_timestamp(contents['metadata']['fetch_timestamp'])
-                )
+    metadata = _read_ledger_metadata(buchfink_db, account, 'actions')
+    if metadata and 'fetch_timestamp' in metadata:
+        return ActionsMetadata(fetch_timestamp=deserialize_timestamp(metadata['fetch_timestamp']))
     return None
 
 
@@ -89,101 +278,125 @@ def write_actions(
     actions: List[HistoryBaseEntry],
     metadata: Optional[ActionsMetadata] = None,
 ):
-    actions_path = buchfink_db.actions_directory / (account.name + '.yaml')
     if not actions and not metadata:
-        if os.path.exists(actions_path):
-            os.unlink(actions_path)
+        _remove_ledger(buchfink_db, account, 'actions')
         return
 
-    with open(actions_path, 'w') as yaml_file:
-        contents: dict = {'actions': serialize_events(actions)}
-        if metadata:
-            contents['metadata'] = {
-                'fetch_timestamp': serialize_timestamp(metadata.fetch_timestamp)
-            }
-
-        yaml.dump(
-            contents,
-            stream=yaml_file,
-            sort_keys=False,
-            width=-1,
-        )
+    write_sorted_actions(buchfink_db, account, [sorted(actions, key=_action_sort_key)], metadata)
 
 
-def fetch_actions(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timestamp: bool = False):
-    name = account.name
-    actions = []
-    existing_actions = []
+def _action_sort_key(action: HistoryBaseEntry):
+    return action.get_timestamp()
 
-    now = ts_now()
-    start_ts = Timestamp(0)
-    metadata = _get_actions_metadata(buchfink_db, account)
 
-    if metadata and metadata.fetch_timestamp and not ignore_fetch_timestamp:
-        existing_actions = buchfink_db.get_actions_from_file(
-            buchfink_db.actions_directory / (name + '.yaml')
-        )
-        actions.extend(existing_actions)
-        start_ts = metadata.fetch_timestamp
+def write_sorted_actions(
+    buchfink_db: BuchfinkDB,
+    account: Account,
+    streams: List[Iterable[HistoryBaseEntry]],
+    metadata: Optional[ActionsMetadata] = None,
+) -> int:
+    """
+    Merges the already sorted action streams by timestamp and writes them out
+    while they are being consumed. Actions with the same timestamp keep the
+    order of the streams. Returns the number of actions written.
+    """
+    return _write_ledger(
+        buchfink_db,
+        account,
+        'actions',
+        (serialize_event(action) for action in heapq.merge(*streams, key=_action_sort_key)),
+        {'fetch_timestamp': serialize_timestamp(metadata.fetch_timestamp)} if metadata else None,
+    )
 
-    if account.account_type == 'ethereum':
-        logger.info('Analyzing ethereum transactions for %s', name)
 
-        txs_and_receipts = buchfink_db.get_eth_transactions(
-            account, with_receipts=True, start_ts=start_ts, end_ts=now
-        )
+def _iter_eth_actions(
+    buchfink_db: BuchfinkDB, account: Account, start_ts: Timestamp, end_ts: Timestamp
+) -> Iterator[HistoryBaseEntry]:
+    "Classifies and decodes the transactions of an account, one at a time"
 
-        for txn, receipt in txs_and_receipts:
-            if receipt is None:
-                raise ValueError('Could not get receipt')
+    cache = buchfink_db.classification_cache
+    ruleset = buchfink_db.classification_ruleset_hash
 
-            additional_actions = classify_tx(account, txn, receipt)
-            for act in additional_actions:
-                logger.debug('Found action: %s', act)
-            actions.extend(additional_actions)
+    for txn, receipt in buchfink_db.iter_eth_transactions(
+        account, with_receipts=True, start_ts=start_ts, end_ts=end_ts
+    ):
+        if receipt is None:
+            raise ValueError('Could not get receipt')
 
-        for tx_tuple in txs_and_receipts:
-            tx, receipt = tx_tuple
-            if receipt is None:
-                logger.warning('No receipt for %s', tx.tx_hash)
-                continue
+        # Transactions are only classified again if they are new or the rules changed
+        actions = cache.get(txn.tx_hash, account.address, ruleset)
+        if actions is None:
+            actions = classify_tx(account, txn, receipt, rules=buchfink_db.classification_rules)
+            cache.put(txn.tx_hash, account.address, ruleset, actions)
+        for act in actions:
+            logger.debug('Found action: %s', act)
 
-            # pylint: disable=protected-access
+        # pylint: disable=protected-access
+        with buchfink_db.chain_state_lock:
             buchfink_db._active_eth_address = account.address
             buchfink_db.evm_tx_decoder.base.tracked_accounts = buchfink_db.get_blockchain_accounts()
             try:
                 ev: Tuple[List[EvmEvent], bool] = (
                     buchfink_db.evm_tx_decoder._get_or_decode_transaction_events(
-                        tx, receipt, ignore_cache=False
+                        txn, receipt, ignore_cache=False
                     )
                 )
                 events, _ = ev
 
             except (IOError, CannotHandleRequest) as e:
-                logger.warning('Exception while decoding events for tx %s: %s', tx.tx_hash.hex(), e)
-                continue
-
-            for event in events:
-                if event.event_subtype == HistoryEventSubType.FEE and event.counterparty == 'gas':
-                    actions.append(event)
-                elif event.event_subtype == HistoryEventSubType.APPROVE:
-                    pass
-                elif event.event_type == HistoryEventType.TRADE:
-                    if event.asset.is_nft() or 'eip155:1/erc721:' in event.asset.identifier:
-                        # For now we will ignore NFT events
-                        continue
-                    actions.append(event)
-                else:
-                    logger.warning(
-                        'Ignoring event %s (summary=%s, event_identifier=0x%s, '
-                        'sequence_index=%s)',
-                        event.event_type,
-                        event,
-                        event.event_identifier,
-                        event.sequence_index,
-                    )
+                logger.warning(
+                    'Exception while decoding events for tx %s: %s', txn.tx_hash.hex(), e
+                )
+                events = []
+
+            finally:
+                buchfink_db._active_eth_address = None
+
+        for event in events:
+            if event.event_subtype == HistoryEventSubType.FEE and event.counterparty == 'gas':
+                actions.append(event)
+            elif event.event_subtype == HistoryEventSubType.APPROVE:
+                pass
+            elif event.event_type == HistoryEventType.TRADE:
+                if event.asset.is_nft() or 'eip155:1/erc721:' in event.asset.identifier:
+                    # For now we will ignore NFT events
+                    continue
+                actions.append(event)
+            else:
+                logger.warning(
+                    'Ignoring event %s (summary=%s, event_identifier=0x%s, sequence_index=%s)',
+                    event.event_type,
+                    event,
+                    event.event_identifier,
+                    event.sequence_index,
+                )
+
+        yield from sorted(actions, key=_action_sort_key)
 
-            buchfink_db._active_eth_address = None
+    # Results that were not committed (e.g. after an error) are simply recomputed
+    cache.commit()
+
+
+def fetch_actions(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timestamp: bool = False):
+    name = account.name
+    actions = []  # type: List[HistoryBaseEntry]
+    existing_actions = []  # type: List[HistoryBaseEntry]
+    eth_actions = iter([])  # type: Iterator[HistoryBaseEntry]
+
+    now = ts_now()
+    start_ts = Timestamp(0)
+    metadata = _get_actions_metadata(buchfink_db, account)
+    incremental = bool(metadata and metadata.fetch_timestamp and not ignore_fetch_timestamp)
+
+    if metadata and incremental:
+        start_ts = metadata.fetch_timestamp
+
+    if account.account_type == 'ethereum':
+        logger.info('Analyzing ethereum transactions for %s', name)
+
+        # Transactions are streamed in timestamp order and written out as
+        # soon as they are classified and decoded
+        eth_actions = _iter_eth_actions(buchfink_db, account, start_ts, now)
 
     elif account.account_type == 'exchange':
         logger.info('Fetching exhange actions for %s', name)
@@ -216,7 +429,26 @@ def fetch_actions(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timest
     else:
         logger.debug('No way to retrieve actions for %s, yet', name)
 
-    annotated_actions = []
+    if incremental:
+        new_actions = list(
+            heapq.merge(eth_actions, sorted(actions, key=_action_sort_key), key=_action_sort_key)
+        )
+        if _append_to_ledger(
+            buchfink_db,
+            account,
+            'actions',
+            [serialize_event(action) for action in new_actions],
+            {'fetch_timestamp': serialize_timestamp(now)},
+        ):
+            logger.info('Fetched %d new action(s) from %s', len(new_actions), name)
+            return
+
+        # The new actions do not go after the existing ones, rewrite the file
+        existing_actions = buchfink_db.get_local_ledger_actions_for_account(account)
+        eth_actions = iter(new_actions)
+        actions = []
+
+    annotated_actions = []  # type: List[HistoryBaseEntry]
     if not existing_actions:
         # We would need to respect timestamps here...
         annotations_path = buchfink_db.annotations_directory / (name + '.yaml')
@@ -226,18 +458,26 @@ def fetch_actions(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timest
                 annotations_path, include_trades=False
             )
 
-        actions.extend(annotated_actions)
+    count = write_sorted_actions(
+        buchfink_db,
+        account,
+        [
+            sorted(existing_actions, key=_action_sort_key),
+            eth_actions,
+            sorted(actions, key=_action_sort_key),
+            sorted(annotated_actions, key=_action_sort_key),
+        ],
+        metadata=ActionsMetadata(fetch_timestamp=now),
+    )
 
     logger.info(
         'Fetched %d action(s) (%d existing, %d annotated) from %s',
-        len(actions),
+        count,
         len(existing_actions),
         len(annotated_actions),
         name,
     )
 
-    write_actions(buchfink_db, account, actions, metadata=ActionsMetadata(fetch_timestamp=now))
-
 
 def fetch_trades(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timestamp: bool = False):
     trades: List[Trade] = []
@@ -248,12 +488,9 @@ def fetch_trades(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timesta
     start_ts = Timestamp(0)
     now = ts_now()
     metadata = _get_trades_metadata(buchfink_db, account)
+    incremental = bool(metadata and metadata.fetch_timestamp and not ignore_fetch_timestamp)
 
-    if metadata and metadata.fetch_timestamp and not ignore_fetch_timestamp:
-        existing_trades = buchfink_db.get_trades_from_file(
-            buchfink_db.trades_directory / (name + '.yaml')
-        )
-        trades.extend(existing_trades)
+    if metadata and incremental:
         start_ts = metadata.fetch_timestamp
 
     if account.account_type == 'exchange':
@@ -281,6 +518,22 @@ def fetch_trades(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timesta
 
             trades.extend(fetched_trades)
 
+    if incremental:
+        new_trades = _unique_trades(trades)
+        if _append_to_ledger(
+            buchfink_db,
+            account,
+            'trades',
+            serialize_trades(new_trades),
+            {'fetch_timestamp': serialize_timestamp(now)},
+        ):
+            logger.info('Fetched %d new trade(s) from %s', len(new_trades), name)
+            return
+
+        # The new trades do not go after the existing ones, rewrite the file
+        existing_trades = buchfink_db.get_local_trades_for_account(account)
+        trades = existing_trades + new_trades
+
     annotations_path = buchfink_db.annotations_directory / (name + '.yaml')
 
     if not existing_trades:
@@ -297,6 +550,12 @@ def fetch_trades(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timesta
         name,
     )
 
+    unique_trades = _unique_trades(trades)
+
+    write_trades(buchfink_db, account, unique_trades, metadata=TradesMetadata(fetch_timestamp=now))
+
+
+def _unique_trades(trades: List[Trade]) -> List[Trade]:
     existing = set()
     unique_trades = []
     for trade in trades:
@@ -305,5 +564,4 @@ def fetch_trades(buchfink_db: BuchfinkDB, account: Account, ignore_fetch_timesta
             unique_trades.append(trade)
         else:
             logger.warning('Removing duplicate trade: %s', trade)
-
-    write_trades(buchfink_db, account, unique_trades, metadata=TradesMetadata(fetch_timestamp=now))
+    return unique_trades
@@ -33,7 +33,11 @@ setup(
     url='https://github.com/coinyon/buchfink',
     packages=find_packages(),
     package_data={
-        "buchfink": ["data/init/buchfink.yaml", "data/init/.gitignore"],
+        "buchfink": [
+            "data/init/buchfink.yaml",
+            "data/init/.gitignore",
+            "data/classification_rules.yaml",
+        ],
     },
     install_requires=install_requirements,
     extras_require={
@@ -61,7 +65,7 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'buchfink = buchfink.cli:buchfink',
+            'buchfink = buchfink.__main__:main',
         ],
     },
 )
@@ -4,11 +4,16 @@ import logging
 import os
 import os.path
 import shutil
+import stat
+import threading
 
 import pytest
 from click.testing import CliRunner
 
+from buchfink import cli
 from buchfink.cli import buchfink
+from buchfink.daemon import BuchfinkDaemon
+from buchfink.datatypes import Asset, FVal
 
 logger = logging.getLogger(__name__)
 
@@ -159,3 +164,158 @@ def test_ethereum_gas_report_cli():
         # assert os.path.exists(os.path.join(d, 'reports/all/all_events.csv'))
         assert os.path.exists(os.path.join(d, 'reports/all/report.log'))
         assert os.path.exists(os.path.join(d, 'reports/all/errors.log'))
+
+
+def test_commands_are_forwarded_to_daemon():
+    runner = CliRunner()
+    with runner.isolated_filesystem() as d:
+        shutil.copytree(
+            os.path.join(os.path.dirname(__file__), 'scenarios', 'ethereum'), d, dirs_exist_ok=True
+        )
+        daemon = BuchfinkDaemon(os.path.join(d, 'buchfink.yaml'), buchfink)
+        thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        thread.start()
+        try:
+            assert os.path.exists(os.path.join(d, '.buchfink', 'daemon.sock'))
+            result = runner.invoke(buchfink, ['list', '-o', 'address'])
+            logger.debug('output of %s: %s', 'list', result.output)
+            assert result.exception is None
+            assert result.exit_code == 0
+            assert '0xD57479B8287666B44978255F1677E412d454d4f0\n' in result.output
+        finally:
+            daemon.shutdown()
+            daemon.server_close()
+
+        assert not os.path.exists(os.path.join(d, '.buchfink', 'daemon.sock'))
+
+
+def test_daemon_queries_prices_again_for_each_command(monkeypatch):
+    runner = CliRunner()
+    with runner.isolated_filesystem() as d:
+        shutil.copytree(
+            os.path.join(os.path.dirname(__file__), 'scenarios', 'ethereum'), d, dirs_exist_ok=True
+        )
+        daemon = BuchfinkDaemon(os.path.join(d, 'buchfink.yaml'), buchfink)
+        try:
+            buchfink_db = daemon.get_buchfink_db()
+            queried = []
+
+            class FakeInquirer:
+                def find_usd_price(self, asset):
+                    queried.append(asset)
+                    return FVal(len(queried))
+
+            monkeypatch.setattr(buchfink_db, 'inquirer', FakeInquirer(), raising=False)
+            assert buchfink_db.get_usd_price(Asset('ETH')) == FVal(1)
+            assert buchfink_db.get_usd_price(Asset('ETH')) == FVal(1)
+
+            result = daemon.run_command(['list'], d, color=False)
+            assert result['exit_code'] == 0
+            assert buchfink_db.get_usd_price(Asset('ETH')) == FVal(2)
+        finally:
+            daemon.server_close()
+
+
+def test_daemon_keeps_its_logging_and_socket_permissions():
+    runner = CliRunner()
+    with runner.isolated_filesystem() as d:
+        shutil.copytree(
+            os.path.join(os.path.dirname(__file__), 'scenarios', 'ethereum'), d, dirs_exist_ok=True
+        )
+        root_logger = logging.getLogger('')
+        log_level, log_handlers = root_logger.level, list(root_logger.handlers)
+        daemon = BuchfinkDaemon(os.path.join(d, 'buchfink.yaml'), buchfink)
+        try:
+            assert stat.S_IMODE(os.stat(daemon.socket_path).st_mode) & 0o077 == 0
+
+            result = daemon.run_command(['--log-level', 'DEBUG', 'list'], d, color=False)
+            assert result['exit_code'] == 0
+            assert root_logger.level == log_level
+            assert root_logger.handlers == log_handlers
+        finally:
+            daemon.server_close()
+
+
+def test_fetch_with_multiple_jobs():
+    runner = CliRunner()
+    with runner.isolated_filesystem() as d:
+        shutil.copytree(
+            os.path.join(os.path.dirname(__file__), 'scenarios', 'bullrun'), d, dirs_exist_ok=True
+        )
+        result = runner.invoke(buchfink, ['fetch', '--trades', '--jobs', '2', '--no-progress'])
+        logger.debug('output of %s: %s', 'fetch', result.output)
+        assert result.exception is None
+        assert result.exit_code == 0
+        assert 'errors occured' not in result.output
+        assert os.path.exists(os.path.join(d, 'trades/exchange1.yaml'))
+        assert os.path.exists(os.path.join(d, 'trades/exchange2.yaml'))
+
+
+def test_fetch_actions_and_balances_with_multiple_jobs():
+    runner = CliRunner()
+    with runner.isolated_filesystem() as d:
+        shutil.copytree(
+            os.path.join(os.path.dirname(__file__), 'scenarios', 'bullrun'), d, dirs_exist_ok=True
+        )
+        result = runner.invoke(
+            buchfink, ['fetch', '--actions', '--balances', '--jobs', '2', '--no-progress']
+        )
+        logger.debug('output of %s: %s', 'fetch', result.output)
+        assert result.exception is None
+        assert result.exit_code == 0
+        assert 'errors occured' not in result.output
+        for name in ('exchange1', 'exchange2'):
+            assert os.path.exists(os.path.join(d, 'actions', name + '.yaml'))
+            assert os.path.exists(os.path.join(d, 'balances', name + '.yaml'))
+
+
+def test_fetch_with_multiple_jobs_reports_unexpected_errors(monkeypatch):
+    fetch_trades = cli.fetch_trades
+
+    def failing_fetch_trades(buchfink_db, account, **kwargs):
+        if account.name == 'exchange1':
+            raise KeyError('unexpected')
+        return fetch_trades(buchfink_db, account, **kwargs)
+
+    monkeypatch.setattr(cli, 'fetch_trades', failing_fetch_trades)
+    runner = CliRunner()
+    with runner.isolated_filesystem() as d:
+        shutil.copytree(
+            os.path.join(os.path.dirname(__file__), 'scenarios', 'bullrun'), d, dirs_exist_ok=True
+        )
+        result = runner.invoke(buchfink, ['fetch', '--trades', '--jobs', '2', '--no-progress'])
+        logger.debug('output of %s: %s', 'fetch', result.output)
+        assert result.exception is None
+        assert 'errors occured' in result.output
+        assert 'unexpected' in result.output
+        assert os.path.exists(os.path.join(d, 'trades/exchange2.yaml'))
+
+
+def test_list_filters_accounts_by_type_and_tag():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('buchfink.yaml', 'w') as cfg:
+            cfg.write(
+                'accounts:\n'
+                '  - name: btc-cold\n'
+                '    bitcoin: 1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa\n'
+                '    tags: [cold]\n'
+                '  - name: bch-cold\n'
+                '    bitcoincash: qpm2qsznhks23z7629mms6s4cwef74vcwvy22gdx6a\n'
+                '    tags: [cold]\n'
+                '  - name: otc\n'
+                '    tags: [cold, manual]\n'
+                'settings:\n'
+                '  main_currency: USD\n'
+            )
+        result = runner.invoke(buchfink, ['list', '-o', 'name', '-t', 'bitcoin'])
+        assert result.exception is None
+        assert result.output == 'btc-cold\nbch-cold\n'
+
+        result = runner.invoke(buchfink, ['list', '-o', 'name', '--tag', 'cold', '-k', '/-cold$/'])
+        assert result.exception is None
+        assert result.output == 'btc-cold\nbch-cold\n'
+
+        result = runner.invoke(buchfink, ['list', '-o', 'name', '--tag', 'manual'])
+        assert result.exception is None
+        assert result.output == 'otc\n'
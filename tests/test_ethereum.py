@@ -1,9 +1,21 @@
 import os.path
 import shutil
+from types import SimpleNamespace
 
 import pytest
+from rotkehlchen.db.updates import RotkiDataUpdater
 from rotkehlchen.types import SupportedBlockchain
 
+from buchfink.classification import (
+    BUNDLED_RULES_PATH,
+    CLAIMED,
+    REWARDS_CLAIMED,
+    ClassificationCache,
+    classify_tx,
+    default_rules,
+    load_rules,
+    ruleset_hash,
+)
 from buchfink.datatypes import FVal
 from buchfink.db import BuchfinkDB
 
@@ -59,3 +71,128 @@ def test_if_ignored_assets_are_added(tmp_path):
 
     assert len(ignored_identifiers) >= 3
     assert 'eip155:1/erc20:0x426CA1eA2406c07d75Db9585F22781c096e3d0E0' in ignored_identifiers
+
+
+def test_chain_modules_are_built_lazily(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ethereum_gas'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    for attr in ('ethereum_manager', 'kusama_manager', 'evm_tx_decoder', 'historian', 'inquirer'):
+        assert attr not in vars(buchfink_db)
+
+    assert buchfink_db.ethereum_manager is buchfink_db.ethereum_manager
+    assert 'ethereum_inquirer' in vars(buchfink_db)
+    assert 'optimism_manager' not in vars(buchfink_db)
+
+
+def test_rpc_nodes_are_only_synced_on_config_change(tmp_path, monkeypatch):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'custom_token'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    config_file = os.path.join(tmp_path, 'buchfink/buchfink.yaml')
+    BuchfinkDB(config_file).__del__()  # pylint: disable=unnecessary-dunder-call
+
+    synced = []
+    monkeypatch.setattr(BuchfinkDB, 'sync_rpc_nodes', lambda self: synced.append(True))
+    buchfink_db = BuchfinkDB(config_file)
+    assert not synced
+    assert len(buchfink_db.get_rpc_nodes(blockchain=SupportedBlockchain.ETHEREUM)) >= 5
+    buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
+
+    with open(config_file, 'a') as cfg:
+        cfg.write('\n  rpc_nodes:\n    - name: own\n      endpoint: http://localhost:8545\n')
+    BuchfinkDB(config_file)
+    assert synced
+
+
+def test_rpc_nodes_are_synced_after_update_check(tmp_path, monkeypatch):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'custom_token'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    config_file = os.path.join(tmp_path, 'buchfink/buchfink.yaml')
+    buchfink_db = BuchfinkDB(config_file)
+    # The update check is due again
+    startup_state = buchfink_db.get_startup_state()
+    startup_state['last_update_check'] = 0
+    buchfink_db.write_startup_state(startup_state)
+    buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
+
+    synced = []
+    monkeypatch.setattr(BuchfinkDB, 'sync_rpc_nodes', lambda self: synced.append(True))
+    monkeypatch.setattr(RotkiDataUpdater, 'check_for_updates', lambda self: None)
+    BuchfinkDB(config_file)
+    assert synced
+
+
+def test_user_classification_rules(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ethereum_gas'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    config_file = os.path.join(tmp_path, 'buchfink/buchfink.yaml')
+    with open(config_file, 'a') as cfg:
+        cfg.write(
+            '\nclassification_rules:\n'
+            '  - topic: "0x4ec90e965519d92681267467f775ada5bd214aa92c0dc93d90a5e880ce9ed026"\n'
+            '    contracts: ["0x090D4613473dEE047c3f2706764f49E0821D256e"]\n'
+            '    asset: UNI\n'
+            '    event_subtype: reward\n'
+            '    data_offset: 64\n'
+        )
+    buchfink_db = BuchfinkDB(config_file)
+    key = (CLAIMED, '0x090d4613473dee047c3f2706764f49e0821d256e')
+
+    assert key in default_rules()
+    assert buchfink_db.classification_rules[key] is not default_rules()[key]
+    assert len(buchfink_db.classification_rules) == len(default_rules())
+    assert buchfink_db.classification_ruleset_hash != ruleset_hash(load_rules(BUNDLED_RULES_PATH))
+
+
+def test_classification_cache(tmp_path):
+    cache = ClassificationCache(tmp_path / 'classification.sqlite')
+    tx_hash = bytes.fromhex('ab' * 32)
+    address = '0xD57479B8287666B44978255F1677E412d454d4f0'
+
+    assert cache.get(tx_hash, address, 'rules-1') is None
+    cache.put(tx_hash, address, 'rules-1', [])
+    cache.commit()
+
+    cache = ClassificationCache(tmp_path / 'classification.sqlite')
+    assert cache.get(tx_hash, address.lower(), 'rules-1') == []
+    # Changed rules invalidate the cached result
+    assert cache.get(tx_hash, address, 'rules-2') is None
+
+
+def test_dydx_rewards_of_other_accounts_are_ignored(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ethereum_gas'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    account = buchfink_db.get_account('whale1')
+    txn = SimpleNamespace(
+        tx_hash=bytes.fromhex('ab' * 32), from_address=account.address, timestamp=1630000000
+    )
+
+    def rewards_claimed(claimant: str):
+        # RewardsClaimed(address user, uint256 amount), nothing is indexed
+        return SimpleNamespace(
+            logs=[
+                SimpleNamespace(
+                    address='0x01d3348601968aB85b4bb028979006eac235a588',
+                    topics=[bytes.fromhex(REWARDS_CLAIMED[2:])],
+                    data=int(claimant, 16).to_bytes(32, 'big') + (10**18).to_bytes(32, 'big'),
+                )
+            ]
+        )
+
+    other_address = buchfink_db.get_account('whale2').address
+    assert classify_tx(account, txn, rewards_claimed(other_address)) == []
+
+    events = classify_tx(account, txn, rewards_claimed(account.address))
+    assert len(events) == 1
+    assert events[0].balance.amount == FVal(1)
@@ -4,7 +4,7 @@ import shutil
 import pytest
 
 from buchfink.db import BuchfinkDB
-from buchfink.report import render_report, run_report
+from buchfink.report import AccountEvents, render_report, run_report
 from buchfink.tasks import fetch_actions, fetch_trades
 
 
@@ -145,3 +145,67 @@ def test_ethereum_gas_report_tax(tmp_path):
         assert '## Events' in report_contents
         assert '0.0203' in report_contents
         assert '-20.35' in report_contents
+
+
+def test_unchanged_report_is_reused(tmp_path, monkeypatch):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'bullrun'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+
+    for acc in buchfink_db.get_all_accounts():
+        fetch_actions(buchfink_db, acc)
+        fetch_trades(buchfink_db, acc)
+
+    report = list(buchfink_db.get_all_reports())[0]
+    accounts = buchfink_db.get_all_accounts()
+    result = run_report(buchfink_db, accounts, report)
+
+    def no_accountant(*args, **kwargs):
+        raise AssertionError('Report should not be computed again')
+
+    monkeypatch.setattr(buchfink_db, 'get_accountant', no_accountant)
+    reused = run_report(buchfink_db, accounts, report)
+    assert reused['overview'] == result['overview']
+    assert reused['pnl_totals'] == result['pnl_totals']
+
+    with pytest.raises(AssertionError):
+        run_report(buchfink_db, accounts, report, full=True)
+
+    # A report computed by another version of Buchfink or rotki is not reused
+    versions = dict(buchfink_db.get_versions(), rotkehlchen='0.0.0')
+    monkeypatch.setattr(buchfink_db, 'get_versions', lambda: versions)
+    with pytest.raises(AssertionError):
+        run_report(buchfink_db, accounts, report)
+
+
+def test_reports_share_loaded_events(tmp_path, monkeypatch):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'bullrun'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+
+    for acc in buchfink_db.get_all_accounts():
+        fetch_actions(buchfink_db, acc)
+        fetch_trades(buchfink_db, acc)
+
+    loaded = []
+    get_local_trades_for_account = buchfink_db.get_local_trades_for_account
+
+    def counting_get_local_trades_for_account(account, **kwargs):
+        loaded.append(account.name)
+        return get_local_trades_for_account(account, **kwargs)
+
+    monkeypatch.setattr(
+        buchfink_db, 'get_local_trades_for_account', counting_get_local_trades_for_account
+    )
+
+    accounts = buchfink_db.get_all_accounts()
+    account_events = AccountEvents(buchfink_db)
+    for report in buchfink_db.get_all_reports():
+        result = run_report(buchfink_db, accounts, report, account_events=account_events)
+        assert result['overview']['trade']['taxable'] == '15000'
+
+    assert sorted(loaded) == sorted(account.name for account in accounts)
@@ -6,6 +6,7 @@ import pytest
 from buchfink.db import BuchfinkDB
 from buchfink.models import Account
 from buchfink.report import run_report
+from buchfink.storage import load_yaml
 from buchfink.tasks import fetch_actions, fetch_trades
 
 
@@ -174,3 +175,11 @@ def test_ledger_actions_mixed_same_link(tmp_path):
     report_config = list(buchfink_db.get_all_reports())[1]
     with pytest.raises(ValueError, match=r'.*0x5.*'):
         run_report(buchfink_db, [account], report_config)
+
+    # All trades that share a link with an event are listed, not just the first
+    duplicates = load_yaml(
+        buchfink_db.reports_directory / str(report_config.name) / 'duplicates.yaml'
+    )['duplicates']
+    assert [duplicate['link'] for duplicate in duplicates] == ['0x55']
+    assert duplicates[0]['events'] == 2
+    assert [trade['link'] for trade in duplicates[0]['trades']] == ['0x55']
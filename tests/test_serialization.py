@@ -1,5 +1,6 @@
 import os.path
 import shutil
+import time
 from datetime import datetime, timezone
 from decimal import Decimal
 
@@ -21,22 +22,35 @@ from buchfink.datatypes import (
     Trade,
     TradeType,
 )
+from buchfink import serialization, storage
 from buchfink.db import BuchfinkDB
 from buchfink.models.config import AssetConfig
 from buchfink.serialization import (
+    clear_asset_cache,
     deserialize_amount,
     deserialize_asset,
     deserialize_balance,
     deserialize_event,
     deserialize_evm_token,
+    deserialize_ledger_action,
     deserialize_trade,
     serialize_asset,
     serialize_balance,
     serialize_balances,
     serialize_decimal,
     serialize_event,
+    serialize_events,
+    serialize_timestamp,
     serialize_trade,
 )
+from buchfink.storage import dump_yaml, load_yaml, load_yaml_trailing_key
+from buchfink.tasks import (
+    ActionsMetadata,
+    _append_to_ledger,
+    _append_to_yaml_document,
+    _get_actions_metadata,
+    write_actions,
+)
 
 
 @pytest.fixture
@@ -341,3 +355,392 @@ def test_serialize_and_deserialize_gift(buchfink_db):
     # roundtrip should be the same
     serialized_2 = serialize_event(event_2)
     assert serialized_2 == serialized
+
+
+def test_streamed_actions_match_full_dump(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ledger_actions'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    actions = []
+    for path in sorted(buchfink_db.annotations_directory.iterdir()):
+        actions.extend(buchfink_db.get_actions_from_file(path, include_trades=False))
+    assert actions
+
+    account = buchfink_db.get_all_accounts()[0]
+    metadata = ActionsMetadata(fetch_timestamp=1650000000)
+    write_actions(buchfink_db, account, actions, metadata=metadata)
+
+    expected = yaml.dump(
+        {
+            'actions': serialize_events(actions),
+            'metadata': {'fetch_timestamp': serialize_timestamp(metadata.fetch_timestamp)},
+        },
+        sort_keys=False,
+        width=-1,
+    )
+    with open(buchfink_db.actions_directory / (account.name + '.yaml'), 'r') as actions_file:
+        assert actions_file.read() == expected
+
+
+def test_appended_actions_match_full_dump(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ledger_actions'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    actions = []
+    for path in sorted(buchfink_db.annotations_directory.iterdir()):
+        actions.extend(buchfink_db.get_actions_from_file(path, include_trades=False))
+    actions.sort(key=lambda action: action.get_timestamp())
+    assert len(actions) > 1
+
+    account = buchfink_db.get_all_accounts()[0]
+    path = buchfink_db.actions_directory / (account.name + '.yaml')
+    write_actions(buchfink_db, account, actions[:-1], ActionsMetadata(fetch_timestamp=1))
+    before = path.read_bytes()
+
+    # Items that would have to go before the existing ones are not appended
+    assert not _append_to_yaml_document(
+        path, serialize_events(actions[:1]), {'fetch_timestamp': 'x'}, strict=True
+    )
+    assert path.read_bytes() == before
+
+    metadata = ActionsMetadata(fetch_timestamp=1650000000)
+    assert _append_to_yaml_document(
+        path,
+        serialize_events(actions[-1:]),
+        {'fetch_timestamp': serialize_timestamp(metadata.fetch_timestamp)},
+        strict=False,
+    )
+
+    expected = dump_yaml(
+        {
+            'actions': serialize_events(actions),
+            'metadata': {'fetch_timestamp': serialize_timestamp(metadata.fetch_timestamp)},
+        }
+    )
+    assert path.read_text() == expected
+
+
+def test_partitioned_actions(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ledger_actions'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    actions = []
+    for path in sorted(buchfink_db.annotations_directory.iterdir()):
+        actions.extend(buchfink_db.get_actions_from_file(path, include_trades=False))
+    years = sorted(
+        {
+            str(datetime.fromtimestamp(action.get_timestamp(), tz=timezone.utc).year)
+            for action in actions
+        }
+    )
+    assert len(years) > 1
+
+    account = buchfink_db.get_all_accounts()[0]
+    metadata = ActionsMetadata(fetch_timestamp=1650000000)
+    buchfink_db.config.settings.ledger_partitions = 'year'
+    write_actions(buchfink_db, account, actions, metadata=metadata)
+
+    partitions_directory = buchfink_db.actions_directory / account.name
+    assert not (buchfink_db.actions_directory / (account.name + '.yaml')).exists()
+    assert sorted(path.stem for path in partitions_directory.glob('*.yaml')) == years + ['metadata']
+    assert _get_actions_metadata(buchfink_db, account) == metadata
+
+    read_actions = buchfink_db.get_local_ledger_actions_for_account(account)
+    assert serialize_events(read_actions) == serialize_events(actions)
+
+    # Partitions that start after end_ts are not read
+    end_ts = datetime(int(years[0]), 12, 31, tzinfo=timezone.utc).timestamp()
+    assert buchfink_db.get_ledger_files('actions', account, end_ts) == [
+        partitions_directory / f'{years[0]}.yaml'
+    ]
+
+    # Without the setting, a single file is written again
+    buchfink_db.config.settings.ledger_partitions = None
+    write_actions(buchfink_db, account, actions, metadata=metadata)
+    assert (buchfink_db.actions_directory / (account.name + '.yaml')).exists()
+    assert not partitions_directory.exists()
+
+
+def test_mixed_partitions_are_ordered_by_start(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ledger_actions'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    account = buchfink_db.get_all_accounts()[0]
+    buchfink_db.config.settings.ledger_partitions = 'month'
+
+    partitions_directory = buchfink_db.actions_directory / account.name
+    partitions_directory.mkdir(parents=True)
+    for stem in ('2021-06', '2021', '2020-12', 'metadata'):
+        with open(partitions_directory / f'{stem}.yaml', 'w') as yaml_file:
+            dump_yaml({'actions': []}, stream=yaml_file)
+
+    assert buchfink_db.get_ledger_files('actions', account) == [
+        partitions_directory / '2020-12.yaml',
+        partitions_directory / '2021.yaml',
+        partitions_directory / '2021-06.yaml',
+    ]
+
+    # A yearly partition among monthly ones has to be converted by a rewrite
+    assert not _append_to_ledger(buchfink_db, account, 'actions', [], {})
+    (partitions_directory / '2021.yaml').unlink()
+    assert _append_to_ledger(buchfink_db, account, 'actions', [], {})
+
+
+def test_actions_after_end_are_skipped(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ledger_actions'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    for path in sorted(buchfink_db.annotations_directory.iterdir()):
+        actions = buchfink_db.get_actions_from_file(path, include_trades=False)
+        if len(actions) < 2:
+            continue
+        end_ts = sorted(action.get_timestamp() for action in actions)[0]
+        read_actions = buchfink_db.get_actions_from_file(path, include_trades=False, end_ts=end_ts)
+        assert serialize_events(read_actions) == serialize_events(
+            [action for action in actions if action.get_timestamp() <= end_ts]
+        )
+
+
+@pytest.fixture
+def new_york_time(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_trades_at_the_end_are_kept_in_other_timezones(new_york_time):
+    end_ts = datetime(2021, 12, 31, 23, 0, tzinfo=timezone.utc).timestamp()
+    trade = {'buy': '1 ETH', 'for': '1000 USD', 'timestamp': '2021-12-31T22:00:00Z'}
+
+    assert deserialize_trade(trade).timestamp <= end_ts
+    assert not serialization.raw_item_is_after(trade, end_ts)
+    assert serialization.raw_item_is_after(trade, end_ts - 7200)
+
+
+def test_actions_are_filtered_by_asset(tmp_path):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ledger_actions'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    buchfink_db = BuchfinkDB(os.path.join(tmp_path, 'buchfink/buchfink.yaml'))
+    for path in sorted(buchfink_db.annotations_directory.iterdir()):
+        actions = buchfink_db.get_actions_from_file(path, include_trades=False)
+        if not actions:
+            continue
+        asset = actions[0].asset
+        read_actions = buchfink_db.get_actions_from_file(path, include_trades=False, assets=[asset])
+        assert serialize_events(read_actions) == serialize_events(
+            [action for action in actions if action.asset == asset]
+        )
+
+
+@pytest.mark.usefixtures('buchfink_db')
+def test_yaml_storage_cache(tmp_path):
+    path = tmp_path / 'actions.yaml'
+    with open(path, 'w') as yaml_file:
+        dump_yaml(
+            {'actions': [{'income': '1 ETH', 'link': None, 'timestamp': '2021-01-01T00:00:00'}]},
+            stream=yaml_file,
+        )
+
+    contents = load_yaml(path)
+    assert load_yaml(path) is contents
+
+    # Deserializing must not modify the shared document
+    deserialize_ledger_action(contents['actions'][0])
+    assert contents['actions'][0] == {
+        'income': '1 ETH',
+        'link': None,
+        'timestamp': '2021-01-01T00:00:00',
+    }
+
+    with open(path, 'w') as yaml_file:
+        dump_yaml({'actions': []}, stream=yaml_file)
+    assert load_yaml(path) == {'actions': []}
+
+
+def test_long_strings_are_wrapped_like_the_python_emitter():
+    data = {
+        'actions': [
+            {
+                'income': '1 ETH',
+                'notes': 'A note that is a lot longer than the eighty columns of a line, '
+                'so that it is wrapped',
+                'link': '0x' + 'ab' * 32,
+            }
+        ]
+    }
+    dumped = dump_yaml(data)
+    assert dumped == yaml.dump(data, Dumper=yaml.SafeDumper, sort_keys=False)
+    # The note continues on the next line
+    assert len(dumped.splitlines()) == 5
+    assert yaml.safe_load(dumped) == data
+
+
+def test_yaml_cache_is_bounded_by_file_size(tmp_path, monkeypatch):
+    paths = []
+    for num in range(3):
+        path = tmp_path / f'account{num}.yaml'
+        with open(path, 'w') as yaml_file:
+            dump_yaml({'actions': [{'income': f'{num} ETH'}]}, stream=yaml_file)
+        paths.append(path)
+
+    # Room for two of the files only
+    monkeypatch.setattr(storage, 'CACHE_MAX_BYTES', 2 * os.path.getsize(paths[0]))
+
+    storage.clear_cache()
+    first = load_yaml(paths[0])
+    assert load_yaml(paths[0]) is first
+    load_yaml(paths[1])
+    load_yaml(paths[2])
+    assert load_yaml(paths[0]) is not first
+
+
+def test_metadata_is_read_from_the_end_of_the_file(tmp_path):
+    path = tmp_path / 'actions.yaml'
+    with open(path, 'w') as yaml_file:
+        dump_yaml(
+            {
+                'actions': [{'income': '1 ETH', 'link': str(i)} for i in range(10000)],
+                'metadata': {'fetch_timestamp': '2021-01-01T00:00:00'},
+            },
+            stream=yaml_file,
+        )
+    assert load_yaml_trailing_key(path, 'metadata') == {'fetch_timestamp': '2021-01-01T00:00:00'}
+
+    # Metadata at the start of the file is found by parsing everything
+    with open(path, 'w') as yaml_file:
+        dump_yaml(
+            {
+                'metadata': {'fetch_timestamp': '2022-01-01T00:00:00'},
+                'actions': [{'income': '1 ETH', 'link': str(i)} for i in range(10000)],
+            },
+            stream=yaml_file,
+        )
+    assert load_yaml_trailing_key(path, 'metadata') == {'fetch_timestamp': '2022-01-01T00:00:00'}
+
+
+def test_event_store_returns_the_same_entries(tmp_path, monkeypatch):
+    shutil.copytree(
+        os.path.join(os.path.dirname(__file__), 'scenarios', 'ledger_actions'),
+        os.path.join(tmp_path, 'buchfink'),
+    )
+    config_file = os.path.join(tmp_path, 'buchfink/buchfink.yaml')
+    os.makedirs(os.path.join(tmp_path, 'buchfink/actions'))
+    shutil.copy(
+        os.path.join(tmp_path, 'buchfink/annotations/acc_mixed_swap_trade.yaml'),
+        os.path.join(tmp_path, 'buchfink/actions/acc_mixed_swap_trade.yaml'),
+    )
+    with open(config_file, 'a') as cfg:
+        cfg.write('\n  event_store: true\n')
+
+    get_actions_from_file = BuchfinkDB.get_actions_from_file
+    buchfink_db = BuchfinkDB(config_file)
+    parsed = buchfink_db.get_local_ledger_actions_for_account('acc_mixed_swap_trade')
+    assert parsed
+
+    # The second read is served from the store without parsing the file
+    monkeypatch.setattr(BuchfinkDB, 'get_actions_from_file', None)
+    stored = buchfink_db.get_local_ledger_actions_for_account('acc_mixed_swap_trade')
+
+    def serialize(entry):
+        return serialize_trade(entry) if isinstance(entry, Trade) else serialize_event(entry)
+
+    assert [serialize(entry) for entry in stored] == [serialize(entry) for entry in parsed]
+
+    # After a rotki asset update, the file is parsed again
+    read_files = []
+
+    def counting_get_actions_from_file(self, path, **kwargs):
+        read_files.append(path)
+        return get_actions_from_file(self, path, **kwargs)
+
+    monkeypatch.setattr(BuchfinkDB, 'get_actions_from_file', counting_get_actions_from_file)
+    versions = dict(buchfink_db.get_versions(), assets='-1')
+    monkeypatch.setattr(BuchfinkDB, 'get_versions', lambda self: versions)
+    buchfink_db.__del__()  # pylint: disable=unnecessary-dunder-call
+    BuchfinkDB(config_file).get_local_ledger_actions_for_account('acc_mixed_swap_trade')
+    assert read_files
+
+
+@pytest.mark.usefixtures('buchfink_db')
+def test_asset_resolution_is_cached(monkeypatch):
+    calls = []
+    symbol_to_asset_or_token = serialization.symbol_to_asset_or_token
+
+    def counting_symbol_to_asset_or_token(*args, **kwargs):
+        calls.append(args)
+        return symbol_to_asset_or_token(*args, **kwargs)
+
+    monkeypatch.setattr(
+        serialization, 'symbol_to_asset_or_token', counting_symbol_to_asset_or_token
+    )
+    clear_asset_cache()
+
+    assert deserialize_asset('ETH') == deserialize_asset('ETH')
+    assert len(calls) == 1
+
+    # Unknown assets are cached as well, but a fresh exception is raised each time
+    raised = []
+    for _ in range(2):
+        with pytest.raises(ValueError) as exc_info:
+            deserialize_asset('SURELYNOTANASSET')
+        raised.append(exc_info.value)
+    assert len(calls) == 3
+    assert raised[0] is not raised[1]
+    assert str(raised[0]) == str(raised[1])
+
+    clear_asset_cache()
+    deserialize_asset('ETH')
+    assert len(calls) == 4
+
+
+def test_balances_are_valued_from_price_snapshot(buchfink_db, monkeypatch):
+    queried = []
+
+    class FakeInquirer:
+        def find_usd_price(self, asset):
+            queried.append(asset)
+            return FVal('2000')
+
+    monkeypatch.setattr(buchfink_db, 'inquirer', FakeInquirer(), raising=False)
+
+    bal = serialize_balance(Balance(FVal('0.5')), Asset('ETH'))
+    for _ in range(2):
+        balance, _ = deserialize_balance(bal, buchfink_db)
+        assert balance.usd_value == FVal('1000')
+    assert queried == [Asset('ETH')]
+
+    buchfink_db.write_price_snapshot()
+
+    other_db = BuchfinkDB(buchfink_db.config_file)
+    monkeypatch.setattr(other_db, 'inquirer', FakeInquirer(), raising=False)
+    assert other_db.load_price_snapshot()
+    assert other_db.get_usd_price(Asset('ETH')) == FVal('2000')
+    assert queried == [Asset('ETH')]
+
+
+def test_balances_can_be_read_without_valuation(buchfink_db, monkeypatch):
+    class FailingInquirer:
+        def find_usd_price(self, asset):
+            raise AssertionError('No price should be queried')
+
+    monkeypatch.setattr(buchfink_db, 'inquirer', FailingInquirer(), raising=False)
+
+    bal = serialize_balance(Balance(FVal('0.5')), Asset('ETH'))
+    balance, asset = deserialize_balance(bal, buchfink_db, with_usd_value=False)
+    assert balance.amount == FVal('0.5')
+    assert balance.usd_value == FVal(0)
+    assert asset == Asset('ETH')